@@ -0,0 +1,212 @@
+"""
+Interpolation kernels for sampling traces at arbitrary times.
+
+sample_trace in step-by-step-nmo.ipynb fits a CubicSpline to the 4 samples
+around each time. Here an interpolated amplitude is a weighted sum of the
+*npoints* samples around the time, with weights that only depend on the
+fractional position of the time between two samples. The kernels tabulate
+these weights once and look them up for whole arrays of times, trading
+accuracy against speed through the number of points and the table size.
+"""
+import numpy as np
+
+
+class Kernel(object):
+    """
+    An interpolation kernel with tabulated weights.
+
+    The amplitude at time t is the sum over k of
+    ``weights[k]*trace[first + k]``, with ``first = floor(t/dt) + origin``
+    and the weights evaluated at the fractional position
+    ``s = t/dt - floor(t/dt)``.
+
+    Parameters
+    ----------
+
+    name : str
+        A short description.
+    npoints : int
+        The number of samples used for each time.
+    origin : int
+        The position of the first sample relative to the one before t.
+    function : callable
+        ``function(s)`` gives the weights, shape ``(npoints,) + s.shape``,
+        for fractional positions s between 0 and 1.
+    ntable : int or None
+        The number of intervals of the table of weights over fractional
+        positions. The weights of each time are interpolated linearly from
+        the table. With None, they are calculated for each time instead.
+
+    """
+
+    def __init__(self, name, npoints, origin, function, ntable=1024):
+        self.name = name
+        self.npoints = npoints
+        self.origin = origin
+        self.function = function
+        self.ntable = ntable
+        if ntable is not None:
+            self.table = function(np.arange(ntable + 1)/ntable)
+
+    def __repr__(self):
+        return "Kernel({}, npoints={}, ntable={})".format(
+            self.name, self.npoints, self.ntable)
+
+    def fractional_weights(self, s):
+        """
+        The weights, shape ``(npoints,) + s.shape``, for fractional
+        positions s between 0 and 1.
+        """
+        if self.ntable is None:
+            return self.function(s)
+        position = np.asarray(s)*self.ntable
+        index = np.clip(np.floor(position).astype(np.intp), 0,
+                        self.ntable - 1)
+        fraction = position - index
+        return (self.table[:, index]*(1 - fraction) +
+                self.table[:, index + 1]*fraction)
+
+    def weights(self, times, dt, nsamples, edge='mute'):
+        """
+        Interpolation weights for an array of times.
+
+        Parameters
+        ----------
+
+        times : array
+            The times at which to sample the traces.
+        dt : float
+            The sampling interval.
+        nsamples : int
+            The number of samples in the traces.
+        edge : str
+            What to do with times that need samples beyond the ends of the
+            trace. ``'mute'`` gives them zero amplitude, as the NMO
+            correction does where sample_trace returns None. ``'zero'``
+            uses the samples that exist, as if the trace were padded with
+            zeros.
+
+        Returns
+        -------
+
+        first : int array
+            The sample number of the first sample used for each time, such
+            that ``first + npoints <= nsamples``. Same shape as *times*.
+        weights : array
+            The weights of the samples, shape ``(npoints,) + times.shape``.
+
+        """
+        times = np.asarray(times, dtype=float)
+        before = np.floor(times/dt)
+        finite = np.isfinite(before)
+        before = np.where(finite, before, 0)
+        weights = self.fractional_weights(
+            np.where(finite, times/dt - before, 0))
+        first = before.astype(np.intp) + self.origin
+        valid = finite & (first >= 0) & (first + self.npoints <= nsamples)
+        if edge == 'mute':
+            weights = np.where(valid, weights, 0)
+            first = np.where(valid, first, 0)
+        elif edge == 'zero':
+            # Move the window inside the trace and the weights with it,
+            # dropping those of samples beyond the ends
+            inside = np.clip(first, 0, nsamples - self.npoints)
+            k = np.arange(self.npoints).reshape(
+                (-1,) + (1,)*times.ndim) + (inside - first)
+            shifted = (k >= 0) & (k < self.npoints)
+            weights = np.where(
+                shifted & finite,
+                np.take_along_axis(weights, np.clip(k, 0, self.npoints - 1),
+                                   axis=0),
+                0)
+            first = inside
+        else:
+            raise ValueError("edge must be 'mute' or 'zero', not {}".format(
+                edge))
+        return first, weights
+
+
+def _linear(s):
+    return np.array([1 - s, s])
+
+
+def _lagrange(s):
+    return np.array([
+        -s*(s - 1)*(s - 2)/6,
+        (s + 1)*(s - 1)*(s - 2)/2,
+        -(s + 1)*s*(s - 2)/2,
+        (s + 1)*s*(s - 1)/6,
+    ])
+
+
+class _CubicConvolution(object):
+    """
+    Keys' cubic convolution kernel
+    """
+
+    def __init__(self, a):
+        self.a = a
+
+    def __call__(self, s):
+        a = self.a
+        near = np.array([s, 1 - s])
+        far = np.array([1 + s, 2 - s])
+        near = (a + 2)*near**3 - (a + 3)*near**2 + 1
+        far = a*far**3 - 5*a*far**2 + 8*a*far - 4*a
+        return np.array([far[0], near[0], near[1], far[1]])
+
+
+class _WindowedSinc(object):
+    """
+    Sinc kernel tapered by a Kaiser window, normalized to unit sum
+    """
+
+    def __init__(self, half_length, beta):
+        self.half_length = half_length
+        self.beta = beta
+
+    def __call__(self, s):
+        half = self.half_length
+        positions = np.arange(1 - half, half + 1).reshape(
+            (-1,) + (1,)*np.ndim(s))
+        distance = s - positions
+        taper = np.i0(
+            self.beta*np.sqrt(np.clip(1 - (distance/half)**2, 0, None)))
+        weights = np.sinc(distance)*taper/np.i0(self.beta)
+        return weights/weights.sum(axis=0)
+
+
+def linear_kernel(ntable=1024):
+    """
+    Linear interpolation between the 2 samples around each time.
+    """
+    return Kernel('linear', 2, 0, _linear, ntable)
+
+
+def cubic_kernel(ntable=1024):
+    """
+    The cubic through the 4 samples around each time, which is what the
+    CubicSpline of sample_trace gives. With ``ntable=None`` the result is
+    the same as sample_trace.
+    """
+    return Kernel('cubic', 4, -1, _lagrange, ntable)
+
+
+def cubic_convolution_kernel(a=-0.5, ntable=1024):
+    """
+    Keys' cubic convolution on the 4 samples around each time.
+    """
+    return Kernel('cubic convolution a={}'.format(a), 4, -1,
+                  _CubicConvolution(a), ntable)
+
+
+def sinc_kernel(half_length=4, beta=None, ntable=1024):
+    """
+    Kaiser windowed sinc on the 2*half_length samples around each time. The
+    shape of the window, *beta*, defaults to 1.5*half_length.
+    """
+    if beta is None:
+        beta = 1.5*half_length
+    return Kernel('sinc half_length={}'.format(half_length),
+                  2*half_length, 1 - half_length,
+                  _WindowedSinc(half_length, beta), ntable)
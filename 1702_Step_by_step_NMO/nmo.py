@@ -0,0 +1,440 @@
+"""
+NMO correction of CMP gathers.
+
+The functions reflection_time, sample_trace and nmo_correction are the ones
+developed step by step in step-by-step-nmo.ipynb. The rest apply the same
+correction to whole arrays at once: all travel-times are calculated
+together, the interpolation weights are calculated once per geometry and
+applied to stacks of gathers (e.g. a 3D volume of CMPs).
+"""
+import multiprocessing
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+
+def nmo_correction(cmp, dt, offsets, velocities):
+    """
+    Performs NMO correction on the given CMP.
+
+    The units must be consistent. E.g., if dt is seconds and
+    offsets is meters, velocities must be m/s.
+
+    Parameters
+    ----------
+
+    cmp : 2D array
+        The CMP gather that we want to correct.
+    dt : float
+        The sampling interval.
+    offsets : 1D array
+        An array with the offset of each trace in the CMP.
+    velocities : 1D array
+        An array with the NMO velocity for each time. Should
+        have the same number of elements as the CMP has samples.
+
+    Returns
+    -------
+
+    nmo : 2D array
+        The NMO corrected gather.
+
+    """
+    nmo = np.zeros_like(cmp)
+    nsamples = cmp.shape[0]
+    times = np.arange(0, nsamples*dt, dt)
+    for i, t0 in enumerate(times):
+        for j, x in enumerate(offsets):
+            t = reflection_time(t0, x, velocities[i])
+            amplitude = sample_trace(cmp[:, j], t, dt)
+            # If the time t is outside of the CMP time range,
+            # amplitude will be None.
+            if amplitude is not None:
+                nmo[i, j] = amplitude
+    return nmo
+
+
+def reflection_time(t0, x, vnmo):
+    """
+    Calculate the travel-time of a reflected wave.
+
+    Doesn't consider refractions or changes in velocity.
+
+    The units must be consistent. E.g., if t0 is seconds and
+    x is meters, vnmo must be m/s.
+
+    Parameters
+    ----------
+
+    t0 : float
+        The 0-offset (normal incidence) travel-time.
+    x : float
+        The offset of the receiver.
+    vnmo : float
+        The NMO velocity.
+
+    Returns
+    -------
+
+    t : float
+        The reflection travel-time.
+
+    """
+    t = np.sqrt(t0**2 + x**2/vnmo**2)
+    return t
+
+
+def sample_trace(trace, time, dt):
+    """
+    Sample an amplitude at a given time using interpolation.
+
+    Parameters
+    ----------
+
+    trace : 1D array
+        Array containing the amplitudes of a single trace.
+    time : float
+        The time at which I want to sample the amplitude.
+    dt : float
+        The sampling interval
+
+    Returns
+    -------
+
+    amplitude : float or None
+        The interpolated amplitude. Will be None if *time*
+        is beyond the end of the trace or if there are less
+        than 2 points between *time* and the end.
+
+    """
+    # The floor function will give us the integer
+    # right behind a given float.
+    # Use it to get the sample number that is right
+    # before our desired time.
+    before = int(np.floor(time/dt))
+    N = trace.size
+    # Use the 4 samples around time to interpolate
+    samples = np.arange(before - 1, before + 3)
+    if any(samples < 0) or any(samples >= N):
+        amplitude = None
+    else:
+        times = dt*samples
+        amps = trace[samples]
+        interpolator = CubicSpline(times, amps)
+        amplitude = interpolator(time)
+    return amplitude
+
+
+def cubic_weights(times, dt, nsamples):
+    """
+    Weights of the interpolation done by sample_trace for many times.
+
+    A CubicSpline through 4 points is the cubic polynomial through them,
+    so the amplitude at each time is a weighted sum of the 4 samples
+    around it with Lagrange weights.
+
+    Parameters
+    ----------
+
+    times : array
+        The times at which to sample the traces.
+    dt : float
+        The sampling interval.
+    nsamples : int
+        The number of samples in the traces.
+
+    Returns
+    -------
+
+    first : int array
+        The sample number of the first of the 4 samples used for each
+        time. Same shape as *times*.
+    weights : array
+        The weights of the 4 samples, with shape ``(4,) + times.shape``.
+        They are zero where sample_trace would return None.
+
+    """
+    before = np.floor(times/dt)
+    valid = (before >= 1) & (before + 2 < nsamples)
+    before = np.where(valid, before, 1)
+    # Fractional position of the time between sample before and before + 1
+    s = times/dt - before
+    weights = np.array([
+        -s*(s - 1)*(s - 2)/6,
+        (s + 1)*(s - 1)*(s - 2)/2,
+        -(s + 1)*s*(s - 2)/2,
+        (s + 1)*s*(s - 1)/6,
+    ])
+    weights *= valid
+    first = before.astype(int) - 1
+    return first, weights
+
+
+def nmo_weights(nsamples, dt, offsets, velocities, kernel=None):
+    """
+    Interpolation weights of the NMO correction of one or many gathers.
+
+    Parameters
+    ----------
+
+    nsamples : int
+        The number of samples in the gathers.
+    dt : float
+        The sampling interval.
+    offsets : array
+        The offset of each trace, shape ``(..., noffsets)``.
+    velocities : array
+        The NMO velocity for each time, shape ``(..., nsamples)``.
+    kernel : interpolation.Kernel
+        The interpolation kernel. By default, the weights are those of
+        sample_trace (cubic_weights).
+
+    Returns
+    -------
+
+    first, weights : arrays
+        The weights for the reflection times, with shapes
+        ``(..., nsamples, noffsets)`` and
+        ``(npoints, ..., nsamples, noffsets)``. The leading dimensions are
+        those of *offsets* and *velocities* broadcast together.
+
+    """
+    t0 = np.arange(nsamples)*dt
+    offsets = np.asarray(offsets)
+    velocities = np.asarray(velocities)
+    times = reflection_time(
+        t0[:, np.newaxis], offsets[..., np.newaxis, :],
+        velocities[..., np.newaxis]
+    )
+    if kernel is None:
+        return cubic_weights(times, dt, nsamples)
+    return kernel.weights(times, dt, nsamples)
+
+
+def stretch_mute(nsamples, dt, offsets, velocities, max_stretch=0.5):
+    """
+    Which samples of the NMO corrected gathers to keep after a stretch mute.
+
+    The NMO correction stretches the wavelet at time t0 by ``(t - t0)/t0``,
+    with t the reflection time. Samples stretched by more than
+    *max_stretch* (and those at t0 = 0) are muted.
+
+    Parameters
+    ----------
+
+    nsamples : int
+        The number of samples in the gathers.
+    dt : float
+        The sampling interval.
+    offsets : array
+        The offset of each trace, shape ``(..., noffsets)``.
+    velocities : array
+        The NMO velocity for each time, shape ``(..., nsamples)``.
+    max_stretch : float
+        The largest stretch kept.
+
+    Returns
+    -------
+
+    keep : bool array
+        Shape ``(..., nsamples, noffsets)``, False for muted samples.
+
+    """
+    t0 = np.arange(nsamples)*dt
+    times = reflection_time(
+        t0[:, np.newaxis], np.asarray(offsets)[..., np.newaxis, :],
+        np.asarray(velocities)[..., np.newaxis]
+    )
+    t0 = t0[:, np.newaxis]
+    return (t0 > 0) & (times - t0 <= max_stretch*t0)
+
+
+def interpolate_gathers(cmps, first, weights):
+    """
+    Apply interpolation weights to a stack of gathers.
+
+    The output sample i of trace j is the weighted sum of the input samples
+    ``first[i, j]`` to ``first[i, j] + npoints - 1`` of the same trace.
+
+    Parameters
+    ----------
+
+    cmps : array
+        The gathers, with shape ``(..., nsamples, noffsets)``.
+    first, weights : arrays
+        As returned by cubic_weights, nmo_weights or Kernel.weights. Either
+        the same for all gathers, with shapes ``(nout, noffsets)`` and
+        ``(npoints, nout, noffsets)``, or with leading dimensions that
+        broadcast against those of *cmps* (e.g. one set per gather).
+
+    Returns
+    -------
+
+    out : array
+        The interpolated gathers, shape ``(..., nout, noffsets)`` with the
+        leading dimensions of *cmps* and *first* broadcast together.
+
+    """
+    cmps = np.asarray(cmps)
+    noffsets = cmps.shape[-1]
+    dtype = np.result_type(cmps.dtype, np.float32)
+    shape = np.broadcast(cmps[..., :1, :], first).shape
+    # Index the samples of all traces of a gather as a single axis
+    flat = cmps.reshape(cmps.shape[:-2] + (-1,))
+    columns = np.arange(noffsets)
+    out = np.zeros(shape, dtype=dtype)
+    for k in range(weights.shape[0]):
+        index = (first + k)*noffsets + columns
+        if index.ndim == 2:
+            samples = flat[..., index]
+        else:
+            index = index.reshape(index.shape[:-2] + (-1,))
+            index = index.reshape(
+                (1,)*(flat.ndim - index.ndim) + index.shape)
+            samples = np.take_along_axis(
+                flat.reshape((1,)*(index.ndim - flat.ndim) + flat.shape),
+                index, axis=-1
+            ).reshape(shape)
+        out += weights[k]*samples
+    return out
+
+
+def sample_traces(traces, times, dt, kernel=None):
+    """
+    Sample the traces of a gather at many times using interpolation.
+
+    For time shifts, resampling, etc. Times that need samples beyond the
+    ends of the traces get zero amplitude.
+
+    Parameters
+    ----------
+
+    traces : array
+        The traces, shape ``(..., nsamples, ntraces)`` like a gather.
+    times : array
+        The times at which to sample each trace, shape
+        ``(nout, ntraces)``, or ``(nout, 1)`` for the same times in all.
+    dt : float
+        The sampling interval.
+    kernel : interpolation.Kernel
+        The interpolation kernel. By default, the one of sample_trace.
+
+    Returns
+    -------
+
+    amplitudes : array
+        Shape ``(..., nout, ntraces)``.
+
+    """
+    traces = np.asarray(traces)
+    nsamples, ntraces = traces.shape[-2:]
+    times = np.broadcast_to(times, (np.shape(times)[0], ntraces))
+    if kernel is None:
+        first, weights = cubic_weights(times, dt, nsamples)
+    else:
+        first, weights = kernel.weights(times, dt, nsamples)
+    return interpolate_gathers(traces, first, weights)
+
+
+def nmo_correction_gathers(cmps, dt, offsets, velocities, n_processes=1,
+                           chunk_size=100, kernel=None):
+    """
+    Performs NMO correction on a stack of CMP gathers.
+
+    With the default kernel, gives the same result as nmo_correction
+    applied to each gather, but all at once. When all gathers share the
+    offsets and velocities, the interpolation weights are calculated only
+    once.
+
+    Parameters
+    ----------
+
+    cmps : array
+        The CMP gathers, shape ``(..., nsamples, noffsets)``. A single
+        gather is a 2D array, a line of gathers 3D, a volume 4D, etc.
+    dt : float
+        The sampling interval.
+    offsets : array
+        The offset of each trace, shape ``(noffsets,)`` for all the
+        gathers or ``(..., noffsets)`` for each gather.
+    velocities : array
+        The NMO velocity for each time, shape ``(nsamples,)`` for all the
+        gathers or ``(..., nsamples)`` for each gather.
+    n_processes : int
+        Split the gathers over this many processes.
+    chunk_size : int
+        The number of gathers handled at once (and sent to each process).
+    kernel : interpolation.Kernel
+        The interpolation kernel. By default, the one of sample_trace.
+
+    Returns
+    -------
+
+    nmo : array
+        The NMO corrected gathers, same shape as *cmps*.
+
+    """
+    cmps = np.asarray(cmps)
+    nsamples, noffsets = cmps.shape[-2:]
+    batch = cmps.shape[:-2]
+    ngathers = int(np.prod(batch))
+    offsets = np.asarray(offsets)
+    velocities = np.asarray(velocities)
+    shared = offsets.ndim == 1 and velocities.ndim == 1
+    if shared:
+        geometry = nmo_weights(nsamples, dt, offsets, velocities, kernel)
+    else:
+        geometry = None
+        offsets = np.broadcast_to(offsets, batch + (noffsets,)).reshape(
+            ngathers, noffsets)
+        velocities = np.broadcast_to(
+            velocities, batch + (nsamples,)).reshape(ngathers, nsamples)
+    gathers = cmps.reshape((ngathers, nsamples, noffsets))
+
+    def tasks():
+        for start in range(0, ngathers, chunk_size):
+            stop = min(start + chunk_size, ngathers)
+            if shared:
+                yield gathers[start:stop], None, None
+            else:
+                yield (gathers[start:stop], offsets[start:stop],
+                       velocities[start:stop])
+
+    setup = (dt, geometry, kernel)
+    if n_processes == 1 or ngathers <= chunk_size:
+        _init_nmo_worker(setup)
+        chunks = [_nmo_chunk(task) for task in tasks()]
+    else:
+        pool = multiprocessing.Pool(n_processes, initializer=_init_nmo_worker,
+                                    initargs=(setup,))
+        try:
+            chunks = pool.map(_nmo_chunk, tasks())
+        finally:
+            pool.close()
+            pool.join()
+    nmo = np.concatenate(chunks) if chunks else np.zeros_like(gathers)
+    return nmo.reshape(cmps.shape)
+
+
+_nmo_setup = None
+
+
+def _init_nmo_worker(setup):
+    """
+    Keep the sampling interval and the shared weights in each process
+    """
+    global _nmo_setup
+    _nmo_setup = setup
+
+
+def _nmo_chunk(task):
+    """
+    NMO correction of a chunk of gathers
+    """
+    gathers, offsets, velocities = task
+    dt, geometry, kernel = _nmo_setup
+    if geometry is None:
+        geometry = nmo_weights(gathers.shape[1], dt, offsets, velocities,
+                               kernel)
+    first, weights = geometry
+    return interpolate_gathers(gathers, first, weights)
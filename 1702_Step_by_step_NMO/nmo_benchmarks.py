@@ -0,0 +1,233 @@
+"""
+Timing benchmarks for the NMO functions in nmo.py, on the synthetic CMP of
+the tutorial tiled up to many gathers.
+
+Run all of them with
+
+    python nmo_benchmarks.py
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from nmo import (nmo_correction, nmo_correction_gathers, nmo_weights,
+                 interpolate_gathers, sample_traces)
+from interpolation import (linear_kernel, cubic_kernel,
+                           cubic_convolution_kernel, sinc_kernel)
+from velocity_analysis import semblance, pick_velocities
+from nmo_pipeline import open_gathers, stack_section
+
+
+def load_cmp(fname='data/synthetic_cmp.npz'):
+    """
+    The synthetic CMP, sampling interval, offsets and the v_nmo picked in
+    step-by-step-nmo.ipynb
+    """
+    data = np.load(fname)
+    dt = float(data['dt'])
+    offsets = data['offsets']
+    cmp = data['CMP']
+    times = np.arange(cmp.shape[0])*dt
+    v1, t1 = 3800, 0.22
+    v2, t2 = 4500, 0.46
+    v_nmo = v1 + ((v2 - v1)/(t2 - t1))*(times - t1)
+    return cmp, dt, offsets, v_nmo
+
+
+def tile_cmp(cmp, ngathers, noise=0.01, seed=0):
+    """
+    Stack of ngathers copies of the CMP with a little random noise
+    """
+    random = np.random.RandomState(seed)
+    return cmp + noise*random.randn(ngathers, *cmp.shape)
+
+
+def bench_nmo(ngathers=2000, n_processes=None, chunk_size=100):
+    """
+    Throughput, in traces per second, of the tutorial nmo_correction and of
+    nmo_correction_gathers with shared and per gather velocities.
+    """
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    cmp, dt, offsets, v_nmo = load_cmp()
+    cmps = tile_cmp(cmp, ngathers)
+    velocities = v_nmo*(1 + 0.02*np.random.RandomState(1).randn(ngathers, 1))
+    ntraces = ngathers*cmp.shape[1]
+
+    runs = [("nmo_correction loop", cmp.shape[1],
+             lambda: nmo_correction(cmp, dt, offsets, v_nmo))]
+    for nproc in sorted(set([1, n_processes])):
+        runs.extend([
+            ("gathers, shared v, {} proc".format(nproc), ntraces,
+             lambda nproc=nproc: nmo_correction_gathers(
+                 cmps, dt, offsets, v_nmo, n_processes=nproc,
+                 chunk_size=chunk_size)),
+            ("gathers, own v, {} proc".format(nproc), ntraces,
+             lambda nproc=nproc: nmo_correction_gathers(
+                 cmps, dt, offsets, velocities, n_processes=nproc,
+                 chunk_size=chunk_size)),
+        ])
+    print("{:>30s} {:>14s}".format("", "traces / s"))
+    for name, ntraces, run in runs:
+        start = time.time()
+        run()
+        print("{:>30s} {:>14.0f}".format(name, ntraces/(time.time() - start)))
+
+
+def bench_semblance(ngathers=200, nvelocities=100, n_processes=None,
+                    chunk_size=10):
+    """
+    Throughput, in gathers per second, of semblance spectra with the scan
+    weights shared by all gathers, against NMO correcting the gathers once
+    per trial velocity with nmo_correction_gathers. Also reports the picks
+    on the first gather against the hand picks of the tutorial.
+    """
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    cmp, dt, offsets, v_nmo = load_cmp()
+    cmps = tile_cmp(cmp, ngathers)
+    trial_velocities = np.linspace(3000, 5500, nvelocities)
+    nsamples = cmp.shape[0]
+    nloop = min(ngathers, 10)
+
+    def per_velocity():
+        for velocity in trial_velocities:
+            nmo_correction_gathers(cmps[:nloop], dt, offsets,
+                                   np.full(nsamples, velocity))
+
+    runs = [("nmo_correction_gathers per v", nloop, per_velocity)]
+    for nproc in sorted(set([1, n_processes])):
+        runs.append((
+            "semblance, {} proc".format(nproc), ngathers,
+            lambda nproc=nproc: semblance(
+                cmps, dt, offsets, trial_velocities, n_processes=nproc,
+                chunk_size=chunk_size)))
+    print("{:>30s} {:>14s} {:>14s}".format("", "gathers / s", "traces / s"))
+    for name, n, run in runs:
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        print("{:>30s} {:>14.1f} {:>14.0f}".format(
+            name, n/elapsed, n*cmp.shape[1]/elapsed))
+
+    spectrum = semblance(cmp, dt, offsets, trial_velocities)
+    v_picked, picks = pick_velocities(spectrum, dt, trial_velocities)
+    for t0 in [0.22, 0.46]:
+        sample = int(round(t0/dt))
+        print("t0 = {:.2f} s: picked {:.0f} m/s, tutorial {:.0f} m/s".format(
+            t0, v_picked[sample], v_nmo[sample]))
+
+
+def write_survey(fname, cmp, ngathers, chunk_size=100, noise=0.01, seed=0):
+    """
+    Write ngathers noisy copies of the CMP to a .npy file, a chunk at a time
+    """
+    random = np.random.RandomState(seed)
+    survey = np.lib.format.open_memmap(
+        fname, mode='w+', dtype=float, shape=(ngathers,) + cmp.shape)
+    for start in range(0, ngathers, chunk_size):
+        stop = min(start + chunk_size, ngathers)
+        survey[start:stop] = cmp + noise*random.randn(stop - start, *cmp.shape)
+    survey.flush()
+    del survey
+
+
+def bench_pipeline(sizes=(1000, 4000), chunk_size=100):
+    """
+    Throughput, in traces per second, and peak traced memory of the
+    streaming NMO, stretch mute and stack of surveys of different sizes
+    stored in .npy files. The peak memory depends on the chunk size only.
+    """
+    cmp, dt, offsets, v_nmo = load_cmp()
+    tmpdir = tempfile.mkdtemp()
+    print("{:>10s} {:>10s} {:>14s} {:>12s} {:>12s}".format(
+        "gathers", "chunk", "traces / s", "peak (MB)", "survey (MB)"))
+    try:
+        for ngathers in sizes:
+            fname = os.path.join(tmpdir, 'survey.npy')
+            write_survey(fname, cmp, ngathers)
+            gathers = open_gathers(fname)
+            tracemalloc.start()
+            start = time.time()
+            stack_section(gathers, dt, offsets, v_nmo,
+                          filename=os.path.join(tmpdir, 'stack.npy'),
+                          chunk_size=chunk_size)
+            elapsed = time.time() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("{:>10d} {:>10d} {:>14.0f} {:>12.1f} {:>12.1f}".format(
+                ngathers, chunk_size, ngathers*cmp.shape[1]/elapsed,
+                peak/1e6, gathers.nbytes/1e6))
+            del gathers
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_interpolation(ngathers=500, ntable=1024):
+    """
+    Speed and accuracy of the NMO correction with each interpolation
+    kernel. The time to calculate the weights (once per geometry) and the
+    throughput of applying them to a stack of gathers are given
+    separately. Errors are relative to the largest amplitude: against the
+    CubicSpline of sample_trace on the tutorial CMP, over the samples that
+    no kernel mutes, and against the exact values of a band-limited signal
+    (random cosines up to 60% of the Nyquist frequency).
+    """
+    cmp, dt, offsets, v_nmo = load_cmp()
+    cmps = tile_cmp(cmp, ngathers)
+    nsamples = cmp.shape[0]
+    kernels = [
+        None,
+        linear_kernel(ntable),
+        cubic_kernel(ntable),
+        cubic_convolution_kernel(ntable=ntable),
+        sinc_kernel(4, ntable=ntable),
+        sinc_kernel(8, ntable=ntable),
+    ]
+    spline = nmo_correction_gathers(cmp, dt, offsets, v_nmo)
+    outputs = [nmo_correction_gathers(cmp, dt, offsets, v_nmo, kernel=kernel)
+               for kernel in kernels]
+    # Compare where every kernel has all of its samples
+    common = np.all([output != 0 for output in outputs], axis=0)
+    scale = np.abs(spline).max()
+
+    random = np.random.RandomState(0)
+    frequencies = random.uniform(0, 0.3/dt, 20)
+    phases = random.uniform(0, 2*np.pi, 20)
+
+    def signal(times):
+        return np.cos(2*np.pi*frequencies*times[..., np.newaxis] +
+                      phases).sum(axis=-1)
+
+    trace = signal(np.arange(nsamples)*dt)[:, np.newaxis]
+    times = random.uniform(20*dt, (nsamples - 20)*dt, (5000, 1))
+    exact = signal(times)
+
+    print("{:>36s} {:>12s} {:>12s} {:>12s} {:>12s}".format(
+        "kernel", "weights (ms)", "traces / s", "vs spline",
+        "band-limited"))
+    for kernel, output in zip(kernels, outputs):
+        start = time.time()
+        first, weights = nmo_weights(nsamples, dt, offsets, v_nmo, kernel)
+        setup = time.time() - start
+        start = time.time()
+        interpolate_gathers(cmps, first, weights)
+        throughput = ngathers*cmp.shape[1]/(time.time() - start)
+        error = np.abs(sample_traces(trace, times, dt, kernel) - exact).max()
+        name = "sample_trace" if kernel is None else kernel.name
+        print("{:>36s} {:>12.2f} {:>12.0f} {:>12.1e} {:>12.1e}".format(
+            name, setup*1e3, throughput,
+            np.abs(output - spline)[common].max()/scale,
+            error/np.abs(trace).max()))
+
+
+if __name__ == '__main__':
+    bench_nmo()
+    bench_semblance()
+    bench_pipeline()
+    bench_interpolation()
@@ -0,0 +1,195 @@
+"""
+Out-of-core NMO processing of whole surveys: gathers are read lazily from a
+memory-mapped trace store, NMO corrected, stretch muted and stacked a chunk
+of gathers at a time, and the stacked section is written as it is made.
+Memory use is set by the chunk size, not by the size of the survey.
+"""
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+from nmo import nmo_weights, stretch_mute, interpolate_gathers
+
+
+def open_gathers(fname, key='CMP', fold=None):
+    """
+    Memory-map the CMP gathers in a .npy or .npz file.
+
+    Two layouts are understood:
+
+    * gathers: a 3D array ``(ngathers, nsamples, noffsets)``;
+    * traces, as in SEG-Y files sorted by CMP: a 2D array
+      ``(ntraces, nsamples)`` with *fold* consecutive traces per gather.
+
+    Nothing is read until the gathers are sliced.
+
+    Parameters
+    ----------
+
+    fname : str
+        A .npy file, or a .npz archive saved with np.savez (members
+        compressed with np.savez_compressed can't be memory-mapped).
+    key : str
+        The name of the array in a .npz archive.
+    fold : int
+        The number of traces per gather for the traces layout.
+
+    Returns
+    -------
+
+    gathers : array
+        A read-only view with shape ``(ngathers, nsamples, noffsets)``.
+
+    """
+    if fname.endswith('.npz'):
+        traces = _npz_memmap(fname, key)
+    else:
+        traces = np.load(fname, mmap_mode='r')
+    if traces.ndim == 3:
+        return traces
+    if fold is None:
+        raise ValueError("The fold is needed to group traces into gathers")
+    ntraces, nsamples = traces.shape
+    if ntraces % fold != 0:
+        raise ValueError(
+            "{} traces can't be split in gathers of {}".format(ntraces, fold))
+    return traces.reshape((ntraces//fold, fold, nsamples)).transpose(0, 2, 1)
+
+
+def _npz_memmap(fname, key):
+    """
+    Memory-map an uncompressed array of a .npz archive
+    """
+    with zipfile.ZipFile(fname) as archive:
+        info = archive.getinfo(key + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(
+            "'{}' is compressed in {}, save it with np.savez or as .npy to "
+            "memory-map it".format(key, fname))
+    with open(fname, 'rb') as fid:
+        # Skip the local header of the zip member to the .npy data
+        fid.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', fid.read(4))
+        fid.seek(name_length + extra_length, 1)
+        version = np.lib.format.read_magic(fid)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(fid)
+        else:
+            header = np.lib.format.read_array_header_2_0(fid)
+        shape, fortran_order, dtype = header
+        offset = fid.tell()
+    return np.memmap(fname, dtype=dtype, mode='r', offset=offset,
+                     shape=shape, order='F' if fortran_order else 'C')
+
+
+def stack_chunks(gathers, dt, offsets, velocities, chunk_size=100,
+                 max_stretch=0.5, kernel=None):
+    """
+    NMO correct, stretch mute and stack gathers a chunk at a time.
+
+    The stack at each time is the mean of the traces that are not muted
+    there. With a single velocity function for all gathers the weights
+    and the mute are only calculated once.
+
+    Parameters
+    ----------
+
+    gathers : array
+        The CMP gathers, shape ``(ngathers, nsamples, noffsets)``, e.g.
+        from open_gathers.
+    dt : float
+        The sampling interval.
+    offsets : 1D array
+        The offset of each trace.
+    velocities : array
+        The NMO velocity for each time, ``(nsamples,)`` for all the gathers
+        or ``(ngathers, nsamples)`` (which can be memory-mapped too).
+    chunk_size : int
+        The number of gathers read and processed at once.
+    max_stretch : float
+        The largest NMO stretch kept (see nmo.stretch_mute).
+    kernel : interpolation.Kernel
+        The interpolation kernel of the NMO correction (see
+        nmo.nmo_weights).
+
+    Yields
+    ------
+
+    start : int
+        The index of the first gather of the chunk.
+    stack : array
+        The stacked traces of the chunk, shape ``(chunk, nsamples)``.
+
+    """
+    ngathers, nsamples, noffsets = gathers.shape
+    shared = np.ndim(velocities) == 1
+
+    def geometry(velocities):
+        first, weights = nmo_weights(nsamples, dt, offsets, velocities,
+                                     kernel)
+        weights = weights*stretch_mute(nsamples, dt, offsets, velocities,
+                                       max_stretch)
+        live = (weights != 0).any(axis=0).sum(axis=-1)
+        # Average over the live traces, zero where there are none
+        weights /= np.maximum(live, 1)[..., np.newaxis]
+        return first, weights
+
+    if shared:
+        first, weights = geometry(np.asarray(velocities))
+    for start in range(0, ngathers, chunk_size):
+        stop = min(start + chunk_size, ngathers)
+        chunk = np.asarray(gathers[start:stop])
+        if not shared:
+            first, weights = geometry(np.asarray(velocities[start:stop]))
+        nmo = interpolate_gathers(chunk, first, weights)
+        yield start, nmo.sum(axis=-1)
+
+
+def stack_section(gathers, dt, offsets, velocities, filename=None,
+                  chunk_size=100, max_stretch=0.5, kernel=None,
+                  verbose=False):
+    """
+    Stacked section of a survey, processed with stack_chunks.
+
+    Parameters
+    ----------
+
+    gathers, dt, offsets, velocities, chunk_size, max_stretch, kernel
+        As in stack_chunks.
+    filename : str
+        Write the section to this .npy file as the chunks are stacked.
+        Otherwise it is kept in memory.
+    verbose : bool
+        Print the progress and the throughput in traces per second after
+        each chunk.
+
+    Returns
+    -------
+
+    section : array
+        The stacked traces, shape ``(ngathers, nsamples)``. A memory-mapped
+        array if a filename is given.
+
+    """
+    ngathers, nsamples, noffsets = gathers.shape
+    if filename is not None:
+        section = np.lib.format.open_memmap(
+            filename, mode='w+', dtype=float, shape=(ngathers, nsamples))
+    else:
+        section = np.empty((ngathers, nsamples))
+    start_time = time.time()
+    for start, stack in stack_chunks(gathers, dt, offsets, velocities,
+                                     chunk_size=chunk_size,
+                                     max_stretch=max_stretch,
+                                     kernel=kernel):
+        stop = start + stack.shape[0]
+        section[start:stop] = stack
+        if filename is not None:
+            section.flush()
+        if verbose:
+            elapsed = time.time() - start_time
+            print("{} / {} gathers, {:.0f} traces / s".format(
+                stop, ngathers, stop*noffsets/elapsed))
+    return section
@@ -0,0 +1,268 @@
+"""
+Velocity analysis of CMP gathers: semblance spectra and automatic picking
+of the NMO velocity function, built on the NMO correction in nmo.py.
+
+Instead of picking v_nmo by hand as in step-by-step-nmo.ipynb, each gather
+is NMO corrected with a constant trial velocity at a time and the
+coherence of the corrected traces (semblance) is measured along t0. The
+interpolation weights of all trial velocities depend only on the geometry,
+so they are calculated once, as a sparse matrix, and applied to every
+gather.
+"""
+import multiprocessing
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.ndimage import maximum_filter1d, uniform_filter1d
+
+from nmo import nmo_weights
+
+
+def scan_weights(nsamples, dt, offsets, trial_velocities):
+    """
+    The NMO correction with each trial velocity as a sparse matrix.
+
+    Parameters
+    ----------
+
+    nsamples : int
+        The number of samples in the gathers.
+    dt : float
+        The sampling interval.
+    offsets : 1D array
+        The offset of each trace.
+    trial_velocities : 1D array
+        The constant NMO velocities to try.
+
+    Returns
+    -------
+
+    operator : scipy.sparse.csr_matrix
+        Takes a gather flattened to ``nsamples*noffsets`` values to the
+        gathers corrected with every velocity, flattened to
+        ``nvelocities*nsamples*noffsets`` values. Each row holds the 4
+        weights of nmo_weights.
+    live : array
+        The number of traces that reach each time with each velocity,
+        shape ``(nvelocities, nsamples)``.
+
+    """
+    offsets = np.asarray(offsets)
+    noffsets = offsets.size
+    # A constant velocity for all times broadcasts against the time axis
+    velocities = np.asarray(trial_velocities, dtype=float)[:, np.newaxis]
+    first, weights = nmo_weights(nsamples, dt, offsets, velocities)
+    npoints = weights.shape[0]
+    columns = np.array([(first + k)*noffsets + np.arange(noffsets)
+                        for k in range(npoints)])
+    rows = np.broadcast_to(np.arange(first.size), (npoints, first.size))
+    operator = sp.csr_matrix(
+        (weights.ravel(), (rows.ravel(), columns.ravel())),
+        shape=(first.size, nsamples*noffsets))
+    operator.eliminate_zeros()
+    live = (weights != 0).any(axis=0).sum(axis=-1)
+    return operator, live
+
+
+def semblance_from_weights(cmps, operator, live, window, stabilization=0.01):
+    """
+    Semblance of a stack of gathers for a precomputed scan operator.
+
+    Parameters
+    ----------
+
+    cmps : array
+        The CMP gathers, shape ``(..., nsamples, noffsets)``.
+    operator, live : arrays
+        As returned by scan_weights.
+    window : int
+        The number of samples in the time window that the semblance is
+        averaged over.
+    stabilization : float
+        Fraction of the largest denominator of each gather added to all
+        denominators, so that nearly silent windows get a low semblance.
+
+    Returns
+    -------
+
+    semblance : array
+        Shape ``(..., nvelocities, nsamples)``, between 0 and 1.
+
+    """
+    cmps = np.asarray(cmps)
+    batch = cmps.shape[:-2]
+    gathers = cmps.reshape((-1, cmps.shape[-2]*cmps.shape[-1]))
+    stack = np.empty((gathers.shape[0],) + live.shape)
+    energy = np.empty_like(stack)
+    for i, gather in enumerate(gathers):
+        # The gather corrected with all velocities, a matrix-vector product
+        # being faster than a product with many gathers at once
+        corrected = (operator @ gather).reshape(live.shape + (-1,))
+        stack[i] = corrected.sum(axis=-1)
+        energy[i] = np.einsum('ijk,ijk->ij', corrected, corrected)
+    numerator = uniform_filter1d(stack**2, window, axis=-1, mode='constant')
+    denominator = uniform_filter1d(live*energy, window, axis=-1,
+                                   mode='constant')
+    denominator += stabilization*denominator.max(axis=(-2, -1),
+                                                 keepdims=True)
+    semblance = np.divide(numerator, denominator,
+                          out=np.zeros_like(numerator),
+                          where=denominator > 0)
+    return semblance.reshape(batch + live.shape)
+
+
+def semblance(cmps, dt, offsets, trial_velocities, window=0.02,
+              stabilization=0.01, n_processes=1, chunk_size=10):
+    """
+    Semblance spectrum of one or many CMP gathers.
+
+    For each trial velocity v and time t0, the semblance is
+
+        sum_t (sum_x a)**2 / sum_t (N sum_x a**2)
+
+    with *a* the amplitudes of the gather NMO corrected with v, *N* the
+    number of traces that reach t0 and the sums over t in a window
+    centred on t0.
+
+    The units must be consistent. E.g., if dt is seconds and
+    offsets is meters, velocities must be m/s.
+
+    Parameters
+    ----------
+
+    cmps : array
+        The CMP gathers, shape ``(..., nsamples, noffsets)``.
+    dt : float
+        The sampling interval.
+    offsets : 1D array
+        The offset of each trace, the same for all gathers.
+    trial_velocities : 1D array
+        The constant NMO velocities to try.
+    window : float
+        The length of the time window.
+    stabilization : float
+        Fraction of the largest denominator of each gather added to all
+        denominators, so that nearly silent windows get a low semblance.
+        Use 0 for the plain semblance.
+    n_processes : int
+        Split the gathers over this many processes.
+    chunk_size : int
+        The number of gathers handled at once (and sent to each process).
+        The memory used grows with chunk_size times the number of trial
+        velocities.
+
+    Returns
+    -------
+
+    semblance : array
+        Shape ``(..., nvelocities, nsamples)``, between 0 and 1.
+
+    """
+    cmps = np.asarray(cmps)
+    nsamples, noffsets = cmps.shape[-2:]
+    batch = cmps.shape[:-2]
+    ngathers = int(np.prod(batch))
+    gathers = cmps.reshape((ngathers, nsamples, noffsets))
+    operator, live = scan_weights(nsamples, dt, offsets, trial_velocities)
+    window = max(1, int(round(window/dt)))
+    setup = (operator, live, window, stabilization)
+    tasks = (gathers[start:start + chunk_size]
+             for start in range(0, ngathers, chunk_size))
+    if n_processes == 1 or ngathers <= chunk_size:
+        _init_semblance_worker(setup)
+        chunks = [_semblance_chunk(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(n_processes,
+                                    initializer=_init_semblance_worker,
+                                    initargs=(setup,))
+        try:
+            chunks = pool.map(_semblance_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return np.concatenate(chunks).reshape(batch + live.shape)
+
+
+_semblance_setup = None
+
+
+def _init_semblance_worker(setup):
+    """
+    Keep the scan weights in each process
+    """
+    global _semblance_setup
+    _semblance_setup = setup
+
+
+def _semblance_chunk(gathers):
+    """
+    Semblance of a chunk of gathers
+    """
+    return semblance_from_weights(gathers, *_semblance_setup)
+
+
+def pick_velocities(semblance, dt, trial_velocities, threshold=0.3,
+                    separation=0.04, vmin=None, vmax=None):
+    """
+    Automatic picks of the NMO velocity function from semblance spectra.
+
+    At each time, the best velocity is the one with the largest semblance.
+    Picks are made at the times where that semblance is a maximum within
+    *separation* and above *threshold*. The velocity function interpolates
+    the picks linearly and is constant before the first and after the last
+    pick.
+
+    Parameters
+    ----------
+
+    semblance : array
+        The semblance spectra, shape ``(..., nvelocities, nsamples)``.
+    dt : float
+        The sampling interval.
+    trial_velocities : 1D array
+        The velocities of the spectra.
+    threshold : float
+        The smallest semblance that is picked.
+    separation : float
+        The shortest time between picks.
+    vmin, vmax : float
+        Only pick velocities in this range.
+
+    Returns
+    -------
+
+    v_nmo : array
+        The NMO velocity for each time, shape ``(..., nsamples)``. Times of
+        gathers without picks get NaN.
+    picks : list
+        The ``(times, velocities)`` picked in each gather.
+
+    """
+    semblance = np.asarray(semblance)
+    trial_velocities = np.asarray(trial_velocities)
+    nvelocities, nsamples = semblance.shape[-2:]
+    batch = semblance.shape[:-2]
+    spectra = semblance.reshape((-1, nvelocities, nsamples))
+    allowed = np.ones(nvelocities, dtype=bool)
+    if vmin is not None:
+        allowed &= trial_velocities >= vmin
+    if vmax is not None:
+        allowed &= trial_velocities <= vmax
+    spectra = np.where(allowed[:, np.newaxis], spectra, -np.inf)
+    best = spectra.argmax(axis=1)
+    power = spectra.max(axis=1)
+    size = 2*max(1, int(round(separation/dt))) + 1
+    peaks = (power == maximum_filter1d(power, size, axis=-1)) & \
+        (power >= threshold)
+
+    times = np.arange(nsamples)*dt
+    v_nmo = np.full(power.shape, np.nan)
+    picks = []
+    for i in range(power.shape[0]):
+        samples = np.flatnonzero(peaks[i])
+        pick_times = times[samples]
+        picked = trial_velocities[best[i, samples]]
+        picks.append((pick_times, picked))
+        if samples.size > 0:
+            v_nmo[i] = np.interp(times, pick_times, picked)
+    return v_nmo.reshape(batch + (nsamples,)), picks
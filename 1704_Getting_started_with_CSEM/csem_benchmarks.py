@@ -0,0 +1,144 @@
+"""
+Timing benchmarks for the CSEM modelling modules.
+
+Run all of them with
+
+    python csem_benchmarks.py
+"""
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from empymod import bipole
+
+from csem_scenarios import bipole_scenarios
+from receiver_plane import bipole_plane
+
+# survey of the offset versus frequency example of the notebook
+SURVEY = {'src': [0, 0, 250, 0, 0],
+          'rec': [np.arange(20, 101)*100, np.zeros(81), 300, 0, 0],
+          'depth': [0, 300, 1000, 1200],
+          'freqtime': np.logspace(-1.5, .5, 33),
+          'aniso': [1, 1, 1.5, 1.5, 1.5],
+          'verb': 0}
+
+
+def xyplane(n=1051):
+    """
+    The xy-plane example of the notebook, with n x n receivers from -0.5
+    to 10 km (1051 x 1051 in the notebook).
+    """
+    x = np.arange(n)*(10500/(n-1)) - 500
+    rx = np.repeat([x], n, axis=0)
+    return {'src': [0, 0, 150, 90, 0],
+            'rec': [rx.ravel(), rx.T.ravel(), 200, 0, 0],
+            'depth': [0, 300], 'res': [2e14, 0.3, 1], 'freqtime': 0.75,
+            'aniso': [1, 1, 2], 'epermH': [1, 80, 10],
+            'epermV': [1, 80, 15], 'mrec': True, 'verb': 0}
+
+
+def bench_scenarios(nscenarios=20, n_processes=None):
+    """
+    Time to model a sweep of target resistivities, each scenario with its
+    brine background (as in the notebook), with a bipole call per model
+    and with bipole_scenarios, which models the shared background once,
+    over 1 and n_processes processes, and again from its cache.
+    """
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    brine = [2e14, .3, 1, 1, 1]
+    scenarios = []
+    for res in np.logspace(0, 2, nscenarios):
+        scenarios += [{'res': brine}, {'res': [2e14, .3, 1, res, 1]}]
+
+    print('{:>30s} {:>12s} {:>12s}'.format('', 'time (s)', 'speed-up'))
+    start = time.time()
+    loop = [bipole(**dict(SURVEY, **scenario)) for scenario in scenarios]
+    t_loop = time.time() - start
+    print('{:>30s} {:>12.2f}'.format('bipole per scenario', t_loop))
+
+    tmp = tempfile.mkdtemp()
+    try:
+        for nproc in sorted(set([1, n_processes])):
+            start = time.time()
+            out = bipole_scenarios(scenarios, n_processes=nproc, **SURVEY)
+            elapsed = time.time() - start
+            print('{:>30s} {:>12.2f} {:>12.1f}'.format(
+                'bipole_scenarios, {} proc'.format(nproc), elapsed,
+                t_loop/elapsed))
+        assert all(np.allclose(a, b) for a, b in zip(loop, out))
+        bipole_scenarios(scenarios, cache_dir=tmp, **SURVEY)
+        start = time.time()
+        bipole_scenarios(scenarios, cache_dir=tmp, **SURVEY)
+        elapsed = time.time() - start
+        print('{:>30s} {:>12.2f} {:>12.1f}'.format(
+            'bipole_scenarios, cached', elapsed, t_loop/elapsed))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_receiver_chunks(n=301, chunk_sizes=(1000, 10000, 100000)):
+    """
+    Time to model an xy-plane of n x n receivers (as the xy-plane example
+    of the notebook, on a coarser grid) in a single bipole call and in
+    chunks of receivers.
+    """
+    survey = xyplane(n)
+    print('{:>30s} {:>12s}'.format('{0}x{0} receivers'.format(n),
+                                   'time (s)'))
+    start = time.time()
+    full = bipole(**survey)
+    print('{:>30s} {:>12.2f}'.format('single call', time.time() - start))
+    for chunk_size in chunk_sizes:
+        start = time.time()
+        out = bipole_scenarios([{}], chunk_size=chunk_size, **survey)[0]
+        print('{:>30s} {:>12.2f}'.format(
+            'chunks of {}'.format(chunk_size), time.time() - start))
+        assert np.allclose(out, full)
+
+
+def bench_receiver_plane(n=301, rtols=(1e-3, 1e-4, 1e-5), n_full=1051):
+    """
+    Time and error of bipole_plane for an xy-plane of n x n receivers,
+    against bipole for every receiver; and its time for the n_full x
+    n_full plane of the notebook. The errors (except at the source) are
+    relative to the largest response at about the same offset, as the
+    tolerance of bipole_plane, and to the response at each receiver, which
+    is larger on the lines where the response vanishes.
+    """
+    survey = xyplane(n)
+    start = time.time()
+    full = bipole(**survey)
+    t_full = time.time() - start
+    offset = np.hypot(*survey['rec'][:2])
+    away = offset > 0
+    bins = np.digitize(offset, np.linspace(0, offset.max(), n))
+    largest = np.zeros(bins.max() + 1)
+    np.maximum.at(largest, bins, np.abs(full))
+    print('{:>30s} {:>10s} {:>10s} {:>8s} {:>10s} {:>10s}'.format(
+        '{0}x{0} receivers'.format(n), 'time (s)', 'speed-up', 'offsets',
+        'max error', 'median'))
+    print('{:>30s} {:>10.2f}'.format('bipole', t_full))
+    for rtol in rtols:
+        start = time.time()
+        plane, offsets, _ = bipole_plane(rtol=rtol, full_output=True,
+                                         **survey)
+        elapsed = time.time() - start
+        diff = np.abs(plane - full)[away]
+        print('{:>30s} {:>10.2f} {:>10.1f} {:>8d} {:>10.1e} {:>10.1e}'.format(
+            'bipole_plane, rtol={:g}'.format(rtol), elapsed,
+            t_full/elapsed, offsets.size, (diff/largest[bins][away]).max(),
+            np.median(diff/np.abs(full)[away])))
+    survey = xyplane(n_full)
+    start = time.time()
+    bipole_plane(**survey)
+    print('{:>30s} {:>10.2f}'.format(
+        'bipole_plane, {0}x{0}'.format(n_full), time.time() - start))
+
+
+if __name__ == '__main__':
+    bench_scenarios()
+    bench_receiver_chunks()
+    bench_receiver_plane()
@@ -0,0 +1,252 @@
+"""
+Modelling many resistivity scenarios with empymod.bipole.
+
+The notebook calls bipole once per model, e.g. once for brine and once
+for oil. For feasibility studies with many scenarios, bipole_scenarios
+takes a list of scenarios (each a dict of bipole parameters), and:
+
+- computes each distinct model only once, and loads it from a cache
+  directory if it was computed before, keyed by a hash of all the
+  parameters (so a brine background shared by many scenarios is modelled
+  once);
+- groups the scenarios sharing the same source, receivers, times or
+  frequencies and other survey parameters, so that their geometry is sent
+  once to each process;
+- splits large receiver arrays (e.g. the xy-plane of the notebook) into
+  chunks, so that a single bipole call stays small, and models the chunks
+  of all scenarios over a pool of processes.
+"""
+import hashlib
+import multiprocessing
+import numbers
+import os
+
+import numpy as np
+from empymod import bipole
+
+# parameters of bipole which define the model (the rest is the survey)
+MODEL_PARAMETERS = ('depth', 'res', 'aniso', 'epermH', 'epermV', 'mpermH',
+                    'mpermV')
+
+
+def scenario_key(params):
+    """
+    Hash of the parameters of a bipole call.
+
+    Numbers are hashed as floats, so ``1`` and ``1.0`` (or a list and an
+    array of the same values) give the same key; the verbosity is ignored.
+
+    Parameters
+    ----------
+
+    params : dict
+        Parameters of bipole: src, rec, depth, res, freqtime, aniso, ...
+
+    Returns
+    -------
+
+    key : str
+        Hexadecimal SHA-1 digest.
+
+    """
+    h = hashlib.sha1()
+    for name in sorted(params):
+        if name != 'verb':
+            h.update(name.encode())
+            _hash_value(h, params[name])
+    return h.hexdigest()
+
+
+def _hash_value(h, value):
+    """
+    Adds a parameter value (numbers, arrays, strings, None, or lists and
+    dicts of them) to a hash.
+    """
+    if isinstance(value, dict):
+        h.update(b'{')
+        for key in sorted(value):
+            h.update(str(key).encode())
+            _hash_value(h, value[key])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)) and not _is_array(value):
+        h.update(b'[')
+        for item in value:
+            _hash_value(h, item)
+        h.update(b']')
+    elif value is None or isinstance(value, (str, bool)):
+        h.update(repr(value).encode())
+    else:
+        value = np.asarray(value, dtype=float)
+        h.update(repr(value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+
+
+def _is_array(value):
+    """
+    Whether a list or tuple is a (rectangular) array of real numbers, to be
+    hashed as the array of the same values.
+    """
+    def real(item):
+        if isinstance(item, (list, tuple)):
+            return all(real(i) for i in item)
+        if isinstance(item, np.ndarray):
+            return item.dtype.kind in 'iuf'
+        return isinstance(item, numbers.Real) and not isinstance(item, bool)
+    if not real(value):
+        return False
+    try:
+        np.asarray(value, dtype=float)
+    except ValueError:
+        # ragged, e.g. rec with arrays of receivers and a scalar depth
+        return False
+    return True
+
+
+def split_receivers(rec, chunk_size):
+    """
+    Split the receivers of bipole into chunks.
+
+    Parameters
+    ----------
+
+    rec : list
+        Receivers as given to bipole, ``[x, y, z, azimuth, dip]`` or
+        ``[x1, x2, y1, y2, z1, z2]``; arrays (of the number of receivers)
+        are split, scalars are kept in every chunk.
+    chunk_size : int
+        Maximum number of receivers in a chunk.
+
+    Returns
+    -------
+
+    chunks : list of slice
+        Slices of the receivers of each chunk.
+
+    """
+    nrec = max(np.size(r) for r in rec)
+    return [slice(start, min(start + chunk_size, nrec))
+            for start in range(0, nrec, chunk_size)]
+
+
+def _receivers(rec, chunk):
+    """
+    The receivers of a chunk.
+    """
+    return [np.asarray(r)[chunk] if np.size(r) > 1 else r for r in rec]
+
+
+def bipole_scenarios(scenarios, cache_dir=None, chunk_size=10000,
+                     n_processes=1, **common):
+    """
+    Model many scenarios with empymod.bipole.
+
+    Parameters
+    ----------
+
+    scenarios : list of dict
+        Parameters of bipole of each scenario, updating those in common,
+        e.g. ``[{'res': brine}, {'res': oil}]``.
+    cache_dir : str, optional
+        Directory where the response of each distinct scenario is saved as
+        ``{key}.npy`` (see scenario_key), and read from on later calls.
+    chunk_size : int
+        Maximum number of receivers modelled in a single bipole call.
+    n_processes : int
+        The number of processes to model the chunks.
+    **common
+        Parameters of bipole shared by all scenarios, e.g. src, rec,
+        depth, freqtime, verb (which defaults to 0).
+
+    Returns
+    -------
+
+    responses : list of arrays
+        The response of each scenario, shaped as bipole returns it.
+
+    """
+    common.setdefault('verb', 0)
+    params = [dict(common, **scenario) for scenario in scenarios]
+    keys = [scenario_key(p) for p in params]
+    results = {}
+    todo = {}
+    for key, p in zip(keys, params):
+        if key in results or key in todo:
+            continue
+        fname = (os.path.join(cache_dir, key + '.npy') if cache_dir
+                 else None)
+        if fname and os.path.exists(fname):
+            results[key] = np.load(fname)
+        else:
+            todo[key] = p
+
+    # scenarios sharing the survey, with the models to compute for each
+    groups = {}
+    for key, p in todo.items():
+        survey = {name: value for name, value in p.items()
+                  if name not in MODEL_PARAMETERS}
+        models = {name: value for name, value in p.items()
+                  if name in MODEL_PARAMETERS}
+        group = groups.setdefault(scenario_key(survey), (survey, {}))
+        group[1][key] = models
+    tasks = [(gid, chunk, key)
+             for gid, (survey, models) in groups.items()
+             for chunk in split_receivers(survey['rec'], chunk_size)
+             for key in models]
+
+    pieces = {key: [] for key in todo}
+    if n_processes == 1 or len(tasks) <= 1:
+        _init_scenario_worker(groups)
+        for task in tasks:
+            key, chunk, response = _scenario_chunk(task)
+            pieces[key].append((chunk.start, response))
+    else:
+        pool = multiprocessing.Pool(n_processes,
+                                    initializer=_init_scenario_worker,
+                                    initargs=(groups,))
+        try:
+            for key, chunk, response in pool.imap_unordered(
+                    _scenario_chunk, tasks):
+                pieces[key].append((chunk.start, response))
+        finally:
+            pool.close()
+            pool.join()
+
+    for key, p in todo.items():
+        chunks = [response for _, response in sorted(pieces[key],
+                                                     key=lambda x: x[0])]
+        response = np.squeeze(np.concatenate(chunks, axis=1))
+        results[key] = response
+        if cache_dir:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fname = os.path.join(cache_dir, key + '.npy')
+            tmp = fname + '.tmp.npy'
+            np.save(tmp, response)
+            os.replace(tmp, fname)
+    return [results[key] for key in keys]
+
+
+_scenario_setup = None
+
+
+def _init_scenario_worker(groups):
+    """
+    Keeps the surveys and models of the scenarios in each process.
+    """
+    global _scenario_setup
+    _scenario_setup = groups
+
+
+def _scenario_chunk(task):
+    """
+    Model one scenario on a chunk of receivers, shaped (freqtime,
+    receivers, sources) so that the chunks can be joined.
+    """
+    gid, chunk, key = task
+    survey, models = _scenario_setup[gid]
+    p = dict(survey, **models[key])
+    p['rec'] = _receivers(survey['rec'], chunk)
+    response = np.asarray(bipole(**p))
+    nsrc = max(np.size(s) for s in survey['src'])
+    nft = np.size(survey['freqtime'])
+    return key, chunk, response.reshape(nft, chunk.stop - chunk.start, nsrc)
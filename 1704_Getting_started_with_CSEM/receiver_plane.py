@@ -0,0 +1,188 @@
+"""
+Fast modelling of a plane of receivers, as the xy-plane example of the
+notebook.
+
+In a horizontally layered earth (with vertical anisotropy, as in empymod)
+the response of a point dipole only depends on the offset and azimuth of
+the receiver: turning source and receiver about the vertical axis through
+the source does not change it. So the response at any receiver is a
+combination, with weights given by the directions of the source and
+receiver relative to the source-receiver azimuth, of the responses of
+x-, y- and z-directed dipoles with the receiver on the x-axis at the same
+offset. bipole_plane computes these few responses with bipole on a radial
+line of offsets, which is refined until a cubic spline through them is
+accurate enough, and combines them for all the receivers, instead of
+calling bipole for each of the (often millions of) receivers.
+"""
+import numpy as np
+from scipy.interpolate import CubicSpline
+from empymod import bipole
+
+# azimuth and dip of the x-, y- and z-directed dipoles
+DIRECTIONS = [(0, 0), (90, 0), (0, 90)]
+
+
+def _direction(azimuth, dip):
+    """
+    Unit vector of a dipole of azimuth and dip in degrees (x, y, z).
+    """
+    azimuth, dip = np.radians(azimuth), np.radians(dip)
+    vector = np.array([np.cos(azimuth)*np.cos(dip),
+                       np.sin(azimuth)*np.cos(dip), np.sin(dip)])
+    vector[np.abs(vector) < 1e-12] = 0
+    return vector
+
+
+def _rotate(vector, phi):
+    """
+    The components of a direction in the frame turned by phi, where the
+    receiver is on the x-axis; shape (3, n).
+    """
+    cos, sin = np.cos(phi), np.sin(phi)
+    return np.array([cos*vector[0] + sin*vector[1],
+                     -sin*vector[0] + cos*vector[1],
+                     np.full(phi.shape, vector[2])])
+
+
+def bipole_plane(src, rec, rtol=1e-4, nodes=65, max_nodes=4097,
+                 full_output=False, **kwargs):
+    """
+    The response of receivers of the same depth and direction with
+    empymod.bipole, from responses on a radial line.
+
+    The responses (of the x-, y- and z-directed dipoles needed) are
+    computed on offsets evenly spaced in log-offset between the smallest
+    non-zero and the largest offset of the receivers. The middle of each
+    interval is then computed too and compared with the cubic spline
+    through the offsets; where the difference, relative to the largest
+    response at that offset, is above rtol, the middle becomes a new
+    offset, until all the intervals pass or there are max_nodes offsets.
+
+    Receivers right at the source (zero offset) get the response at the
+    smallest non-zero offset, as the digital filters of bipole are not
+    accurate there.
+
+    Parameters
+    ----------
+
+    src : list
+        A single point dipole, ``[x, y, z, azimuth, dip]``.
+    rec : list
+        ``[x, y, z, azimuth, dip]``, with x and y arrays of the receivers
+        (e.g. the flattened grid of the xy-plane) and the same z, azimuth
+        and dip for all of them.
+    rtol : float
+        Tolerance of the relative error of the interpolation.
+    nodes : int
+        The initial number of offsets.
+    max_nodes : int
+        The maximum number of offsets.
+    full_output : bool
+        Also return the offsets used and the error estimate.
+    **kwargs
+        The other parameters of bipole: depth, res, freqtime, aniso,
+        mrec, ...; srcpts and recpts must be 1.
+
+    Returns
+    -------
+
+    response : array
+        As bipole returns it, (freqtime, receivers), squeezed.
+    offsets : array
+        If full_output, the offsets where bipole was computed.
+    error : float
+        If full_output, the largest relative error measured in the middle
+        of the last intervals checked.
+
+    """
+    if len(src) != 5 or np.size(src[0]) != 1 or len(rec) != 5:
+        raise ValueError("src must be a single point dipole and rec point "
+                         "dipoles, [x, y, z, azimuth, dip]")
+    if kwargs.get('srcpts', 1) > 1 or kwargs.get('recpts', 1) > 1:
+        raise ValueError("srcpts and recpts must be 1")
+    if any(np.size(r) != 1 for r in rec[2:]):
+        raise ValueError("all the receivers must have the same z, "
+                         "azimuth and dip")
+    kwargs.setdefault('verb', 0)
+    x0, y0, zsrc, src_azimuth, src_dip = src
+    dx = np.asarray(rec[0], dtype=float).ravel() - x0
+    dy = np.asarray(rec[1], dtype=float).ravel() - y0
+    zrec, rec_azimuth, rec_dip = rec[2:]
+    nft = np.size(kwargs['freqtime'])
+
+    # components needed: rows are the receiver, columns the source; with
+    # the receiver on the x-axis, the response is symmetric under y -> -y,
+    # so xy, yx, yz and zy vanish
+    s = _direction(src_azimuth, src_dip)
+    v = _direction(rec_azimuth, rec_dip)
+    src_dirs = ([0, 1] if s[:2].any() else []) + ([2] if s[2] else [])
+    rec_dirs = ([0, 1] if v[:2].any() else []) + ([2] if v[2] else [])
+    components = [(i, j) for i in rec_dirs for j in src_dirs
+                  if i == j or 1 not in (i, j)]
+
+    def kernel(offsets):
+        """
+        The responses of the components at offsets on the x-axis, shaped
+        (components, freqtime, offsets).
+        """
+        out = np.empty((len(components), nft, offsets.size), dtype=complex)
+        for c, (i, j) in enumerate(components):
+            response = bipole(
+                src=[0, 0, zsrc] + list(DIRECTIONS[j]),
+                rec=[offsets, np.zeros(offsets.size), zrec] +
+                list(DIRECTIONS[i]), **kwargs)
+            out[c] = np.asarray(response).reshape(nft, offsets.size)
+        return out
+
+    r = np.hypot(dx, dy)
+    phi = np.arctan2(dy, dx)
+    nonzero = r[r > 0]
+    rmin = nonzero.min() if nonzero.size else 1.0
+    u = np.log(np.clip(r, rmin, None))
+
+    unique = np.unique(u)
+    if unique.size <= nodes:
+        # few distinct offsets: compute them all
+        knots, G = unique, kernel(np.exp(unique))
+        error = 0.0
+        responses = G[:, :, np.searchsorted(knots, u)]
+    else:
+        knots = np.linspace(unique[0], unique[-1], nodes)
+        G = kernel(np.exp(knots))
+        todo = np.ones(knots.size - 1, dtype=bool)
+        error = 0.0
+        while todo.any():
+            idx = np.nonzero(todo)[0]
+            middle = (knots[idx] + knots[idx+1])/2
+            Gm = kernel(np.exp(middle))
+            spline = CubicSpline(knots, G, axis=-1)
+            scale = np.abs(Gm).max(axis=0)
+            diff = np.abs(spline(middle) - Gm).max(axis=0)
+            err = np.where(scale > 0, diff/np.where(scale > 0, scale, 1), 0)
+            err = err.max(axis=0)
+            bad = err > rtol
+            if knots.size + bad.sum() > max_nodes:
+                error = max(error, err.max())
+                break
+            if (~bad).any():
+                error = max(error, err[~bad].max())
+            new = np.concatenate([np.zeros(knots.size, dtype=bool),
+                                  np.ones(bad.sum(), dtype=bool)])
+            knots = np.concatenate([knots, middle[bad]])
+            G = np.concatenate([G, Gm[:, :, bad]], axis=-1)
+            order = np.argsort(knots, kind='mergesort')
+            knots, G, new = knots[order], G[:, :, order], new[order]
+            todo = new[:-1] | new[1:]
+        responses = CubicSpline(knots, G, axis=-1)(u)
+
+    # weights of each component at each receiver
+    s_rot, v_rot = _rotate(s, phi), _rotate(v, phi)
+    response = np.zeros((nft, r.size), dtype=complex)
+    for c, (i, j) in enumerate(components):
+        response += v_rot[i]*s_rot[j]*responses[c]
+    if kwargs.get('signal') is not None:
+        response = response.real
+    response = np.squeeze(response)
+    if full_output:
+        return response, np.exp(knots), error
+    return response
@@ -0,0 +1,98 @@
+'''
+AVO modelling of many two-layer models at once, as in Figure 4 of
+seismic_rock_physics_figures.py but for arrays of upper and lower layers,
+e.g. every node of a rock physics template or every realization of a Monte
+Carlo simulation.
+
+The reflectivity (Shuey, as bruges.reflection.shuey2) is computed for all
+angles with one broadcast. With a single interface the synthetic is the
+wavelet centred on the interface and scaled by the reflectivity, so the
+gathers are an outer product of the reflectivities with one convolved
+spike instead of one convolution per trace.
+'''
+import numpy as np
+
+# angles of incidence of Figure 4
+ANGLES = np.arange(31)
+
+
+def ricker(duration, dt, f):
+    '''
+    Ricker wavelet, as bruges.filters.ricker
+
+    INPUT
+    duration: length of the wavelet in s
+    dt: sample rate in s
+    f: peak frequency in Hz
+    '''
+    t = np.arange(-duration/2, duration/2, dt)
+    return (1 - 2*(np.pi*f*t)**2) * np.exp(-(np.pi*f*t)**2)
+
+
+def shuey(vp1, vs1, rho1, vp2, vs2, rho2, theta=ANGLES, terms=False):
+    '''
+    Shuey three-term reflectivity, as bruges.reflection.shuey2, for arrays
+    of interfaces and all angles at once
+
+    INPUT
+    vp1, vs1, rho1: upper layer, arrays of any (broadcastable) shape
+    vp2, vs2, rho2: lower layer
+    theta: angles of incidence in degrees
+    terms: return the intercept, gradient and curvature terms instead
+
+    OUTPUT
+    reflectivity with the shape of the layers plus an axis of angles, or
+    R0, G, F: arrays with the shape of the layers
+    '''
+    vp1, vs1, rho1, vp2, vs2, rho2 = (np.asarray(x, dtype=float) for x in
+                                      (vp1, vs1, rho1, vp2, vs2, rho2))
+    vp, vs, rho = (vp1+vp2)/2, (vs1+vs2)/2, (rho1+rho2)/2
+    dvp, dvs, drho = vp2-vp1, vs2-vs1, rho2-rho1
+    R0 = 0.5*(dvp/vp + drho/rho)
+    G = 0.5*dvp/vp - 2*(vs/vp)**2*(drho/rho + 2*dvs/vs)
+    F = 0.5*dvp/vp
+    if terms:
+        return R0, G, F
+    theta = np.radians(theta)
+    sin2 = np.sin(theta)**2
+    tan2 = np.tan(theta)**2
+    return R0[..., None] + G[..., None]*sin2 + F[..., None]*(tan2-sin2)
+
+
+def interfaces(upper, lower, theta=ANGLES, terms=False):
+    '''
+    shuey for layers given as dictionaries of VP, VS and RHO, e.g. the
+    output of template or monte_carlo.realize
+    '''
+    return shuey(upper['VP'], upper['VS'], upper['RHO'],
+                 lower['VP'], lower['VS'], lower['RHO'], theta, terms)
+
+
+def synthetics(rc, wavelet, n_samples=500, interface=None, dtype=float,
+               out=None):
+    '''
+    Synthetic traces of single interfaces
+
+    Each trace is what np.convolve(spike, wavelet, mode='same') gives for a
+    spike of amplitude rc at the interface, as in Figure 4.
+
+    INPUT
+    rc: array of reflectivities of any shape, e.g. (interfaces, angles)
+    wavelet: 1D array
+    n_samples: number of samples of the traces
+    interface: sample of the interface (default in the middle)
+    dtype: of the traces, e.g. np.float32 for many gathers
+    out: array of shape rc.shape + (n_samples,) to write the traces to
+
+    OUTPUT
+    array of the traces, time along the last axis
+    '''
+    if interface is None:
+        interface = n_samples // 2
+    spike = np.zeros(n_samples)
+    spike[interface] = 1
+    trace = np.convolve(spike, wavelet, mode='same').astype(dtype)
+    rc = np.asarray(rc, dtype=dtype)
+    if out is None:
+        out = np.empty(rc.shape + (n_samples,), dtype=dtype)
+    return np.multiply(rc[..., None], trace, out=out)
@@ -0,0 +1,161 @@
+'''
+Gassmann fluid substitution of every sample of well logs.
+
+The dry rock moduli are inverted from the VP, VS and RHO logs with the
+in situ fluid, then the rock is saturated with each fluid scenario (e.g.
+brine, oil and gas) at once, with vels of rock_physics.py. Logs are read
+from and written to csv files like qsiwell5.csv, with the results as new
+columns, and many wells can be processed over several processes.
+'''
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from rock_physics import MINERALS, FLUIDS, vrh, vels
+
+# fluid scenarios: bulk modulus (GPa) and density (g/cc)
+SCENARIOS = {'brine': (FLUIDS['K_b'], FLUIDS['RHO_b']),
+             'oil': (FLUIDS['K_o'], FLUIDS['RHO_o']),
+             'gas': (FLUIDS['K_g'], FLUIDS['RHO_g'])}
+
+
+def dry_moduli(vp, vs, rho, K0, Kf, phi):
+    '''
+    Dry rock moduli from the saturated rock by inverting Gassmann equation
+
+    INPUT
+    vp, vs: velocities in m/s
+    rho: density in g/cc
+    K0: mineral bulk modulus in GPa
+    Kf: in situ fluid bulk modulus in GPa
+    phi: porosity
+
+    OUTPUT
+    K_DRY, G_DRY: dry rock bulk & shear modulus in GPa
+    '''
+    G_DRY = rho*(vs/1e3)**2
+    K_SAT = rho*(vp/1e3)**2 - 4./3*G_DRY
+    a = phi*K0/Kf + 1 - phi
+    K_DRY = (K_SAT*a - K0) / (a + K_SAT/K0 - 2)
+    return K_DRY, G_DRY
+
+
+def substitute(logs, scenarios=None, K_insitu=FLUIDS['K_b'], minerals=None,
+               where=None):
+    '''
+    Fluid substitution of all the samples of a well into many fluids
+
+    The mineral bulk modulus mixes shale and quartz (vrh) in proportion
+    VSH and the in situ fluid density is RHOf, so that the density of each
+    scenario is RHO + PHIE*(Df - RHOf) and a scenario of the in situ fluid
+    gives back the logs. Samples without porosity, outside *where*, or
+    whose dry rock bulk modulus is not between 0 and the mineral modulus
+    (the logs do not fit Gassmann equation there, e.g. at very low
+    porosity) keep their log values.
+
+    INPUT
+    logs: DataFrame (or dictionary of arrays) with VP, VS, RHO, PHIE, VSH
+          and RHOf
+    scenarios: dictionary of the bulk modulus (GPa) and density (g/cc) of
+               each fluid, defaults to SCENARIOS
+    K_insitu: bulk modulus of the in situ fluid in GPa (default brine), a
+              number, an array or the name of a column of logs
+    minerals: moduli of quartz and shale, updates MINERALS
+    where: boolean array, the samples to substitute (e.g. sands only)
+
+    OUTPUT
+    dictionary of arrays of shape (scenarios, samples) with VP, VS, RHO,
+    the scenario names under 'scenarios' and the samples that kept their
+    log values under 'kept'
+    '''
+    if scenarios is None:
+        scenarios = SCENARIOS
+    if isinstance(K_insitu, str):
+        K_insitu = logs[K_insitu]
+    K_insitu = np.asarray(K_insitu, dtype=float)
+    m = dict(MINERALS, **(minerals or {}))
+    vp, vs, rho, phi, vsh, rhof = (np.asarray(logs[name], dtype=float)
+                                   for name in ('VP', 'VS', 'RHO', 'PHIE',
+                                                'VSH', 'RHOf'))
+    _, _, K0 = vrh(vsh, m['K_sh'], m['K_qz'])
+    Kdry, Gdry = dry_moduli(vp, vs, rho, K0, K_insitu, phi)
+    keep = (phi <= 0) | ~((Kdry > 0) & (Kdry < K0))
+    if where is not None:
+        keep |= ~np.asarray(where)
+    # mineral density of the logs, so that vels gives back RHO with RHOf
+    rho0 = (rho - phi*rhof) / (1 - phi)
+    names = sorted(scenarios)
+    # one row per scenario, broadcast against the samples
+    Kf = np.array([scenarios[name][0] for name in names])[:, None]
+    Df = np.array([scenarios[name][1] for name in names])[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vp_new, vs_new, rho_new, _ = vels(Kdry, Gdry, K0, rho0, Kf, Df, phi)
+    results = {'scenarios': names, 'kept': keep}
+    for name, new, old in [('VP', vp_new, vp), ('VS', vs_new, vs),
+                           ('RHO', rho_new, rho)]:
+        results[name] = np.where(keep, old, new)
+    return results
+
+
+def substitute_file(fname, out, scenarios=None, K_insitu=FLUIDS['K_b'],
+                    minerals=None, vsh_cutoff=None):
+    '''
+    Fluid substitution of a csv file of logs like qsiwell5.csv
+
+    Adds the columns VP_<fluid>, VS_<fluid>, RHO_<fluid>, IP_<fluid> and
+    VPVS_<fluid> for each scenario and writes the logs to *out*.
+
+    INPUT
+    fname, out: input and output csv files
+    scenarios, K_insitu, minerals: see substitute
+    vsh_cutoff: only substitute samples with VSH up to this value
+    '''
+    L = pd.read_csv(fname, index_col=0)
+    where = None if vsh_cutoff is None else L.VSH.values <= vsh_cutoff
+    results = substitute(L, scenarios, K_insitu, minerals, where)
+    columns = {}
+    for i, fluid in enumerate(results['scenarios']):
+        vp, vs, rho = (results[name][i] for name in ('VP', 'VS', 'RHO'))
+        columns.update({'VP_'+fluid: vp, 'VS_'+fluid: vs,
+                        'RHO_'+fluid: rho, 'IP_'+fluid: vp*rho,
+                        'VPVS_'+fluid: vp/vs})
+    L = L.assign(**columns)
+    L.to_csv(out)
+    return out
+
+
+def substitute_wells(fnames, out_dir, n_processes=1, **kwargs):
+    '''
+    Fluid substitution of many csv files of logs with substitute_file
+
+    INPUT
+    fnames: list of csv files
+    out_dir: directory of the output files, which keep their names
+    n_processes: process this many wells at the same time
+    **kwargs: passed on to substitute_file
+
+    OUTPUT
+    list of the output files
+    '''
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    tasks = [(fname, os.path.join(out_dir, os.path.basename(fname)), kwargs)
+             for fname in fnames]
+    if n_processes == 1 or len(tasks) <= 1:
+        return [_substitute_task(task) for task in tasks]
+    pool = multiprocessing.Pool(n_processes)
+    try:
+        return pool.map(_substitute_task, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _substitute_task(task):
+    '''
+    substitute_file for a process pool
+    '''
+    fname, out, kwargs = task
+    return substitute_file(fname, out, **kwargs)
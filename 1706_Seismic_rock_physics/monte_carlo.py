@@ -0,0 +1,201 @@
+'''
+Monte Carlo simulation of the rock physics models of rock_physics.py.
+
+Instead of a single set of parameters (Cn=12, P=45, f=.3, ...) as in the
+figures, each parameter can be drawn from a distribution. Realizations are
+made and evaluated a chunk at a time, optionally over several processes,
+and only summary statistics (histograms and moments of Ip, Vp/Vs, ...) are
+kept, so the number of realizations is not limited by memory. Every chunk
+has its own random stream spawned from the seed, so the results don't
+depend on the number of processes.
+'''
+import multiprocessing
+
+import numpy as np
+
+from rock_physics import MINERALS, FLUIDS, MODELS, vrh, vels
+
+# parameters of a realization, with the values of the gas sand of Figure 4
+# (where the 0.8 passed to vrh as vsh is the fraction of quartz)
+DEFAULTS = dict(MINERALS, K_hc=FLUIDS['K_g'], RHO_hc=FLUIDS['RHO_g'],
+                K_b=FLUIDS['K_b'], RHO_b=FLUIDS['RHO_b'],
+                phi=0.15, vsh=0.2, sw=0.0, phic=0.5, Cn=12, P=45, f=0.3)
+
+# histogram bins of the outputs
+BINS = {'IP': np.linspace(1e3, 12e3, 221),
+        'VPVS': np.linspace(1.5, 3, 151),
+        'VP': np.linspace(1e3, 6e3, 201),
+        'VS': np.linspace(0, 4e3, 201),
+        'RHO': np.linspace(1.5, 3, 151)}
+
+
+def draw(params, size, rng):
+    '''
+    Draws realizations of the parameters
+
+    INPUT
+    params: dictionary of parameters, updating DEFAULTS; each value is
+            either a number (a constant) or a tuple with the name of a
+            method of numpy.random.Generator and its arguments, e.g.
+            ('normal', 37, 2) or ('uniform', 6, 12)
+    size: number of realizations
+    rng: numpy.random.Generator
+
+    OUTPUT
+    dictionary with an array of realizations for each parameter
+    (constants are repeated size times)
+    '''
+    samples = {}
+    for name, value in sorted(dict(DEFAULTS, **params).items()):
+        if isinstance(value, tuple):
+            samples[name] = getattr(rng, value[0])(*value[1:], size=size)
+        else:
+            samples[name] = np.full(size, value, dtype=float)
+    return samples
+
+
+def realize(samples, model='soft'):
+    '''
+    Elastic properties of realizations of the parameters
+
+    Shale and quartz are mixed with vrh in proportion vsh, the dry rock
+    comes from the soft or stiff sand model and it is saturated with a
+    mix (vrh) of brine and hydrocarbon in proportion sw, as in rpt().
+    The models don't hold for porosities below 0 or above critical (phic),
+    whose realizations are set to NaN.
+
+    INPUT
+    samples: dictionary of parameters, as given by draw
+    model: 'soft' or 'stiff' sand
+
+    OUTPUT
+    dictionary with arrays of VP, VS, RHO, IP and VPVS
+    '''
+    s = samples
+    _, _, K0 = vrh(s['vsh'], s['K_sh'], s['K_qz'])
+    _, _, MU0 = vrh(s['vsh'], s['MU_sh'], s['MU_qz'])
+    RHO0 = s['vsh']*s['RHO_sh'] + (1-s['vsh'])*s['RHO_qz']
+    _, K_f, _ = vrh(s['sw'], s['K_b'], s['K_hc'])
+    RHO_f = s['sw']*s['RHO_b'] + (1-s['sw'])*s['RHO_hc']
+    Kdry, MUdry = MODELS[model](K0, MU0, s['phi'], s['phic'], s['Cn'],
+                                s['P'], s['f'])
+    vp, vs, rho, _ = vels(Kdry, MUdry, K0, RHO0, K_f, RHO_f, s['phi'])
+    outside = (s['phi'] < 0) | (s['phi'] > s['phic'])
+    vp, vs, rho = (np.where(outside, np.nan, x) for x in (vp, vs, rho))
+    return {'VP': vp, 'VS': vs, 'RHO': rho, 'IP': vp*rho, 'VPVS': vp/vs}
+
+
+def summarize(results, bins):
+    '''
+    Histograms and moments of a chunk of realizations; NaNs (e.g. from
+    porosities above critical, see realize) and finite values outside the
+    bins are counted apart
+    '''
+    summary = {}
+    for name, edges in bins.items():
+        values = np.ravel(results[name])
+        finite = np.isfinite(values)
+        values = values[finite]
+        hist = np.histogram(values, edges)[0]
+        summary[name] = {'hist': hist,
+                         'count': values.size,
+                         'outside': values.size - hist.sum(),
+                         'nan': finite.size - values.size,
+                         'sum': values.sum(),
+                         'sum2': (values**2).sum()}
+    if 'IP' in bins and 'VPVS' in bins:
+        ip, vpvs = np.ravel(results['IP']), np.ravel(results['VPVS'])
+        finite = np.isfinite(ip) & np.isfinite(vpvs)
+        summary['IP_VPVS'] = np.histogram2d(
+            ip[finite], vpvs[finite], [bins['IP'], bins['VPVS']])[0]
+    return summary
+
+
+def merge(total, summary):
+    '''
+    Adds the summary of a chunk to the running total
+    '''
+    if total is None:
+        return summary
+    for name, value in summary.items():
+        if isinstance(value, dict):
+            for key in value:
+                total[name][key] = total[name][key] + value[key]
+        else:
+            total[name] = total[name] + value
+    return total
+
+
+def simulate(params, n, model='soft', seed=0, bins=None, chunk_size=100000,
+             n_processes=1):
+    '''
+    Monte Carlo simulation of the rock physics model
+
+    INPUT
+    params: distributions of the parameters (see draw)
+    n: number of realizations
+    model: 'soft' or 'stiff' sand
+    seed: seed of the random streams; the results only depend on it, n
+          and chunk_size (not on n_processes)
+    bins: dictionary of the histogram edges of each output to keep,
+          defaults to BINS for IP and VPVS
+    chunk_size: number of realizations evaluated at once
+    n_processes: evaluate the chunks over this many processes
+
+    OUTPUT
+    dictionary with, for each output: 'hist' (counts in each bin), 'edges',
+    'count' (finite realizations), 'outside' (finite realizations out of
+    the edges, not in hist), 'nan', 'mean' and 'std'; and under
+    'IP_VPVS' the joint histogram of IP and VPVS when both are kept
+    '''
+    if bins is None:
+        bins = {name: BINS[name] for name in ('IP', 'VPVS')}
+    nchunks = -(-n // chunk_size)
+    streams = np.random.SeedSequence(seed).spawn(nchunks)
+    tasks = [(min(chunk_size, n - i*chunk_size), stream)
+             for i, stream in enumerate(streams)]
+    setup = (params, model, bins)
+    total = None
+    if n_processes == 1 or nchunks == 1:
+        _init_mc_worker(setup)
+        for task in tasks:
+            total = merge(total, _mc_chunk(task))
+    else:
+        pool = multiprocessing.Pool(n_processes, initializer=_init_mc_worker,
+                                    initargs=(setup,))
+        try:
+            # in order, so that the sums don't depend on the scheduling
+            for summary in pool.imap(_mc_chunk, tasks):
+                total = merge(total, summary)
+        finally:
+            pool.close()
+            pool.join()
+    for name, edges in bins.items():
+        stats = total[name]
+        count = max(stats['count'], 1)
+        stats['edges'] = edges
+        stats['mean'] = stats['sum']/count
+        stats['std'] = np.sqrt(max(stats['sum2']/count - stats['mean']**2, 0))
+    return total
+
+
+_mc_setup = None
+
+
+def _init_mc_worker(setup):
+    '''
+    Keeps the distributions, model and bins in each process
+    '''
+    global _mc_setup
+    _mc_setup = setup
+
+
+def _mc_chunk(task):
+    '''
+    Draws, evaluates and summarizes a chunk of realizations
+    '''
+    size, stream = task
+    params, model, bins = _mc_setup
+    samples = draw(params, size, np.random.default_rng(stream))
+    results = realize(samples, model)
+    return summarize(results, bins)
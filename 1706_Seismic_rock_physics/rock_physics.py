@@ -0,0 +1,257 @@
+'''
+Rock physics models of seismic_rock_physics_figures.py, usable on arrays
+of any shape, and rock physics templates over dense grids of porosity,
+water saturation, shale volume and pressure.
+
+Only numpy is imported, so the models can be used without the plotting
+and data loading of the figures. The curves and templates drawn in the
+figures are cached by their parameters (curve and rpt_grid).
+'''
+import functools
+
+import numpy as np
+
+# elastic moduli (GPa) and densities (g/cc) used in the figures
+MINERALS = {'K_qz': 37, 'MU_qz': 44, 'RHO_qz': 2.6,
+            'K_sh': 15, 'MU_sh': 5, 'RHO_sh': 2.8}
+FLUIDS = {'K_b': 2.8, 'RHO_b': 1.1,
+          'K_o': 0.9, 'RHO_o': 0.8,
+          'K_g': 0.06, 'RHO_g': 0.2}
+
+
+def vrh(f, M1, M2):
+    '''
+    Simple Voigt-Reuss-Hill bounds for 2-components mixture, (C) aadm 2017
+
+    INPUT
+    f: volumetric fraction of mineral 1
+    M1: elastic modulus mineral 1
+    M2: elastic modulus mineral 2
+
+    OUTPUT
+    M_Voigt: upper bound or Voigt average
+    M_Reuss: lower bound or Reuss average
+    M_VRH: Voigt-Reuss-Hill average
+    '''
+    M_Voigt = f*M1 + (1-f)*M2
+    M_Reuss = 1 / (f/M1 + (1-f)/M2)
+    M_VRH = (M_Voigt+M_Reuss)/2
+    return M_Voigt, M_Reuss, M_VRH
+
+
+def vels(K_DRY, G_DRY, K0, D0, Kf, Df, phi):
+    '''
+    Calculates velocities and densities of saturated rock via Gassmann
+    equation, (C) aadm 2015
+
+    INPUT
+    K_DRY, G_DRY: dry rock bulk & shear modulus in GPa
+    K0, D0: mineral bulk modulus and density in GPa
+    Kf, Df: fluid bulk modulus and density in GPa
+    phi: porosity
+    '''
+    rho = D0*(1-phi)+Df*phi
+    K = K_DRY + (1-K_DRY/K0)**2 / ((phi/Kf) + ((1-phi)/K0) - (K_DRY/K0**2))
+    vp = np.sqrt((K+4./3*G_DRY)/rho)*1e3
+    vs = np.sqrt(G_DRY/rho)*1e3
+    return vp, vs, rho, K
+
+
+def hertzmindlin(K0, G0, phi, phic=0.4, Cn=8.6, P=10, f=1):
+    '''
+    Hertz-Mindlin model
+    written by aadm (2015) from Rock Physics Handbook, p.246
+
+    INPUT
+    K0, G0: mineral bulk & shear modulus in GPa
+    phi: porosity
+    phic: critical porosity (default 0.4)
+    Cn: coordination nnumber (default 8.6)
+    P: confining pressure in MPa (default 10)
+    f: shear modulus correction factor
+       1 = dry pack with perfect adhesion
+       0 = dry frictionless pack
+    '''
+    P = P / 1e3  # converts pressure in same units as solid moduli (GPa)
+    PR0 = (3*K0-2*G0)/(6*K0+2*G0)  # poisson's ratio of mineral mixture
+    K_HM = (P*(Cn**2*(1-phic)**2*G0**2) / (18*np.pi**2*(1-PR0)**2))**(1/3)
+    G_HM = ((2+3*f-PR0*(1+3*f))/(5*(2-PR0))) * ((P*(3*Cn**2*(1-phic)**2*G0**2)/(2*np.pi**2*(1-PR0)**2)))**(1/3)
+    return K_HM, G_HM
+
+
+def softsand(K0, G0, phi, phic=0.4, Cn=8.6, P=10, f=1):
+    '''
+    Soft-sand (uncemented) model
+    written by aadm (2015) from Rock Physics Handbook, p.258
+
+    INPUT
+    K0, G0: mineral bulk & shear modulus in GPa
+    phi: porosity
+    phic: critical porosity (default 0.4)
+    Cn: coordination nnumber (default 8.6)
+    P: confining pressure in MPa (default 10)
+    f: shear modulus correction factor
+       1 = dry pack with perfect adhesion
+       0 = dry frictionless pack
+    '''
+    K_HM, G_HM = hertzmindlin(K0, G0, phi, phic, Cn, P, f)
+    K_DRY = -4/3*G_HM + (((phi/phic)/(K_HM+4/3*G_HM)) + ((1-phi/phic)/(K0+4/3*G_HM)))**-1
+    tmp = G_HM/6*((9*K_HM+8*G_HM) / (K_HM+2*G_HM))
+    G_DRY = -tmp + ((phi/phic)/(G_HM+tmp) + ((1-phi/phic)/(G0+tmp)))**-1
+    return K_DRY, G_DRY
+
+
+def stiffsand(K0, G0, phi, phic=0.4, Cn=8.6, P=10, f=1):
+    '''
+    Stiff-sand model
+    written by aadm (2015) from Rock Physics Handbook, p.260
+
+    INPUT
+    K0, G0: mineral bulk & shear modulus in GPa
+    phi: porosity
+    phic: critical porosity (default 0.4)
+    Cn: coordination nnumber (default 8.6)
+    P: confining pressure in MPa (default 10)
+    f: shear modulus correction factor
+       1 = dry pack with perfect adhesion
+       0 = dry frictionless pack
+    '''
+    K_HM, G_HM = hertzmindlin(K0, G0, phi, phic, Cn, P, f)
+    K_DRY = -4/3*G0 + (((phi/phic)/(K_HM+4/3*G0)) + ((1-phi/phic)/(K0+4/3*G0)))**-1
+    tmp = G0/6*((9*K0+8*G0) / (K0+2*G0))
+    G_DRY = -tmp + ((phi/phic)/(G_HM+tmp) + ((1-phi/phic)/(G0+tmp)))**-1
+    return K_DRY, G_DRY
+
+
+MODELS = {'soft': softsand, 'stiff': stiffsand}
+
+# outputs of template
+OUTPUTS = ('VP', 'VS', 'RHO', 'IP', 'VPVS')
+
+
+def template(phi, sw, vsh=0.0, P=10, model='soft', fluid='gas', phic=0.4,
+             Cn=8, f=1, minerals=None, fluids=None,
+             outputs=('IP', 'VPVS'), dtype=float, chunk_size=2**20):
+    '''
+    Rock physics template on the grid of all combinations of porosity,
+    water saturation, shale volume and pressure
+
+    Does what rpt() of seismic_rock_physics_figures.py does for a 10x10
+    grid of phi and sw, for grids of any size. The dry rock moduli are
+    calculated once for each phi, vsh and P and saturated with all sw at
+    once. The grid is evaluated a block of porosities at a time so that
+    the temporary arrays stay around chunk_size points.
+
+    INPUT
+    phi, sw, vsh, P: 1D arrays (or scalars) of porosity, water saturation,
+                     shale volume and confining pressure in MPa
+    model: 'soft' or 'stiff' sand
+    fluid: hydrocarbon, 'gas' or 'oil'
+    phic, Cn, f: critical porosity, coordination number and shear
+                 modulus correction factor (see hertzmindlin)
+    minerals: moduli and densities of quartz and shale, updates MINERALS
+    fluids: moduli and densities of brine, oil and gas, updates FLUIDS
+    outputs: any of 'VP', 'VS', 'RHO', 'IP', 'VPVS'
+    dtype: of the outputs, e.g. np.float32 for very large grids
+    chunk_size: number of grid points evaluated at once
+
+    OUTPUT
+    dictionary of the outputs, arrays of shape (phi, sw, vsh, P), with
+    the coordinates of the grid under 'phi', 'sw', 'vsh', 'P' and the order
+    of the axes under 'dims'
+    '''
+    if model not in MODELS:
+        raise ValueError("model must be 'soft' or 'stiff', not {!r}".format(
+            model))
+    if fluid not in ('gas', 'oil'):
+        raise ValueError("fluid must be 'gas' or 'oil', not {!r}".format(
+            fluid))
+    unknown = [name for name in outputs if name not in OUTPUTS]
+    if unknown:
+        raise ValueError("unknown outputs {}, must be among {}".format(
+            unknown, OUTPUTS))
+    m = dict(MINERALS, **(minerals or {}))
+    fl = dict(FLUIDS, **(fluids or {}))
+    K_hc, RHO_hc = ((fl['K_g'], fl['RHO_g']) if fluid == 'gas'
+                    else (fl['K_o'], fl['RHO_o']))
+    phi, sw, vsh, P = (np.atleast_1d(np.asarray(x, dtype=float))
+                       for x in (phi, sw, vsh, P))
+    shape = (phi.size, sw.size, vsh.size, P.size)
+    # one axis per parameter, broadcast against each other
+    sw_ = sw[:, None, None]
+    vsh_ = vsh[:, None]
+    _, K_f, _ = vrh(sw_, fl['K_b'], K_hc)
+    RHO_f = sw_*fl['RHO_b'] + (1-sw_)*RHO_hc
+    _, _, K0 = vrh(vsh_, m['K_sh'], m['K_qz'])
+    _, _, MU0 = vrh(vsh_, m['MU_sh'], m['MU_qz'])
+    RHO0 = vsh_*m['RHO_sh'] + (1-vsh_)*m['RHO_qz']
+
+    result = {name: np.empty(shape, dtype=dtype) for name in outputs}
+    rows = max(1, chunk_size // (shape[1]*shape[2]*shape[3]))
+    for start in range(0, phi.size, rows):
+        phi_ = phi[start:start+rows, None, None, None]
+        Kdry, MUdry = MODELS[model](K0, MU0, phi_, phic, Cn, P, f)
+        vp, vs, rho, _ = vels(Kdry, MUdry, K0, RHO0, K_f, RHO_f, phi_)
+        values = {'VP': lambda: vp, 'VS': lambda: vs, 'RHO': lambda: rho,
+                  'IP': lambda: vp*rho, 'VPVS': lambda: vp/vs}
+        for name in outputs:
+            result[name][start:start+rows] = values[name]()
+    result.update(phi=phi, sw=sw, vsh=vsh, P=P,
+                  dims=('phi', 'sw', 'vsh', 'P'))
+    return result
+
+
+@functools.lru_cache(maxsize=256)
+def curve(model='soft', phi=(0.01, 0.4, 50), vsh=0.0, fluid='brine',
+          phic=0.4, Cn=8, P=10, f=1):
+    '''
+    Velocities and density of a rock physics model along porosity, cached
+    by the parameters
+
+    INPUT
+    model: 'soft' or 'stiff' sand
+    phi: start, stop and number of porosities (as np.linspace)
+    vsh: shale volume (1 - N:G)
+    fluid: 'brine', 'oil' or 'gas'
+    phic, Cn, P, f: see hertzmindlin
+
+    OUTPUT
+    dictionary of read-only arrays of PHI, VP, VS, RHO
+    '''
+    key = {'brine': 'b', 'oil': 'o', 'gas': 'g'}[fluid]
+    K_f, RHO_f = FLUIDS['K_'+key], FLUIDS['RHO_'+key]
+    m = MINERALS
+    phi = np.linspace(*phi)
+    _, _, K0 = vrh(vsh, m['K_sh'], m['K_qz'])
+    _, _, MU0 = vrh(vsh, m['MU_sh'], m['MU_qz'])
+    RHO0 = vsh*m['RHO_sh'] + (1-vsh)*m['RHO_qz']
+    Kdry, MUdry = MODELS[model](K0, MU0, phi, phic, Cn, P, f)
+    vp, vs, rho, _ = vels(Kdry, MUdry, K0, RHO0, K_f, RHO_f, phi)
+    return _read_only({'PHI': phi, 'VP': vp, 'VS': vs, 'RHO': rho})
+
+
+@functools.lru_cache(maxsize=64)
+def rpt_grid(model='soft', vsh=0.0, fluid='gas', phic=0.4, Cn=8, P=10, f=1,
+             n=10):
+    '''
+    The rock physics template of rpt() in the figures script, n porosities
+    from 0.01 to phic by n water saturations from 0 to 1, cached by the
+    parameters
+
+    OUTPUT
+    dictionary of read-only arrays of PHI, SW (1D) and IP, VPVS (n x n)
+    '''
+    phi = np.linspace(0.01, phic, n)
+    sw = np.linspace(0, 1, n)
+    rpt = template(phi, sw, vsh, P, model, fluid, phic, Cn, f)
+    return _read_only({'PHI': phi, 'SW': sw, 'IP': rpt['IP'][:, :, 0, 0],
+                       'VPVS': rpt['VPVS'][:, :, 0, 0]})
+
+
+def _read_only(arrays):
+    '''
+    Makes cached arrays read-only, so they can't be changed by the callers
+    '''
+    for a in arrays.values():
+        a.flags.writeable = False
+    return arrays
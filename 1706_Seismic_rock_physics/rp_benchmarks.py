@@ -0,0 +1,296 @@
+'''
+Timing benchmarks for the rock physics modules.
+
+Run all of them with
+
+    python rp_benchmarks.py
+'''
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from rock_physics import (MINERALS, FLUIDS, vrh, vels, softsand, template,
+                          curve, rpt_grid)
+from monte_carlo import simulate
+from fluid_substitution import SCENARIOS, dry_moduli, substitute, \
+    substitute_wells
+from avo import ANGLES, ricker, shuey, interfaces, synthetics
+from well_store import WellLogs
+
+
+def rpt_loop(phi, sw, vsh, P, phic=0.5, Cn=12, f=.3):
+    '''
+    Soft sand, oil template computed as rpt() of the figures script does,
+    one sw at a time, repeated for every vsh and P
+    '''
+    m, fl = MINERALS, FLUIDS
+    ip = np.empty((phi.size, sw.size, vsh.size, P.size))
+    vpvs = np.empty_like(ip)
+    for k, v in enumerate(vsh):
+        _, _, K0 = vrh(v, m['K_sh'], m['K_qz'])
+        _, _, MU0 = vrh(v, m['MU_sh'], m['MU_qz'])
+        RHO0 = v*m['RHO_sh']+(1-v)*m['RHO_qz']
+        for l, p in enumerate(P):
+            Kdry, MUdry = softsand(K0, MU0, phi, phic, Cn, p, f)
+            for i, val in enumerate(sw):
+                _, K_f, _ = vrh(val, fl['K_b'], fl['K_o'])
+                RHO_f = val*fl['RHO_b'] + (1-val)*fl['RHO_o']
+                vp, vs, rho, _ = vels(Kdry, MUdry, K0, RHO0, K_f, RHO_f, phi)
+                ip[:, i, k, l] = vp*rho
+                vpvs[:, i, k, l] = vp/vs
+    return ip, vpvs
+
+
+def bench_template(sizes=((10, 10, 1, 1), (50, 50, 10, 10),
+                          (100, 100, 20, 50))):
+    '''
+    Throughput, in grid points per second, of template and of the rpt()
+    loop over sw (repeated for each vsh and P) on grids of phi, sw, vsh
+    and P of increasing size.
+    '''
+    print('{:>22s} {:>16s} {:>16s} {:>12s}'.format(
+        'grid', 'rpt loop (pt/s)', 'template (pt/s)', 'difference'))
+    for size in sizes:
+        phi = np.linspace(0.01, 0.5, size[0])
+        sw = np.linspace(0, 1, size[1])
+        vsh = np.linspace(0, 0.8, size[2])
+        P = np.linspace(10, 50, size[3])
+        npoints = np.prod(size)
+        start = time.time()
+        ip, vpvs = rpt_loop(phi, sw, vsh, P)
+        loop = npoints/(time.time() - start)
+        start = time.time()
+        rpt = template(phi, sw, vsh, P, model='soft', fluid='oil', phic=.5,
+                       Cn=12, f=.3)
+        vectorized = npoints/(time.time() - start)
+        print('{:>22s} {:>16.0f} {:>16.0f} {:>12.1e}'.format(
+            'x'.join(str(n) for n in size), loop, vectorized,
+            np.abs(rpt['IP'] - ip).max()/np.abs(ip).max()))
+
+
+def bench_monte_carlo(n=2*10**6, n_processes=None, chunk_size=100000):
+    '''
+    Throughput, in realizations per second, and peak traced memory of
+    simulate with uncertain mineral moduli, coordination number, pressure,
+    porosity and saturation, against keeping all the realizations (which
+    would take about 5 arrays of n values).
+    '''
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    params = {'K_qz': ('normal', 37, 2), 'MU_qz': ('normal', 44, 3),
+              'Cn': ('uniform', 6, 12), 'P': ('uniform', 20, 50),
+              'phi': ('uniform', 0.05, 0.35), 'sw': ('uniform', 0, 1),
+              'K_hc': ('uniform', 0.04, 0.9)}
+    print('{:>22s} {:>16s} {:>12s} {:>12s} {:>10s}'.format(
+        '', 'realizations/s', 'peak (MB)', 'all (MB)', 'mean Ip'))
+    for nproc in sorted(set([1, n_processes])):
+        tracemalloc.start()
+        start = time.time()
+        summary = simulate(params, n, seed=1, chunk_size=chunk_size,
+                           n_processes=nproc)
+        elapsed = time.time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('{:>22s} {:>16.0f} {:>12.1f} {:>12.1f} {:>10.1f}'.format(
+            '{} proc'.format(nproc), n/elapsed, peak/1e6, 5*8*n/1e6,
+            summary['IP']['mean']))
+
+
+def substitute_loop(L, K_insitu=FLUIDS['K_b']):
+    '''
+    Fluid substitution one sample and one fluid at a time
+    '''
+    m = MINERALS
+    names = sorted(SCENARIOS)
+    vp_new = np.empty((len(names), len(L)))
+    for j, (vp, vs, rho, phi, vsh, rhof) in enumerate(
+            zip(L.VP, L.VS, L.RHO, L.PHIE, L.VSH, L.RHOf)):
+        _, _, K0 = vrh(vsh, m['K_sh'], m['K_qz'])
+        Kdry, Gdry = dry_moduli(vp, vs, rho, K0, K_insitu, phi)
+        rho0 = (rho - phi*rhof) / (1 - phi)
+        for i, name in enumerate(names):
+            Kf, Df = SCENARIOS[name]
+            vp_new[i, j] = vels(Kdry, Gdry, K0, rho0, Kf, Df, phi)[0] \
+                if phi > 0 and 0 < Kdry < K0 else vp
+    return vp_new
+
+
+def bench_fluid_substitution(fname='qsiwell5.csv', nwells=8,
+                             n_processes=None):
+    '''
+    Throughput, in samples per second, of substitute and of a loop over the
+    samples of qsiwell5.csv; and in wells per second of substitute_wells on
+    nwells copies of it.
+    '''
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    L = pd.read_csv(fname, index_col=0)
+    start = time.time()
+    loop = substitute_loop(L)
+    t_loop = time.time() - start
+    start = time.time()
+    vp = substitute(L)['VP']
+    t_vec = time.time() - start
+    print('{:>22s} {:>16s} {:>16s} {:>12s}'.format(
+        '', 'loop (smp/s)', 'vector (smp/s)', 'difference'))
+    print('{:>22s} {:>16.0f} {:>16.0f} {:>12.1e}'.format(
+        '{} samples'.format(len(L)), len(L)/t_loop, len(L)/t_vec,
+        np.nanmax(np.abs(vp - loop)/loop)))
+    tmp = tempfile.mkdtemp()
+    try:
+        fnames = []
+        for i in range(nwells):
+            fnames.append(os.path.join(tmp, 'well{}.csv'.format(i)))
+            shutil.copy(fname, fnames[-1])
+        print('{:>22s} {:>16s}'.format('', 'wells/s'))
+        for nproc in sorted(set([1, n_processes])):
+            start = time.time()
+            substitute_wells(fnames, os.path.join(tmp, 'out'),
+                             n_processes=nproc)
+            print('{:>22s} {:>16.1f}'.format(
+                '{} proc'.format(nproc), nwells/(time.time() - start)))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def avo_loop(upper, lower, wavelet, n_samples=500):
+    '''
+    Reflectivity and near and far synthetics of one interface at a time,
+    as Figure 4 of the figures script does
+    '''
+    interface = n_samples // 2
+    nmodels = lower['VP'].size
+    avo = np.empty((nmodels, ANGLES.size))
+    synt = np.empty((nmodels, 2, n_samples))
+    for i, (vp1, vs1, rho1) in enumerate(
+            zip(lower['VP'].flat, lower['VS'].flat, lower['RHO'].flat)):
+        avo[i] = shuey(upper['VP'], upper['VS'], upper['RHO'],
+                       vp1, vs1, rho1)
+        for j, k in enumerate((0, -1)):
+            rc = np.zeros(n_samples)
+            rc[interface] = avo[i, k]
+            synt[i, j] = np.convolve(rc, wavelet, mode='same')
+    return avo, synt
+
+
+def bench_avo(fname='qsiwell5.csv', sizes=((50, 20), (100, 100),
+                                          (1000, 100))):
+    '''
+    Throughput, in interfaces per minute, of interfaces (all angles) and
+    synthetics (near and far traces) for the gas sand templates of grids
+    of phi and sw under the average shale of qsiwell5.csv, against the
+    loop over the interfaces of Figure 4 on the smallest grid.
+    '''
+    L = pd.read_csv(fname, index_col=0)
+    sh = (L.index >= 2100) & (L.index <= 2250) & (L.VSH >= 0.5)
+    upper = L[['VP', 'VS', 'RHO']][sh].mean()
+    wavelet = ricker(.25, 0.001, 25)
+    print('{:>22s} {:>16s} {:>16s} {:>16s}'.format(
+        'grid', 'loop (/min)', 'avo (/min)', 'avo+synt (/min)'))
+    for size in sizes:
+        lower = template(np.linspace(0.01, 0.4, size[0]),
+                         np.linspace(0, 1, size[1]), 0.2, 45, phic=.5, Cn=12,
+                         f=.3, outputs=('VP', 'VS', 'RHO'))
+        n = lower['VP'].size
+        if size == sizes[0]:
+            start = time.time()
+            avo_loop(upper, lower, wavelet)
+            loop = '{:16.3g}'.format(60*n/(time.time() - start))
+        else:
+            loop = ''
+        start = time.time()
+        avo = interfaces(upper, lower)
+        t_avo = time.time() - start
+        synthetics(avo[..., [0, -1]], wavelet, dtype=np.float32)
+        t_synt = time.time() - start
+        print('{:>22s} {:>16s} {:16.3g} {:16.3g}'.format(
+            'x'.join(str(x) for x in size), loop, 60*n/t_avo, 60*n/t_synt))
+
+
+def bench_import(repeat=5):
+    '''
+    Time to import rock_physics, the figures script (with matplotlib) and
+    pandas and matplotlib, each in a new interpreter; then the latency of
+    the models of the figures computed and taken from the cache.
+    '''
+    statements = {'rock_physics': 'import rock_physics',
+                  'figures script': 'import seismic_rock_physics_figures',
+                  'pandas + matplotlib': 'import pandas, matplotlib.pyplot'}
+    env = dict(os.environ, MPLBACKEND='Agg',
+               PYTHONPATH=os.pathsep.join(['.', 'manuscript']))
+    print('{:>22s} {:>16s}'.format('import', 'time (ms)'))
+    for name, statement in statements.items():
+        best = np.inf
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', statement], env=env)
+            best = min(best, time.time() - start)
+        print('{:>22s} {:>16.1f}'.format(name, 1e3*best))
+    calls = {'curve': (curve, ('soft',), dict(vsh=0.2, phic=.5, Cn=12, P=45)),
+             'rpt_grid': (rpt_grid, ('soft', 0.6, 'oil', .5, 12, 45, .3), {})}
+    print('{:>22s} {:>16s} {:>16s}'.format('call', 'computed (us)',
+                                           'cached (us)'))
+    for name, (func, args, kwargs) in calls.items():
+        n = 1000
+        start = time.time()
+        for _ in range(n):
+            func.__wrapped__(*args, **kwargs)
+        computed = (time.time() - start)/n
+        func(*args, **kwargs)
+        start = time.time()
+        for _ in range(n):
+            func(*args, **kwargs)
+        cached = (time.time() - start)/n
+        print('{:>22s} {:>16.1f} {:>16.2f}'.format(name, 1e6*computed,
+                                                  1e6*cached))
+
+
+def bench_well_store(fname='qsiwell5.csv', nqueries=2000):
+    '''
+    Throughput, in queries per second, of random zone queries (sand samples
+    of VP between two depths, and the number of shale samples) with the
+    boolean masks of the figures script and with WellLogs.
+    '''
+    L = pd.read_csv(fname, index_col=0)
+    W = WellLogs(L)
+    rng = np.random.default_rng(0)
+    z1 = rng.uniform(L.index.min(), L.index.max(), nqueries)
+    z2 = z1 + rng.uniform(10, 200, nqueries)
+    print('{:>22s} {:>16s} {:>16s}'.format('', 'masks (q/s)',
+                                           'store (q/s)'))
+    start = time.time()
+    for a, b in zip(z1, z2):
+        zone = (L.index >= a) & (L.index <= b)
+        L.VP[zone & (L.VSH <= 0.3)].values
+    masks = nqueries/(time.time() - start)
+    start = time.time()
+    for a, b in zip(z1, z2):
+        W.select('VP', a, b, 'sand')
+    store = nqueries/(time.time() - start)
+    print('{:>22s} {:>16.0f} {:>16.0f}'.format('sand VP', masks, store))
+    start = time.time()
+    for a, b in zip(z1, z2):
+        ((L.index >= a) & (L.index <= b) & (L.VSH >= 0.5)).sum()
+    masks = nqueries/(time.time() - start)
+    start = time.time()
+    for a, b in zip(z1, z2):
+        W.count('shale', a, b)
+    store = nqueries/(time.time() - start)
+    print('{:>22s} {:>16.0f} {:>16.0f}'.format('shale count', masks, store))
+
+
+if __name__ == '__main__':
+    bench_template()
+    bench_monte_carlo()
+    bench_fluid_substitution()
+    bench_avo()
+    bench_import()
+    bench_well_store()
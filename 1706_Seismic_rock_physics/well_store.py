@@ -0,0 +1,138 @@
+'''
+Well logs indexed by depth for fast zone queries.
+
+The figures select zones with masks like
+
+    (L.index >= z1) & (L.index <= z2) & (L.VSH <= cutoff_sand)
+
+which go through the whole log for each query. WellLogs keeps the logs of
+a well as one contiguous float array per curve, sorted by depth, so that a
+depth interval is found by binary search and returned as a view (no copy);
+the facies masks (e.g. sand and shale from VSH cutoffs) and their running
+counts are computed once, when the well is loaded.
+'''
+import os
+
+import numpy as np
+
+# facies of the figures: curve, minimum and maximum (inclusive, None for
+# no limit)
+FACIES = {'sand': ('VSH', None, 0.3),
+          'shale': ('VSH', 0.5, None)}
+
+
+class WellLogs(object):
+    '''
+    The logs of a well
+
+    INPUT
+    logs: csv file like qsiwell5.csv (depth in the first column) or a
+          DataFrame with the depth as index
+    facies: dictionary of the facies to precompute, defaults to FACIES
+    '''
+
+    def __init__(self, logs, facies=None):
+        if isinstance(logs, str):
+            import pandas as pd
+            logs = pd.read_csv(logs, index_col=0)
+        depth = np.asarray(logs.index, dtype=float)
+        order = np.argsort(depth, kind='mergesort')
+        self.depth = np.ascontiguousarray(depth[order])
+        self.columns = [str(name) for name in logs.columns]
+        # one row per curve, so that every curve is contiguous
+        self.data = np.ascontiguousarray(
+            np.asarray(logs.values, dtype=float)[order].T)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self.masks, self._counts = {}, {}
+        for name, (column, vmin, vmax) in (facies or FACIES).items():
+            self.add_facies(name, column, vmin, vmax)
+
+    def __len__(self):
+        return self.depth.size
+
+    def add_facies(self, name, column, vmin=None, vmax=None):
+        '''
+        Precomputes the mask of a facies, where vmin <= column <= vmax
+        '''
+        mask = self.cutoff(column, vmin, vmax)
+        self.masks[name] = mask
+        self._counts[name] = np.concatenate(([0], np.cumsum(mask)))
+
+    def interval(self, z1=None, z2=None):
+        '''
+        Slice of the samples with z1 <= depth <= z2, by binary search
+        '''
+        start = 0 if z1 is None else np.searchsorted(self.depth, z1, 'left')
+        stop = (len(self) if z2 is None else
+                np.searchsorted(self.depth, z2, 'right'))
+        return slice(int(start), int(stop))
+
+    def curve(self, name, z1=None, z2=None):
+        '''
+        A curve between z1 and z2 (a view of the store, not a copy)
+        '''
+        if name == 'DEPTH':
+            return self.depth[self.interval(z1, z2)]
+        return self.data[self._index[name], self.interval(z1, z2)]
+
+    def mask(self, facies, z1=None, z2=None):
+        '''
+        The precomputed mask of a facies between z1 and z2 (a view)
+        '''
+        return self.masks[facies][self.interval(z1, z2)]
+
+    def count(self, facies, z1=None, z2=None):
+        '''
+        The number of samples of a facies between z1 and z2, from the
+        running counts (without going through the samples)
+        '''
+        idx = self.interval(z1, z2)
+        counts = self._counts[facies]
+        return int(counts[idx.stop] - counts[idx.start])
+
+    def cutoff(self, column, vmin=None, vmax=None, z1=None, z2=None):
+        '''
+        Mask of vmin <= column <= vmax between z1 and z2, going only
+        through the samples of the interval
+        '''
+        values = self.curve(column, z1, z2)
+        mask = np.ones(values.shape, dtype=bool)
+        if vmin is not None:
+            mask &= values >= vmin
+        if vmax is not None:
+            mask &= values <= vmax
+        return mask
+
+    def select(self, names, z1=None, z2=None, facies=None):
+        '''
+        Values of one or more curves of a facies between z1 and z2, e.g.
+        select(['DEPTH', 'PHIE', 'VP'], 2100, 2250, 'sand'); with a facies
+        or with DEPTH among other curves these are copies, as the samples
+        are not contiguous
+
+        OUTPUT
+        1D array for a single curve, or 2D array with one row per curve
+        '''
+        single = isinstance(names, str)
+        if single:
+            names = [names]
+        idx = self.interval(z1, z2)
+        rows = [self._index.get(name) for name in names]
+        if None in rows:
+            # DEPTH is not a row of the store
+            values = np.array([self.curve(name, z1, z2) for name in names])
+        elif rows == list(range(rows[0], rows[0] + len(rows))):
+            values = self.data[rows[0]:rows[0]+len(rows), idx]
+        else:
+            values = self.data[rows, idx]
+        if facies is not None:
+            values = np.compress(self.masks[facies][idx], values, axis=1)
+        return values[0] if single else values
+
+
+def open_wells(fnames, facies=None):
+    '''
+    WellLogs of many csv files, by well name (file name without extension)
+    '''
+    return {os.path.splitext(os.path.basename(fname))[0]:
+            WellLogs(fname, facies) for fname in fnames}
@@ -1,11 +1,17 @@
+import copy
+import functools
+
 from SimPEG import (
     Problem, Utils, Maps, Props, Mesh, Tests, Survey, Solver as SimpegSolver
     )
 import numpy as np
 import scipy.sparse as sp
+from scipy.linalg import lapack
 import properties
 from scipy.constants import mu_0
 
+from MTforward import layeredImpedance, setDirichletBC, tridiagonalOrder
+
 
 class MT1DSurvey(Survey.BaseSurvey):
 
@@ -41,16 +47,9 @@ class MT1DSurvey(Survey.BaseSurvey):
     @property
     def P0(self):
         """
-            Evaluation matrix at surface
+            Evaluation matrix at surface, set by the problem's fields
         """
-        if getattr(self, '_P0', None) is None:
-            P0 = sp.coo_matrix(
-                (
-                    np.r_[1.], (np.r_[0], np.r_[2*self.mesh.nC])),
-                shape=(1, 2 * self.mesh.nC + 1)
-                )
-            self._P0 = P0.tocsr()
-        return self._P0
+        return self.prob.P0
 
     def eval(self, f):
         """
@@ -61,70 +60,133 @@ class MT1DSurvey(Survey.BaseSurvey):
         :return: data
         """
         data = Survey.Data(self)
+        i0 = self.prob.surfaceIndex
         for src in self.srcList:
             for rx in src.rxList:
-                data[src, rx] = rx.eval(src, f, self.P0)
+                data[src, rx] = rx.evalSurface(f[i0:i0+1])
         return data
 
     def evalDeriv(self):
         raise Exception('Use Receivers to project fields deriv.')
 
-    def setMesh(self, sigma=0.1, max_depth_core=3000., ncell_per_skind=10, n_skind=2, core_meshType="linear", max_hz_core=None):
+    def setMesh(
+        self, sigma=0.1, max_depth_core=3000., ncell_per_skind=10, n_skind=2,
+        core_meshType="linear", max_hz_core=None, verbose=True, cache=True
+    ):
 
         """
         Set 1D Mesh based using skin depths
 
+        Meshes are cached on the frequency range and the arguments, so that
+        surveys sharing them (e.g. many stations) share one mesh and its
+        operators. Use cache=False for a new mesh and verbose=False to
+        silence the summary.
         """
-        rho = 1./sigma
         fmin, fmax = self.frequency.min(), self.frequency.max()
-        print (
-            (">> Smallest cell size = %d m") % (500*np.sqrt(rho/fmax) / ncell_per_skind)
-            )
-        print (
-            (">> Padding distance = %d m") % (500*np.sqrt(rho/fmin) * n_skind)
+        build = _cachedMesh if cache else _cachedMesh.__wrapped__
+        mesh, cs, npad, ncz = build(
+            float(fmin), float(fmax), float(sigma), float(max_depth_core),
+            ncell_per_skind, n_skind, core_meshType,
+            None if max_hz_core is None else float(max_hz_core)
+        )
+        if verbose:
+            rho = 1./sigma
+            print (
+                (">> Smallest cell size = %d m") % (cs)
+                )
+            print (
+                (">> Padding distance = %d m") % (500*np.sqrt(rho/fmin) * n_skind)
+                )
+            print (
+                (">> # of padding cells %d") % (npad)
             )
-        cs = 500*np.sqrt(rho/fmax) / ncell_per_skind
-        length_bc = 500*np.sqrt(100/fmin) * n_skind
-
-        if core_meshType == "linear":
-
-            max_hz_core = cs
-
-        elif core_meshType == "log":
-
-            if max_hz_core is None:
-                max_hz_core  = cs * 10
-
-            ncz = 2
-            hz_core = np.logspace(np.log10(cs), np.log10(max_hz_core), ncz)
+            print (
+                (">> # of core cells cells %d") % (ncz)
+                )
+        return mesh
 
-            while hz_core.sum() < max_depth_core:
-                ncz += 1
-                hz_core = np.logspace(np.log10(cs), np.log10(max_hz_core), ncz)
 
-        npad = 1
-        blength = max_hz_core*1.3**(np.arange(npad)+1)
+def _logCoreCells(cs, max_hz_core, max_depth_core):
+    """
+    Smallest number (at least 2) of log-spaced cells from cs to max_hz_core
+    reaching max_depth_core. The geometric series is inverted for the
+    estimate, which is then corrected against the actual np.logspace sums.
+    """
+    def depth(ncz):
+        return np.logspace(np.log10(cs), np.log10(max_hz_core), ncz).sum()
+
+    if max_depth_core <= cs + max_hz_core:
+        ncz = 2
+    elif np.isclose(max_hz_core, cs):
+        ncz = int(np.ceil(max_depth_core / cs))
+    else:
+        # cells grow by r, and cs + ... + max_hz_core >= max_depth_core
+        # for r <= (max_depth_core - cs) / (max_depth_core - max_hz_core)
+        r = (max_depth_core - cs) / (max_depth_core - max_hz_core)
+        ncz = int(np.ceil(1 + np.log(max_hz_core / cs) / np.log(r)))
+    ncz = max(ncz, 2)
+    while ncz > 2 and depth(ncz - 1) >= max_depth_core:
+        ncz -= 1
+    while depth(ncz) < max_depth_core:
+        ncz += 1
+    return ncz
+
+
+def _paddingCells(max_hz_core, length_bc, expansion=1.3):
+    """
+    Smallest number (at least 1) of padding cells, expanding from
+    max_hz_core, reaching length_bc
+    """
+    def length(npad):
+        return (max_hz_core*expansion**(np.arange(npad)+1)).sum()
+
+    npad = int(np.ceil(
+        np.log(1 + (expansion-1)*length_bc/(expansion*max_hz_core)) /
+        np.log(expansion)
+    )) if length_bc > 0 else 1
+    npad = max(npad, 1)
+    while npad > 1 and length(npad - 1) >= length_bc:
+        npad -= 1
+    while length(npad) < length_bc:
+        npad += 1
+    return npad
+
+
+@functools.lru_cache(maxsize=32)
+def _cachedMesh(
+    fmin, fmax, sigma, max_depth_core, ncell_per_skind, n_skind,
+    core_meshType, max_hz_core
+):
+    """
+    Mesh of MT1DSurvey.setMesh, with the Dirichlet boundary conditions set
+    and the operators used by MT1DProblem formed. Returns
+    (mesh, smallest cell size, # of padding cells, # of core cells).
+    """
+    rho = 1./sigma
+    cs = 500*np.sqrt(rho/fmax) / ncell_per_skind
+    length_bc = 500*np.sqrt(100/fmin) * n_skind
 
-        while blength < length_bc:
-            npad += 1
-            blength = (max_hz_core*1.3**(np.arange(npad)+1)).sum()
-        print (
-            (">> # of padding cells %d") % (npad)
-        )
+    if core_meshType == "linear":
+        max_hz_core = cs
+    elif core_meshType == "log":
+        if max_hz_core is None:
+            max_hz_core = cs * 10
+        ncz = _logCoreCells(cs, max_hz_core, max_depth_core)
+        hz_core = np.logspace(np.log10(cs), np.log10(max_hz_core), ncz)
 
-        if core_meshType == "linear":
-            ncz = int(max_depth_core / cs)
-            hz = [(cs, npad, -1.3), (cs, ncz)]
-        elif core_meshType == "log":
-            hz_pad = max_hz_core * 1.3**(np.arange(npad)+1)
-            hz = np.r_[hz_pad[::-1], hz_core[::-1]]
+    npad = _paddingCells(max_hz_core, length_bc)
 
-        print (
-            (">> # of core cells cells %d") % (ncz)
-            )
-        mesh = Mesh.TensorMesh([hz], x0='N')
+    if core_meshType == "linear":
+        ncz = int(max_depth_core / cs)
+        hz = [(cs, npad, -1.3), (cs, ncz)]
+    elif core_meshType == "log":
+        hz_pad = max_hz_core * 1.3**(np.arange(npad)+1)
+        hz = np.r_[hz_pad[::-1], hz_core[::-1]]
 
-        return mesh
+    mesh = Mesh.TensorMesh([hz], x0='N')
+    setDirichletBC(mesh)
+    mesh.cellGrad, mesh.cellGradBC, mesh.faceDiv, mesh.aveCC2F
+    return mesh, cs, npad, ncz
 
 
 class MT1DSrc(Survey.BaseSrc):
@@ -143,7 +205,13 @@ class ZxyRx(Survey.BaseRx):
         Survey.BaseRx.__init__(self, locs, rxType=None)
 
     def eval(self, src, f, P0):
-        Zxy = - 1./(P0*f)
+        return self.evalSurface(P0*f)
+
+    def evalSurface(self, Hy0):
+        """
+        Data from the surface Hy (1 x nFreq)
+        """
+        Zxy = - 1./Hy0
         if self.component == "real":
             return Zxy.real
         elif self.component == "imag":
@@ -154,36 +222,45 @@ class ZxyRx(Survey.BaseRx):
             raise NotImplementedError('must be real, imag or both')
 
     def evalDeriv(self, f, freq, P0, df_dm_v=None, v=None, adjoint=False):
+        if adjoint:
+            return P0.T * self.evalSurfaceDeriv(
+                P0*f, freq, v=v, adjoint=True
+            )
+        return self.evalSurfaceDeriv(P0*f, freq, dHy0_dm_v=P0*df_dm_v)
+
+    def evalSurfaceDeriv(
+        self, Hy0, freq, dHy0_dm_v=None, v=None, adjoint=False
+    ):
+        """
+        Derivative of the data at one frequency from the surface Hy0 (1,)
+        and its derivative dHy0_dm_v (1 x k). The adjoint takes the data v
+        (nComponent x k) and returns the derivative with respect to Hy0
+        (1 x k).
+        """
+        # Zxy = -1/Hy0, so dZxy/dHy0 = 1/Hy0**2
+        dZ_dHy0 = 1./Hy0**2
 
         if adjoint:
 
             if self.component == "real":
-                PTvr = (P0.T*v).astype(complex)
-                dZr_dfT_v = Utils.sdiag((1./(f**2)))*PTvr
-                return dZr_dfT_v
+                return dZ_dHy0 * v.astype(complex)
             elif self.component == "imag":
-                PTvi = P0.T*v*-1j
-                dZi_dfT_v = Utils.sdiag((1./(f**2)))*PTvi
-                return dZi_dfT_v
+                return dZ_dHy0 * (v*-1j)
             elif self.component == "both":
-                PTvr = (P0.T*np.r_[v[0]]).astype(complex)
-                PTvi = P0.T*np.r_[v[1]]*-1j
-                dZr_dfT_v = Utils.sdiag((1./(f**2)))*PTvr
-                dZi_dfT_v = Utils.sdiag((1./(f**2)))*PTvi
-                return dZr_dfT_v + dZi_dfT_v
+                return dZ_dHy0 * (v[0:1] - 1j*v[1:2])
             else:
                 raise NotImplementedError('must be real, imag or both')
 
         else:
 
-            dZd_dm_v = P0 * (Utils.sdiag(1./(f**2)) * df_dm_v)
+            dZd_dm_v = dZ_dHy0 * dHy0_dm_v
 
             if self.component == "real":
                 return dZd_dm_v.real
             elif self.component == "imag":
                 return dZd_dm_v.imag
             elif self.component == "both":
-                return np.r_[dZd_dm_v.real, dZd_dm_v.imag]
+                return np.concatenate((dZd_dm_v.real, dZd_dm_v.imag))
             else:
                 raise NotImplementedError('must be real, imag or both')
 
@@ -200,8 +277,8 @@ class AppResPhaRx(ZxyRx):
     def __init__(self, locs, component=None, frequency=None):
         super(AppResPhaRx, self).__init__(locs, component, frequency)
 
-    def eval(self, src, f, P0):
-        Zxy = - 1./(P0*f)
+    def evalSurface(self, Hy0):
+        Zxy = - 1./Hy0
         omega = 2*np.pi*self.frequency
         if self.component == "appres":
             appres = abs(Zxy)**2 / (mu_0*omega)
@@ -216,10 +293,13 @@ class AppResPhaRx(ZxyRx):
         else:
             raise NotImplementedError('must be appres, phase or both')
 
-    def evalDeriv(self, f, freq, P0, df_dm_v=None, v=None, adjoint=False):
+    def evalSurfaceDeriv(
+        self, Hy0, freq, dHy0_dm_v=None, v=None, adjoint=False
+    ):
 
-        Zxy = - 1./(P0*f)
+        Zxy = - 1./Hy0
         omega = 2*np.pi*freq
+        dZ_dHy0 = 1./Hy0**2
 
         if adjoint:
 
@@ -228,21 +308,17 @@ class AppResPhaRx(ZxyRx):
             dappres_dZ = (dappres_dZa * dZa_dZ)
 
             if self.component == "appres":
-                dappres_dZT_v = dappres_dZ.conj() * np.r_[v]
-                dappres_dfT_v = Utils.sdiag((1./(f**2)))*(P0.T*dappres_dZT_v)
-                return dappres_dfT_v
+                return dZ_dHy0 * (dappres_dZ.conj() * v)
             elif self.component == "phase":
-                return np.zeros_like(dappres_dfT_v)
+                return np.zeros((1,) + v.shape[1:], dtype=complex)
             elif self.component == "both":
-                dappres_dZT_v = dappres_dZ.conj() * np.r_[v[0]]
-                dappres_dfT_v = Utils.sdiag((1./(f**2)))*(P0.T*dappres_dZT_v)
-                return dappres_dfT_v
+                return dZ_dHy0 * (dappres_dZ.conj() * v[0:1])
             else:
                 raise NotImplementedError('must be real, imag or both')
 
         else:
 
-            dZ_dm_v = P0 * (Utils.sdiag(1./(f**2)) * df_dm_v)
+            dZ_dm_v = dZ_dHy0 * dHy0_dm_v
 
             dZa_dZ = Zxy.conjugate() / abs(Zxy)
             dappres_dZa = 2. * abs(Zxy) / (mu_0*omega)
@@ -254,11 +330,79 @@ class AppResPhaRx(ZxyRx):
             elif self.component == "phase":
                 return np.zeros_like(dappres_dm_v)
             elif self.component == "both":
-                return np.r_[dappres_dm_v, np.zeros_like(dappres_dm_v)]
+                return np.concatenate(
+                    (dappres_dm_v, np.zeros_like(dappres_dm_v))
+                )
             else:
                 raise NotImplementedError('must be appres, phase or both')
 
 
+class TridiagonalSolver(object):
+    """
+    LU factorization (LAPACK gttrf) of a matrix that is tridiagonal once its
+    rows and columns are reordered. Behaves like a SimPEG Solver:
+    ``Ainv * rhs`` solves for a single or a matrix of right hand sides, and
+    ``Ainv.T`` solves with the transpose of A using the same factors.
+
+    :param numpy.ndarray dl: sub-diagonal of the reordered matrix
+    :param numpy.ndarray d: diagonal of the reordered matrix
+    :param numpy.ndarray du: super-diagonal of the reordered matrix
+    :param numpy.ndarray rowOrder: original rows in reordered sequence
+    :param numpy.ndarray colOrder: original columns in reordered sequence
+    """
+
+    def __init__(self, dl, d, du, rowOrder=None, colOrder=None):
+        d = np.asarray(d, dtype=complex)
+        self.n = d.size
+        if rowOrder is None:
+            rowOrder = np.arange(self.n)
+        if colOrder is None:
+            colOrder = np.arange(self.n)
+        self.rowOrder, self.colOrder = rowOrder, colOrder
+        gttrf, self._gttrs = lapack.get_lapack_funcs(('gttrf', 'gttrs'), (d,))
+        dl, d, du, du2, ipiv, info = gttrf(
+            np.asarray(dl, dtype=complex), d, np.asarray(du, dtype=complex)
+        )
+        if info > 0:
+            raise Exception("Matrix is singular: U(%d, %d) = 0" % (info, info))
+        self._factors = (dl, d, du, du2, ipiv)
+        self.trans = 'N'
+
+    @property
+    def T(self):
+        """
+        Solver for the transpose of A, sharing this factorization
+        """
+        ATinv = copy.copy(self)
+        ATinv.trans = 'T' if self.trans == 'N' else 'N'
+        return ATinv
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the LU factors
+        """
+        return sum(factor.nbytes for factor in self._factors)
+
+    def solve(self, rhs, trans='N'):
+        """
+        Solve A x = rhs, or A^T x = rhs for ``trans='T'``
+        """
+        rhs = np.asarray(rhs)
+        if trans == 'N':
+            inOrder, outOrder = self.rowOrder, self.colOrder
+        else:
+            inOrder, outOrder = self.colOrder, self.rowOrder
+        b = rhs[inOrder].astype(complex).reshape((self.n, -1), order='F')
+        y, info = self._gttrs(*(self._factors + (b,)), trans=trans)
+        x = np.empty_like(y)
+        x[outOrder] = y
+        return x.reshape(rhs.shape, order='F')
+
+    def __mul__(self, rhs):
+        return self.solve(rhs, trans=self.trans)
+
+
 class MT1DProblem(Problem.BaseProblem):
     """
     1D Magnetotelluric problem under quasi-static approximation
@@ -288,13 +432,18 @@ class MT1DProblem(Problem.BaseProblem):
     Solver = SimpegSolver  #: Type of solver to pair with
     solverOpts = {}  #: Solver options
 
+    #: "tridiagonal": assemble once per model, LAPACK gttrf per frequency
+    #: "sparse": assemble and factorize A with Solver per frequency
+    engine = "tridiagonal"
+
     verbose = False
     f = None
+    storeJ = False  #: form J once per model with getJ and reuse it
 
     def __init__(self, mesh, **kwargs):
         Problem.BaseProblem.__init__(self, mesh, **kwargs)
         # Setup boundary conditions
-        mesh.setCellGradBC([['dirichlet', 'dirichlet']])
+        setDirichletBC(mesh)
 
     @property
     def deleteTheseOnModelUpdate(self):
@@ -302,9 +451,32 @@ class MT1DProblem(Problem.BaseProblem):
             print ("Delete Matrices")
         toDelete = []
         if self.sigmaMap is not None or self.rhoMap is not None:
-            toDelete += ['_MccSigma', '_Ainv', '_ATinv']
+            toDelete += [
+                '_MccSigma', '_Ainv', '_ATinv', '_Atridiag', '_Jmatrix'
+            ]
         return toDelete
 
+    @property
+    def P0(self):
+        """
+            Evaluation matrix at surface
+        """
+        if getattr(self, '_P0', None) is None:
+            P0 = sp.coo_matrix(
+                (
+                    np.r_[1.], (np.r_[0], np.r_[2*self.mesh.nC])),
+                shape=(1, 2 * self.mesh.nC + 1)
+                )
+            self._P0 = P0.tocsr()
+        return self._P0
+
+    @property
+    def surfaceIndex(self):
+        """
+            Index of the surface Hy in the fields, the entry P0 picks
+        """
+        return 2*self.mesh.nC
+
     @property
     def Exbc(self):
         """
@@ -385,14 +557,63 @@ class MT1DProblem(Problem.BaseProblem):
         )
         return A
 
+    @property
+    def tridiagOrder(self):
+        """
+            Row and column orderings that make A tridiagonal
+        """
+        if getattr(self, '_tridiagOrder', None) is None:
+            self._tridiagOrder = tridiagonalOrder(self.mesh.nC)
+        return self._tridiagOrder
+
+    @property
+    def Atridiag(self):
+        """
+            Diagonals (dl, d, du) of the reordered A matrix at zero frequency
+            and the diagonal dMu multiplying 1j*omega. The sparsity pattern is
+            assembled once per model and shared by all frequencies.
+        """
+        if getattr(self, '_Atridiag', None) is None:
+            nC, nN = self.mesh.nC, self.mesh.nN
+            rowOrder, colOrder = self.tridiagOrder
+            A0 = sp.vstack(
+                (
+                    sp.hstack((self.mesh.cellGrad, Utils.spzeros(nN, nN))),
+                    sp.hstack((self.MccSigma, self.mesh.faceDiv))
+                )
+            ).tocsr()[rowOrder, :][:, colOrder]
+            dMu = np.zeros(nC+nN)
+            dMu[0::2] = self.MfMu.diagonal()
+            self._Atridiag = (
+                A0.diagonal(-1), A0.diagonal(), A0.diagonal(1), dMu
+            )
+        return self._Atridiag
+
     @property
     def Ainv(self):
         if getattr(self, '_Ainv', None) is None:
             if self.verbose:
                 print ("Factorize A matrix")
             self._Ainv = []
-            for freq in self.survey.frequency:
-                self._Ainv.append(self.Solver(self.getA(freq)))
+            if self.engine == "sparse":
+                for freq in self.survey.frequency:
+                    self._Ainv.append(self.Solver(self.getA(freq)))
+            elif self.engine == "tridiagonal":
+                dl, d, du, dMu = self.Atridiag
+                rowOrder, colOrder = self.tridiagOrder
+                for freq in self.survey.frequency:
+                    omega = 2*np.pi*freq
+                    self._Ainv.append(
+                        TridiagonalSolver(
+                            dl, d + 1j*omega*dMu, du, rowOrder, colOrder
+                        )
+                    )
+            else:
+                raise NotImplementedError(
+                    "engine must be 'tridiagonal' or 'sparse', not {}".format(
+                        self.engine
+                    )
+                )
         return self._Ainv
 
     @property
@@ -400,9 +621,13 @@ class MT1DProblem(Problem.BaseProblem):
         if getattr(self, '_ATinv', None) is None:
             if self.verbose:
                 print ("Factorize AT matrix")
-            self._ATinv = []
-            for freq in self.survey.frequency:
-                self._ATinv.append(self.Solver(self.getA(freq).T))
+            if self.engine == "tridiagonal":
+                # transposed solves reuse the factors of A
+                self._ATinv = [Ainv.T for Ainv in self.Ainv]
+            else:
+                self._ATinv = []
+                for freq in self.survey.frequency:
+                    self._ATinv.append(self.Solver(self.getA(freq).T))
         return self._ATinv
 
     def getADeriv_sigma(self, freq, f, v, adjoint=False):
@@ -441,58 +666,221 @@ class MT1DProblem(Problem.BaseProblem):
             (int(self.mesh.nC*2+1), self.survey.nFreq), dtype="complex"
             )
 
+        # Ex(z=0) = 1 at every frequency, so the RHS is built only once
+        RHS = self.getRHS(self.survey.frequency[0])
         for ifreq, freq in enumerate(self.survey.frequency):
-            f[:, ifreq] = self.Ainv[ifreq] * self.getRHS(freq)
+            f[:, ifreq] = self.Ainv[ifreq] * RHS
         return f
 
     def Jvec(self, m, v, f=None):
+        """
+            Sensitivity times v, where v is a model-space vector or a
+            (nP x k) matrix of them
+        """
+        if self.storeJ:
+            return self.getJ(m, f=f).dot(v)
+        return self._Jvec(m, v, f=f)
+
+    def Jtvec(self, m, v, f=None):
+        """
+            Adjoint sensitivity times v, where v is a data-space vector or a
+            (nD x k) matrix of them
+        """
+        if isinstance(v, self.dataPair):
+            v = v.tovec()
+        if self.storeJ:
+            return self.getJ(m, f=f).T.dot(v)
+        return self._Jtvec(m, v, f=f)
+
+    def getJ(self, m, f=None):
+        """
+            Full sensitivity matrix (nD x nP), formed with one multi-RHS
+            transposed solve per frequency
+        """
+        if getattr(self, '_Jmatrix', None) is None:
+            if f is None:
+                f = self.fields(m)
+            self._Jmatrix = self._Jtvec(m, np.eye(self.survey.nD), f=f).T
+        return self._Jmatrix
+
+    def _Jvec(self, m, v, f=None):
 
         if f is None:
             f = self.fields(m)
 
-        Jv = []
+        nN = self.mesh.nN
+        dsig_dm_v = self.sigmaDeriv * v
+        if dsig_dm_v.ndim == 1:
+            dsig_dm_v = dsig_dm_v[:, None]
 
+        df_dm_v = []
+        for ifreq, freq in enumerate(self.survey.frequency):
+            # dA/dm v = [0; diag(Ex) dsigma/dm v]
+            dA_dm_f_v = np.zeros(
+                (f.shape[0], dsig_dm_v.shape[1]), dtype=complex
+            )
+            dA_dm_f_v[nN:] = f[:self.mesh.nC, ifreq, None] * dsig_dm_v
+            df_dm_v.append(
+                - (self.Ainv[ifreq] * dA_dm_f_v).reshape(dA_dm_f_v.shape)
+            )
+
+        Jv = self._projectFieldsDeriv(f, df_dm_v)
+        return Jv[:, 0] if np.ndim(v) == 1 else Jv
+
+    def _Jtvec(self, m, v, f=None):
+
+        if f is None:
+            f = self.fields(m)
+
+        nN = self.mesh.nN
+        v = np.asarray(v)
+        dZ_dfT_v = self._projectFieldsDerivAdjoint(f, v)
+
+        dA_dmT_v = 0.
+        for ifreq, freq in enumerate(self.survey.frequency):
+            ATinvdZ_dfT = (self.ATinv[ifreq] * dZ_dfT_v[ifreq]).reshape(
+                dZ_dfT_v[ifreq].shape
+            )
+            dA_dmT_v = dA_dmT_v - (
+                f[:self.mesh.nC, ifreq, None] * ATinvdZ_dfT[nN:]
+            ).real
+
+        Jtv = self.sigmaDeriv.T * dA_dmT_v
+        return Jtv[:, 0] if v.ndim == 1 else Jtv
+
+    def _projectFieldsDeriv(self, f, df_dm_v):
+        """
+            Data (nD x k) from the derivatives of the fields df_dm_v, a list
+            with one (nU x k) matrix per frequency
+        """
+        i0 = self.surfaceIndex
+        Jv = []
         for src in self.survey.srcList:
             for rx in src.rxList:
                 for ifreq, freq in enumerate(self.survey.frequency):
-                    dA_dm_f_v = self.getADeriv_sigma(freq, f[:, ifreq], v)
-                    df_dm_v = - (self.Ainv[ifreq] * dA_dm_f_v)
                     Jv.append(
-                        rx.evalDeriv(
-                            f[:, ifreq], freq, self.survey.P0, df_dm_v=df_dm_v
+                        rx.evalSurfaceDeriv(
+                            f[i0:i0+1, ifreq], freq,
+                            dHy0_dm_v=df_dm_v[ifreq][i0:i0+1]
                             )
                         )
-        return np.hstack(Jv)
+        return np.vstack(Jv)
 
-    def Jtvec(self, m, v, f=None):
+    def _projectFieldsDerivAdjoint(self, f, v):
+        """
+            Adjoint of _projectFieldsDeriv: one (nU x k) matrix per
+            frequency, summed over the receivers, for data v (nD x k)
+        """
+        nFreq = self.survey.nFreq
+        i0 = self.surfaceIndex
+        v = v.reshape((v.shape[0], -1))
+        dZ_dfT_v = [
+            np.zeros((f.shape[0], v.shape[1]), dtype=complex)
+            for ifreq in range(nFreq)
+        ]
+
+        ind = 0
+        for src in self.survey.srcList:
+            for rx in src.rxList:
+                # data are ordered by frequency, then component
+                v_rx = v[ind:ind+rx.nD].reshape((nFreq, -1, v.shape[1]))
+                ind += rx.nD
+                for ifreq, freq in enumerate(self.survey.frequency):
+                    dZ_dfT_v[ifreq][i0:i0+1] += rx.evalSurfaceDeriv(
+                        f[i0:i0+1, ifreq], freq, v=v_rx[ifreq], adjoint=True
+                        )
+        return dZ_dfT_v
+
+
+class MT1DAnalyticProblem(MT1DProblem):
+    """
+    1D Magnetotelluric problem solved by impedance recursion: every cell of
+    the mesh is a layer and the deepest cell is a half-space. Pairs with the
+    same survey and receivers as MT1DProblem, and gives data in the same
+    order, but the fields are only Hy at the surface (Ex = 1 there).
+
+    """
+
+    @property
+    def deleteTheseOnModelUpdate(self):
+        toDelete = super(MT1DAnalyticProblem, self).deleteTheseOnModelUpdate
+        if self.sigmaMap is not None or self.rhoMap is not None:
+            toDelete += ['_dHy_dsigma']
+        return toDelete
+
+    @property
+    def P0(self):
+        """
+            Evaluation matrix at surface: the fields are already there
+        """
+        if getattr(self, '_P0', None) is None:
+            self._P0 = sp.identity(1, format='csr')
+        return self._P0
+
+    @property
+    def surfaceIndex(self):
+        return 0
+
+    @property
+    def layerThickness(self):
+        """
+            Cell widths from the surface down, without the half-space
+        """
+        return self.mesh.hx[::-1][:-1]
+
+    @property
+    def layerMu(self):
+        """
+            Magnetic permeability of the cells from the surface down
+        """
+        return (self.mu * np.ones(self.mesh.nC))[::-1]
+
+    @property
+    def dHy_dsigma(self):
+        """
+            Derivative of the surface Hy (nFreq x nC) with respect to sigma
+        """
+        if getattr(self, '_dHy_dsigma', None) is None:
+            Zxy, dZ_dsig = layeredImpedance(
+                self.sigma[::-1], self.layerThickness, self.survey.frequency,
+                mu=self.layerMu, deriv=True
+            )
+            # Hy = -1/Zxy, and layers run opposite to the mesh cells
+            self._dHy_dsigma = (dZ_dsig / Zxy[:, None]**2)[:, ::-1]
+        return self._dHy_dsigma
+
+    def fields(self, m=None):
+        if self.verbose:
+            print (">> Compute fields")
+
+        if m is not None:
+            self.model = m
+
+        Zxy = layeredImpedance(
+            self.sigma[::-1], self.layerThickness, self.survey.frequency,
+            mu=self.layerMu
+        )
+        return (-1./Zxy)[None, :]
+
+    def _Jvec(self, m, v, f=None):
 
         if f is None:
             f = self.fields(m)
-        # Ensure v is a data object.
 
-        if not isinstance(v, self.dataPair):
-            v = self.dataPair(self.survey, v)
+        dHy_dm_v = self.dHy_dsigma.dot(self.sigmaDeriv * v)
+        if dHy_dm_v.ndim == 1:
+            dHy_dm_v = dHy_dm_v[:, None]
 
-        Jtv = np.zeros(m.size)
+        Jv = self._projectFieldsDeriv(f, dHy_dm_v[:, None, :])
+        return Jv[:, 0] if np.ndim(v) == 1 else Jv
 
-        for src in self.survey.srcList:
-            for rx in src.rxList:
-                for ifreq, freq in enumerate(self.survey.frequency):
-                    if rx.component == "both":
-                        v_temp = v[src, rx].reshape(
-                            (self.survey.nFreq, 2)
-                            )[ifreq, :]
-                    else:
-                        v_temp = v[src, rx][ifreq]
-
-                    dZ_dfT_v = rx.evalDeriv(
-                        f[:, ifreq], freq, self.survey.P0,
-                        v=v_temp, adjoint=True
-                        )
+    def _Jtvec(self, m, v, f=None):
+
+        if f is None:
+            f = self.fields(m)
 
-                    ATinvdZ_dfT = self.ATinv[ifreq]*dZ_dfT_v
-                    Jtv += - self.getADeriv_sigma(
-                        freq, f[:, ifreq], ATinvdZ_dfT, adjoint=True
-                        ).real
+        v = np.asarray(v)
+        dHy_dfT_v = np.vstack(self._projectFieldsDerivAdjoint(f, v))
 
-        return Jtv
+        Jtv = self.sigmaDeriv.T * (self.dHy_dsigma.T.dot(dHy_dfT_v)).real
+        return Jtv[:, 0] if v.ndim == 1 else Jtv
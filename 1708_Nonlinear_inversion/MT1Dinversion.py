@@ -0,0 +1,306 @@
+"""
+Inversion drivers for 1D MT soundings: a single station, as in
+3_MT1D_5layer_inversion.ipynb, and surveys of many stations inverted as
+independent, optionally laterally constrained, 1D problems.
+"""
+import contextlib
+import io
+import multiprocessing
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+from SimPEG import (
+    Maps, Mesh, DataMisfit, Regularization, Optimization, InvProblem,
+    Inversion, Directives, Utils
+)
+
+from MT1D import MT1DProblem, MT1DSurvey, MT1DSrc, ZxyRx
+
+
+def run_MT1Dinv(
+    prob,  # 1D MT problem
+    survey,  # 1D MT survey with sources and receivers
+    m0,  # starting model
+    uncert,  # uncertainties of the observed data
+    mref=None,  # reference model
+    alpha_s=1.,  # smallness weight
+    alpha_z=1.,  # smoothness weight
+    beta0=1e1,  # trade off parameter
+    use_betaest=False,  # estimate an initial beta
+    beta0_ratio=None,  # if we are estimating beta, how much should we favor the regularization?
+    coolingFactor=1.5,  # cooling factor
+    coolingRate=1,  # cool beta after this many iterations
+    use_target=True,  # stop the inversion at the target misfit?
+    maxIter=35,  # maximum number of Gauss-Newton iterations
+):
+    """
+    Run a 1D MT inversion, returning the model of each iteration, the
+    SaveOutputEveryIteration directive and the regularization
+    """
+    # if the starting model is not defined, use the reference model
+    if mref is None:
+        mref = m0
+
+    # Data misfit
+    dmisfit = DataMisfit.l2_DataMisfit(survey)
+    dmisfit.W = 1./uncert
+
+    # Regularization
+    reg = Regularization.Simple(
+        prob.mesh, alpha_s=alpha_s, alpha_x=alpha_z, mref=mref
+    )  # since we are in 1D, we work with the first dimension
+
+    # Optimization
+    opt = Optimization.InexactGaussNewton(maxIter=maxIter, LSshorten=0.05)
+
+    # Statement of the inverse problem
+    invProb = InvProblem.BaseInvProblem(dmisfit, reg, opt)
+
+    # Inversion Directives
+    beta = Directives.BetaSchedule(
+        coolingFactor=coolingFactor, coolingRate=coolingRate
+    )
+    invProb.beta = beta0
+    invProgress = Directives.SaveOutputEveryIteration(save_txt=False)
+    target = Directives.TargetMisfit()
+    directives = [beta, invProgress]
+
+    if use_target:
+        directives.append(target)
+    if use_betaest:
+        if beta0_ratio is None:
+            beta0_ratio = 1.
+        betaest = Directives.BetaEstimate_ByEig(beta0_ratio=beta0_ratio)
+        directives.append(betaest)
+
+    # assemble in an inversion
+    inv = Inversion.BaseInversion(invProb, directiveList=directives)
+    prob.counter = opt.counter = Utils.Counter()
+    opt.remember('xc')
+
+    # run the inversion
+    inv.run(m0)
+    xc = opt.recall("xc")
+    return xc, invProgress, reg
+
+
+class MT1DStationSurvey(object):
+    """
+    Many 1D MT stations sharing a set of frequencies and a receiver type.
+    Each station is a single sounding, like MT1DSurvey, and all of them are
+    discretized on the same mesh.
+
+    :param numpy.ndarray locs: (nStation, 2) station locations
+    :param numpy.ndarray frequency: frequencies (Hz)
+    :param numpy.ndarray dobs: (nStation, nD) observed data, each row in
+                               the order of a single station MT1DSurvey
+    :param numpy.ndarray uncert: (nStation, nD) uncertainties of dobs
+    :param str component: component of the receivers
+    :param class rxType: ZxyRx or AppResPhaRx
+    """
+
+    def __init__(
+        self, locs, frequency, dobs=None, uncert=None, component="both",
+        rxType=ZxyRx
+    ):
+        self.locs = np.atleast_2d(locs)
+        self.frequency = np.asarray(frequency)
+        self.component = component
+        self.rxType = rxType
+        self.dobs = dobs
+        self.uncert = uncert
+
+    @property
+    def nStation(self):
+        return self.locs.shape[0]
+
+    @property
+    def nD(self):
+        """Number of data per station"""
+        return self.rxType(
+            np.r_[0.], component=self.component, frequency=self.frequency
+        ).nD
+
+    def stationSurvey(self):
+        """
+        A single station MT1DSurvey with the receivers of every station
+        """
+        rx = self.rxType(
+            np.r_[0.], component=self.component, frequency=self.frequency
+        )
+        return MT1DSurvey([MT1DSrc([rx])])
+
+    def setMesh(self, **kwargs):
+        """
+        Mesh shared by all the stations, see MT1DSurvey.setMesh
+        """
+        return self.stationSurvey().setMesh(**kwargs)
+
+    def neighbours(self, n_neighbours=4, max_distance=np.inf):
+        """
+        Indices (nStation x n_neighbours) of the closest other stations and
+        their inverse distance weights, which sum to one for every station.
+        Missing neighbours have index nStation and weight zero.
+        """
+        tree = cKDTree(self.locs)
+        k = min(n_neighbours + 1, self.nStation)
+        dist, ind = tree.query(
+            self.locs, k=k, distance_upper_bound=max_distance
+        )
+        # the closest station is the station itself
+        dist = dist.reshape(self.nStation, k)[:, 1:]
+        ind = ind.reshape(self.nStation, k)[:, 1:]
+        weights = np.zeros_like(dist)
+        found = np.isfinite(dist)
+        weights[found] = 1./np.maximum(dist[found], 1e-12)
+        wsum = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(
+            weights, wsum, out=np.zeros_like(weights), where=wsum > 0
+        )
+        return ind, weights
+
+
+_stationSetup = None
+
+
+def _initStationWorker(
+    frequency, component, rxType, hx, x0, engine, invOpts, verbose
+):
+    """
+    Build the mesh, survey and problem once per process
+    """
+    global _stationSetup
+    mesh = Mesh.TensorMesh([hx], x0=x0)
+    survey = MT1DStationSurvey(
+        np.zeros((1, 2)), frequency, component=component, rxType=rxType
+    ).stationSurvey()
+    prob = MT1DProblem(mesh, sigmaMap=Maps.ExpMap(mesh), engine=engine)
+    prob.pair(survey)
+    _stationSetup = {
+        "prob": prob, "survey": survey, "invOpts": invOpts,
+        "verbose": verbose,
+    }
+
+
+def _invertStation(task):
+    """
+    Invert the data of one station, returning (index, model, phi_d)
+    """
+    ind, dobs, uncert, m0, mref = task
+    prob, survey = _stationSetup["prob"], _stationSetup["survey"]
+    survey.dobs = dobs
+    for name in prob.deleteTheseOnModelUpdate:
+        setattr(prob, name, None)
+
+    if _stationSetup["verbose"]:
+        output = contextlib.suppress()
+    else:
+        output = contextlib.redirect_stdout(io.StringIO())
+    with output:
+        xc, invProgress, _ = run_MT1Dinv(
+            prob, survey, m0, uncert, mref=mref, **_stationSetup["invOpts"]
+        )
+    return ind, xc[-1], invProgress.phi_d[-1]
+
+
+def invertStations(
+    stations, mesh, m0, mref=None, filename=None, n_processes=1,
+    engine="tridiagonal", lateral_weight=0., n_lateral=0, n_neighbours=4,
+    max_distance=np.inf, verbose=False, **kwargs
+):
+    """
+    Invert every station of an MT1DStationSurvey as a 1D problem on the
+    shared mesh, across a pool of n_processes processes. The mesh and the
+    problem are set up once per process.
+
+    m0 and mref are a single model for all stations or one per station
+    (nStation x nC). The remaining keyword arguments go to run_MT1Dinv.
+
+    With a filename, the recovered models (nStation x nC) and the final
+    data misfits (nStation) are written to `filename` and to
+    `filename` with a `_phi_d` suffix as .npy files, one station at a time
+    as the inversions finish. Otherwise they are kept in memory.
+
+    For lateral_weight > 0, n_lateral further sweeps over all stations
+    couple neighbouring stations: the reference model of each station is
+    blended with the inverse-distance weighted average of the models of
+    its n_neighbours closest stations from the previous sweep, and the
+    inversion restarts from the previous model of the station.
+
+    Returns the recovered models and data misfits.
+    """
+    nStation, nC = stations.nStation, mesh.nC
+    m0 = np.ones((nStation, 1)) * np.atleast_2d(m0)
+    mref = m0.copy() if mref is None else (
+        np.ones((nStation, 1)) * np.atleast_2d(mref)
+    )
+
+    if filename is not None:
+        models = np.lib.format.open_memmap(
+            filename, mode='w+', dtype=float, shape=(nStation, nC)
+        )
+        phi_d = np.lib.format.open_memmap(
+            os.path.splitext(filename)[0] + '_phi_d.npy', mode='w+',
+            dtype=float, shape=(nStation,)
+        )
+    else:
+        models = np.empty((nStation, nC))
+        phi_d = np.empty(nStation)
+
+    # the workers only need what is common to all the stations
+    initargs = (
+        stations.frequency, stations.component, stations.rxType, mesh.hx,
+        mesh.x0, engine, kwargs, verbose
+    )
+    if n_processes == 1:
+        pool = None
+        _initStationWorker(*initargs)
+    else:
+        pool = multiprocessing.Pool(
+            n_processes, initializer=_initStationWorker, initargs=initargs
+        )
+
+    if lateral_weight > 0. and n_lateral > 0:
+        neighbours, weights = stations.neighbours(
+            n_neighbours=n_neighbours, max_distance=max_distance
+        )
+
+    try:
+        mstart, mref_sweep = m0, mref
+        for sweep in range(1 + (n_lateral if lateral_weight > 0. else 0)):
+            if sweep > 0:
+                # neighbour average of the previous sweep, the padding row
+                # catches missing neighbours (zero weight)
+                mprev = np.vstack([models, np.zeros(nC)])
+                mlateral = np.einsum('ik,ikj->ij', weights, mprev[neighbours])
+                found = weights.sum(axis=1, keepdims=True)
+                mref_sweep = (
+                    (1. - lateral_weight*found) * mref +
+                    lateral_weight*found*mlateral
+                )
+                mstart = np.array(models)
+
+            tasks = (
+                (
+                    i, stations.dobs[i], stations.uncert[i], mstart[i],
+                    mref_sweep[i]
+                ) for i in range(nStation)
+            )
+            if pool is None:
+                results = (_invertStation(task) for task in tasks)
+            else:
+                results = pool.imap_unordered(_invertStation, tasks)
+
+            for i, model, phi_d_i in results:
+                models[i] = model
+                phi_d[i] = phi_d_i
+                if filename is not None:
+                    models.flush()
+                    phi_d.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return models, phi_d
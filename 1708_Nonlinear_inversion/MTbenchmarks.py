@@ -0,0 +1,418 @@
+"""
+Timing benchmarks for the 1D MT forward and inverse machinery.
+
+Run all of them with
+
+    python MTbenchmarks.py
+"""
+import contextlib
+import multiprocessing
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from SimPEG import Maps
+
+from MT1D import (
+    MT1DProblem, MT1DAnalyticProblem, MT1DSurvey, MT1DSrc, ZxyRx, AppResPhaRx
+)
+from MTforward import simulateMT, simulateMTModels
+
+
+def setupMT1D(
+    frequency=np.logspace(-3, 2, 25), max_depth_core=15000.,
+    core_meshType="log", problemType=MT1DProblem, **kwargs
+):
+    """
+    Survey, mesh and problem for the 5 layer model used in
+    3_MT1D_5layer_inversion.ipynb. Returns (survey, prob, m) with m the
+    log-conductivity model.
+    """
+    rx = ZxyRx(np.r_[0.], component="both", frequency=frequency)
+    survey = MT1DSurvey([MT1DSrc([rx])])
+    mesh = survey.setMesh(
+        sigma=0.01, max_depth_core=max_depth_core, ncell_per_skind=10,
+        n_skind=2, core_meshType=core_meshType, max_hz_core=1000.,
+        verbose=False
+    )
+    prob = problemType(mesh, sigmaMap=Maps.ExpMap(mesh), **kwargs)
+    prob.pair(survey)
+
+    layer_tops = np.r_[0., -600., -1991., -5786., -9786.]
+    rho_layers = np.r_[250., 25, 100., 10., 25.]
+    rho = np.ones(mesh.nC) * rho_layers[0]
+    for layer_top, rho_layer in zip(layer_tops, rho_layers):
+        rho[mesh.vectorCCx < layer_top] = rho_layer
+    return survey, prob, np.log(1./rho)
+
+
+def timeit_best(func, number=5, repeat=3):
+    """
+    Best time (s) per call of func over repeat runs of number calls
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_setMesh(nFreq=25, core_meshTypes=("log", "linear")):
+    """
+    Time MT1DSurvey.setMesh followed by the set up of an MT1DProblem (the
+    operators it uses), without and with the mesh cache.
+    """
+    frequency = np.logspace(-3, 2, nFreq)
+    rx = ZxyRx(np.r_[0.], component="both", frequency=frequency)
+    survey = MT1DSurvey([MT1DSrc([rx])])
+    print(
+        "{:>8s} {:>6s} {:>14s} {:>14s} {:>8s}".format(
+            "mesh", "nC", "uncached (ms)", "cached (ms)", "speedup"
+        )
+    )
+    for core_meshType in core_meshTypes:
+        times = {}
+        for cache in [False, True]:
+
+            def run():
+                mesh = survey.setMesh(
+                    sigma=0.01, max_depth_core=15000., ncell_per_skind=10,
+                    n_skind=2, core_meshType=core_meshType,
+                    max_hz_core=1000., verbose=False, cache=cache
+                )
+                prob = MT1DProblem(mesh, sigmaMap=Maps.ExpMap(mesh))
+                return (
+                    mesh.cellGrad, mesh.cellGradBC, mesh.faceDiv,
+                    prob.P0, prob.tridiagOrder
+                )
+
+            times[cache] = timeit_best(run, number=20)
+        print(
+            "{:>8s} {:>6d} {:>14.3f} {:>14.3f} {:>8.1f}".format(
+                core_meshType, run()[0].shape[1], times[False]*1e3,
+                times[True]*1e3, times[False] / times[True]
+            )
+        )
+
+
+@contextlib.contextmanager
+def countSparse():
+    """
+    Count the scipy sparse matrices constructed in the block:
+
+        with countSparse() as count:
+            ...
+        count[0]
+    """
+    count = [0]
+    try:
+        # scipy >= 1.8: spmatrix is a mixin, every matrix is an _spbase
+        from scipy.sparse._base import _spbase as base
+    except ImportError:
+        base = sp.spmatrix
+    init = base.__init__
+
+    def countingInit(self, *args, **kwargs):
+        count[0] += 1
+        init(self, *args, **kwargs)
+
+    base.__init__ = countingInit
+    try:
+        yield count
+    finally:
+        base.__init__ = init
+
+
+def bench_receivers(nFreq=25, number=2000):
+    """
+    Per call time, sparse matrices constructed and peak traced memory of the
+    receiver derivatives at one frequency, through the fields and P0
+    (evalDeriv) and through the surface Hy (evalSurfaceDeriv), for Jvec
+    (forward) and Jtvec (adjoint) with a single vector.
+    """
+    frequency = np.logspace(-3, 2, nFreq)
+    survey, prob, m = setupMT1D(frequency=frequency)
+    f = prob.fields(m)
+    P0, i0 = prob.P0, prob.surfaceIndex
+    ifreq, freq = nFreq // 2, frequency[nFreq // 2]
+    f_freq, Hy0 = f[:, ifreq], f[i0:i0+1, ifreq]
+    df_dm_v = np.random.randn(f.shape[0]) + 1j*np.random.randn(f.shape[0])
+
+    print(
+        "{:>12s} {:>8s} {:>8s} {:>10s} {:>10s} {:>8s} {:>12s}".format(
+            "rx", "", "", "path", "time (us)", "sparse", "traced (B)"
+        )
+    )
+    receivers = [
+        (ZxyRx, ["real", "imag", "both"]),
+        (AppResPhaRx, ["appres", "phase", "both"]),
+    ]
+    for rxType, components in receivers:
+        for component in components:
+            rx = rxType(np.r_[0.], component=component, frequency=frequency)
+            v = np.random.randn(2 if component == "both" else 1)
+            runs = [
+                ("forward", "P0", lambda: rx.evalDeriv(
+                    f_freq, freq, P0, df_dm_v=df_dm_v
+                )),
+                ("forward", "surface", lambda: rx.evalSurfaceDeriv(
+                    Hy0, freq, dHy0_dm_v=df_dm_v[i0:i0+1]
+                )),
+                ("adjoint", "P0", lambda: rx.evalDeriv(
+                    f_freq, freq, P0, v=v, adjoint=True
+                )),
+                ("adjoint", "surface", lambda: rx.evalSurfaceDeriv(
+                    Hy0, freq, v=v, adjoint=True
+                )),
+            ]
+            for direction, path, run in runs:
+                elapsed = timeit_best(run, number=number)
+                with countSparse() as count:
+                    run()
+                tracemalloc.start()
+                run()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(
+                    "{:>12s} {:>8s} {:>8s} {:>10s} {:>10.2f} {:>8d} "
+                    "{:>12d}".format(
+                        rxType.__name__, component, direction, path,
+                        elapsed*1e6, count[0], peak
+                    )
+                )
+
+
+def bench_fields(nFreqs=(25, 60), core_meshTypes=("log", "linear")):
+    """
+    Time MT1DProblem.fields, including the factorization, for the sparse
+    per-frequency engine and the batched tridiagonal engine.
+    """
+    print(
+        "{:>8s} {:>6s} {:>6s} {:>12s} {:>12s} {:>8s}".format(
+            "mesh", "nC", "nFreq", "sparse (ms)", "tridiag (ms)", "speedup"
+        )
+    )
+    for core_meshType in core_meshTypes:
+        for nFreq in nFreqs:
+            frequency = np.logspace(-3, 2, nFreq)
+            times = {}
+            for engine in ["sparse", "tridiagonal"]:
+                survey, prob, m = setupMT1D(
+                    frequency=frequency, core_meshType=core_meshType,
+                    engine=engine
+                )
+
+                def run():
+                    # same model every call: clear what a model update would
+                    for name in prob.deleteTheseOnModelUpdate:
+                        setattr(prob, name, None)
+                    return prob.fields(m)
+
+                times[engine] = timeit_best(run)
+            print(
+                "{:>8s} {:>6d} {:>6d} {:>12.2f} {:>12.2f} {:>8.1f}".format(
+                    core_meshType, prob.mesh.nC, nFreq,
+                    times["sparse"]*1e3, times["tridiagonal"]*1e3,
+                    times["sparse"] / times["tridiagonal"]
+                )
+            )
+
+
+def bench_analytic(nFreq=25, core_meshTypes=("log", "linear")):
+    """
+    Time simulateMT and the data, Jvec and Jtvec of a problem for the mesh
+    and the analytic (impedance recursion) engines.
+    """
+    frequency = np.logspace(-3, 2, nFreq)
+    print(
+        "{:>8s} {:>6s} {:>16s} {:>13s} {:>13s} {:>8s}".format(
+            "mesh", "nC", "", "mesh (ms)", "analytic (ms)", "speedup"
+        )
+    )
+    for core_meshType in core_meshTypes:
+        times = {}
+        for problemType in [MT1DProblem, MT1DAnalyticProblem]:
+            survey, prob, m = setupMT1D(
+                frequency=frequency, core_meshType=core_meshType,
+                problemType=problemType
+            )
+            v = np.random.randn(prob.mesh.nC)
+            w = np.random.randn(survey.nD)
+            engine = "mesh" if problemType is MT1DProblem else "analytic"
+
+            def dpred_J():
+                for name in prob.deleteTheseOnModelUpdate:
+                    setattr(prob, name, None)
+                f = prob.fields(m)
+                return survey.dpred(m, f=f), prob.Jvec(m, v, f=f), prob.Jtvec(
+                    m, w, f=f
+                )
+
+            times["simulateMT", engine] = timeit_best(
+                lambda: simulateMT(
+                    prob.mesh, np.exp(m), frequency, engine=engine
+                )
+            )
+            times["dpred+Jvec+Jtvec", engine] = timeit_best(dpred_J)
+        for name in ["simulateMT", "dpred+Jvec+Jtvec"]:
+            print(
+                "{:>8s} {:>6d} {:>16s} {:>13.2f} {:>13.2f} {:>8.1f}".format(
+                    core_meshType, prob.mesh.nC, name,
+                    times[name, "mesh"]*1e3, times[name, "analytic"]*1e3,
+                    times[name, "mesh"] / times[name, "analytic"]
+                )
+            )
+
+
+def bench_models(n_models=2000, nFreq=25, n_processes=None, chunk_size=100):
+    """
+    Throughput, in models per second, of simulateMT called in a loop and of
+    simulateMTModels with one and n_processes processes, for random models
+    on the log mesh of setupMT1D.
+    """
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    frequency = np.logspace(-3, 2, nFreq)
+    survey, prob, m = setupMT1D(frequency=frequency)
+    mesh = prob.mesh
+    sigmas = np.exp(
+        np.random.uniform(np.log(1e-3), np.log(1.), (n_models, mesh.nC))
+    )
+    n_loop = min(n_models, 200)
+
+    print(
+        "{:>8s} {:>28s} {:>14s}".format("engine", "", "models / s")
+    )
+    for engine in ["mesh", "analytic"]:
+        runs = [
+            (
+                "simulateMT loop",
+                n_loop,
+                lambda: [
+                    simulateMT(mesh, sigma, frequency, engine=engine)
+                    for sigma in sigmas[:n_loop]
+                ]
+            )
+        ]
+        for nproc in sorted(set([1, n_processes])):
+            runs.append((
+                "simulateMTModels, {} proc".format(nproc),
+                n_models,
+                lambda nproc=nproc: simulateMTModels(
+                    mesh, sigmas, frequency, engine=engine,
+                    chunk_size=chunk_size, n_processes=nproc
+                )
+            ))
+        for name, n, run in runs:
+            tic = time.time()
+            run()
+            print(
+                "{:>8s} {:>28s} {:>14.0f}".format(
+                    engine, name, n / (time.time() - tic)
+                )
+            )
+
+
+def factorBytes(prob):
+    """
+    Memory held by the factorizations in prob.Ainv and prob.ATinv. The
+    SimPEG Solver does not expose its factors, so for the sparse engine the
+    size of an equivalent SuperLU factorization is counted.
+    """
+    if prob.engine == "tridiagonal":
+        # ATinv shares the factors of Ainv
+        return sum(Ainv.nbytes for Ainv in prob.Ainv)
+    nbytes = 0
+    for freq in prob.survey.frequency:
+        for A in [prob.getA(freq), prob.getA(freq).T]:
+            lu = splu(A.tocsc())
+            nbytes += (lu.L.nnz + lu.U.nnz) * 16
+    return nbytes
+
+
+def bench_adjoint(nFreq=25, core_meshTypes=("log", "linear"), nJtvec=10):
+    """
+    Time and peak memory of a Jtvec-heavy model update (fields, then nJtvec
+    calls to Jtvec) for the sparse engine, which factorizes A and A^T, and
+    the tridiagonal engine, which reuses the factors of A for A^T.
+    Peak memory is traced by tracemalloc and the factor sizes by
+    factorBytes.
+    """
+    frequency = np.logspace(-3, 2, nFreq)
+    print(
+        "{:>8s} {:>6s} {:>12s} {:>10s} {:>14s} {:>12s}".format(
+            "mesh", "nC", "engine", "time (ms)", "traced (kB)",
+            "factors (kB)"
+        )
+    )
+    for core_meshType in core_meshTypes:
+        for engine in ["sparse", "tridiagonal"]:
+            survey, prob, m = setupMT1D(
+                frequency=frequency, core_meshType=core_meshType,
+                engine=engine
+            )
+            w = np.random.randn(survey.nD)
+
+            def update():
+                for name in prob.deleteTheseOnModelUpdate:
+                    setattr(prob, name, None)
+                f = prob.fields(m)
+                for _ in range(nJtvec):
+                    prob.Jtvec(m, w, f=f)
+
+            elapsed = timeit_best(update, number=1)
+            tracemalloc.start()
+            update()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                "{:>8s} {:>6d} {:>12s} {:>10.2f} {:>14.1f} {:>12.1f}".format(
+                    core_meshType, prob.mesh.nC, engine, elapsed*1e3,
+                    peak/1e3, factorBytes(prob)/1e3
+                )
+            )
+
+
+def bench_jacobian(nFreq=25, core_meshTypes=("log", "linear")):
+    """
+    Time to form the full sensitivity: nC calls to Jvec, one block Jvec on
+    the identity, and getJ. Factorizations are done beforehand.
+    """
+    frequency = np.logspace(-3, 2, nFreq)
+    print(
+        "{:>8s} {:>6s} {:>14s} {:>14s} {:>12s}".format(
+            "mesh", "nC", "nC Jvec (ms)", "block (ms)", "getJ (ms)"
+        )
+    )
+    for core_meshType in core_meshTypes:
+        survey, prob, m = setupMT1D(
+            frequency=frequency, core_meshType=core_meshType
+        )
+        f = prob.fields(m)
+        eye = np.eye(prob.mesh.nC)
+
+        def getJ():
+            prob._Jmatrix = None
+            return prob.getJ(m, f=f)
+
+        times = [
+            timeit_best(
+                lambda: [prob.Jvec(m, v, f=f) for v in eye], number=1
+            ),
+            timeit_best(lambda: prob.Jvec(m, eye, f=f), number=1),
+            timeit_best(getJ, number=1),
+        ]
+        print(
+            "{:>8s} {:>6d} {:>14.2f} {:>14.2f} {:>12.2f}".format(
+                core_meshType, prob.mesh.nC, *[t*1e3 for t in times]
+            )
+        )
+
+
+if __name__ == '__main__':
+    bench_setMesh()
+    bench_receivers()
+    bench_fields()
+    bench_analytic()
+    bench_models()
+    bench_adjoint()
+    bench_jacobian()
@@ -1,14 +1,115 @@
+import multiprocessing
+import weakref
+
 import numpy as np
 import scipy.sparse as sp
 from scipy.constants import mu_0
+from scipy.linalg import lapack
 from SimPEG import Utils, Solver
 
 
-def simulateMT(mesh, sigma, frequency, rtype="app_res"):
+_dirichletMeshes = weakref.WeakSet()
+
+
+def setDirichletBC(mesh):
+    """
+       Dirichlet boundary conditions at both ends of a 1D mesh. Setting them
+       discards the cell gradient of the mesh, so this is done once per mesh
+       and meshes shared between problems keep their operators.
+    """
+    if mesh not in _dirichletMeshes:
+        mesh.setCellGradBC([['dirichlet', 'dirichlet']])
+        _dirichletMeshes.add(mesh)
+
+
+def layeredImpedance(sigma, thickness, frequency, mu=mu_0, deriv=False):
+    """
+       Surface impedance Zxy of a layered earth by impedance recursion,
+       from the half-space up to the surface, for all frequencies at once.
+
+       sigma: layer conductivities (S/m) from the surface down, the last one
+              being the half-space. Leading dimensions are broadcast, so
+              sigma can be a (n_models, n_layers) array of models.
+       thickness: thicknesses (m) of the n_layers-1 layers above the
+                  half-space
+       frequency: frequencies (Hz)
+       mu: magnetic permeability (H/m), a scalar or one value per layer
+
+       Returns Zxy with shape sigma.shape[:-1] + (nFreq,). For deriv=True
+       it also returns dZxy/dsigma with shape
+       sigma.shape[:-1] + (nFreq, n_layers).
+    """
+    sigma = np.asarray(sigma, dtype=float)[..., np.newaxis, :]
+    thickness = np.asarray(thickness, dtype=float)
+    omega = 2*np.pi*np.atleast_1d(frequency)[:, np.newaxis]
+    nLayer = sigma.shape[-1]
+    if thickness.size != nLayer - 1:
+        raise Exception(
+            "{} layer thicknesses are needed for {} conductivities".format(
+                nLayer - 1, nLayer
+            )
+        )
+
+    # wavenumber and intrinsic impedance of each layer
+    k = np.sqrt(1j*omega*mu*sigma)
+    eta = 1j*omega*mu / k
+
+    # half-space
+    Z = eta[..., -1]
+    if deriv:
+        dZ_dZbelow = np.ones(sigma.shape[:-2] + (omega.size, nLayer), complex)
+        dZ_dsig = np.empty_like(dZ_dZbelow)
+        dZ_dsig[..., -1] = -eta[..., -1] / (2*sigma[..., -1])
+
+    for j in range(nLayer-2, -1, -1):
+        # tanh(k h), written with a decaying exponential so it cannot overflow
+        e = np.exp(-2*k[..., j]*thickness[j])
+        t = (1 - e) / (1 + e)
+        eta_j = eta[..., j]
+        num = eta_j*(Z + eta_j*t)
+        den = eta_j + Z*t
+        if deriv:
+            dZ_dZbelow[..., j+1] = eta_j**2 * (1 - t**2) / den**2
+            dZ_deta = (Z + 2*eta_j*t)/den - num/den**2
+            dZ_dt = eta_j**2/den - num*Z/den**2
+            dZ_dsig[..., j] = (
+                dZ_deta * (-eta_j) +
+                dZ_dt * thickness[j] * (1 - t**2) * k[..., j]
+            ) / (2*sigma[..., j])
+        Z = num / den
+
+    if deriv:
+        # chain rule from each layer up to the surface
+        dZ_dsig *= np.cumprod(dZ_dZbelow, axis=-1)
+        return Z, dZ_dsig
+    return Z
+
+
+def tridiagonalOrder(nC):
+    """
+       Row and column orderings that make the 1D MT system tridiagonal: the
+       unknowns are interleaved as (Hy_0, Ex_0, Hy_1, ..., Ex_nC-1, Hy_nC)
+       and the equations as (node_0, cell_0, node_1, ..., cell_nC-1, node_nC)
+    """
+    nN = nC + 1
+    rowOrder = np.empty(nC+nN, dtype=int)
+    rowOrder[0::2] = np.arange(nN)
+    rowOrder[1::2] = nN + np.arange(nC)
+    colOrder = np.empty(nC+nN, dtype=int)
+    colOrder[0::2] = nC + np.arange(nN)
+    colOrder[1::2] = np.arange(nC)
+    return rowOrder, colOrder
+
+
+def simulateMT(mesh, sigma, frequency, rtype="app_res", engine="mesh"):
     """
        Compute apparent resistivity and phase at each frequency.
        Return apparent resistivity and phase for rtype="app_res",
        or impedance for rtype="impedance"
+
+       engine="mesh" solves the discretized system on the mesh, while
+       engine="analytic" treats every cell as a layer (the deepest one as a
+       half-space) and uses the impedance recursion in layeredImpedance.
     """
 
     # Angular frequency (rad/s)
@@ -21,8 +122,16 @@ def simulateMT(mesh, sigma, frequency, rtype="app_res"):
     elif type(frequency) is list:
         frequency = np.array(frequency)
 
+    if engine == "analytic":
+        Zxy = layeredImpedance(sigma[::-1], mesh.hx[::-1][:-1], frequency)
+        return _impedanceToData(Zxy, frequency, rtype)
+    elif engine != "mesh":
+        raise Exception(
+            "engine must be 'mesh' or 'analytic', not {}".format(engine)
+        )
+
     # Grad
-    mesh.setCellGradBC([['dirichlet', 'dirichlet']]) # Setup boundary conditions
+    setDirichletBC(mesh)  # Setup boundary conditions
     Grad = mesh.cellGrad # Gradient matrix
 
     # MfMu
@@ -66,13 +175,167 @@ def simulateMT(mesh, sigma, frequency, rtype="app_res"):
     # turn it into an array
     Zxy = np.array(Zxy)
 
+    return _impedanceToData(Zxy, frequency, rtype)
+
+
+def _impedanceToData(Zxy, frequency, rtype):
+    """
+       Impedance for rtype="impedance", apparent resistivity and phase for
+       rtype="app_res"
+    """
+    omega = 2*np.pi*frequency
+
     if rtype.lower() == "impedance":
         return Zxy
 
     elif rtype.lower() == "app_res":
-        app_res = abs(Zxy)**2 / (mu_0*omega(frequency))
+        app_res = abs(Zxy)**2 / (mu_0*omega)
         app_phase = np.rad2deg(np.arctan(Zxy.imag / Zxy.real))
         return app_res, app_phase
 
     else:
         raise Exception("rtype must be 'impedance' or 'app_res', not {}".format(rtype.lower()))
+
+
+def _meshOperators(mesh, frequency):
+    """
+       Everything the mesh engine of simulateMTModels needs that does not
+       depend on the model: the tridiagonal pattern of A and the RHS
+    """
+    setDirichletBC(mesh)
+    nC, nN = mesh.nC, mesh.nN
+    rowOrder, colOrder = tridiagonalOrder(nC)
+    # sigma and 1j*omega*mu only enter the diagonal (odd and even entries)
+    A0 = sp.vstack([
+        sp.hstack([mesh.cellGrad, Utils.spzeros(nN, nN)]),
+        sp.hstack([Utils.spzeros(nC, nC), mesh.faceDiv])
+    ]).tocsr()[rowOrder, :][:, colOrder]
+    B = mesh.cellGradBC
+    rhs = np.r_[-B*np.r_[0., 1.], np.zeros(nC)]
+    return {
+        "engine": "mesh",
+        "omega": 2*np.pi*frequency,
+        "dl": A0.diagonal(-1), "d": A0.diagonal(), "du": A0.diagonal(1),
+        "dMu": mesh.aveCC2F * (mu_0*np.ones(nC)),
+        "rhs": rhs[rowOrder],
+    }
+
+
+def _analyticOperators(mesh, frequency):
+    """
+       Everything the analytic engine of simulateMTModels needs that does
+       not depend on the model
+    """
+    return {
+        "engine": "analytic",
+        "frequency": frequency,
+        "thickness": mesh.hx[::-1][:-1],
+    }
+
+
+def _chunkImpedance(operators, sigmas):
+    """
+       Surface impedance (nModels x nFreq) of a chunk of models
+    """
+    if operators["engine"] == "analytic":
+        return layeredImpedance(
+            sigmas[:, ::-1], operators["thickness"], operators["frequency"]
+        )
+
+    omega = operators["omega"]
+    nModel, nFreq, n = sigmas.shape[0], omega.size, operators["d"].size
+
+    d = np.empty((nModel, nFreq, n), dtype=complex)
+    d[:] = operators["d"]
+    d[:, :, 0::2] += 1j*omega[:, None]*operators["dMu"]
+    d[:, :, 1::2] += sigmas[:, None, :]
+
+    # One block-diagonal tridiagonal system for all models and frequencies:
+    # the zero couplings between blocks keep the solves independent
+    dl = np.zeros((nModel, nFreq, n), dtype=complex)
+    dl[:, :, :-1] = operators["dl"]
+    du = np.zeros((nModel, nFreq, n), dtype=complex)
+    du[:, :, :-1] = operators["du"]
+    rhs = np.empty((nModel, nFreq, n), dtype=complex)
+    rhs[:] = operators["rhs"]
+
+    _, _, _, sol, info = lapack.zgtsv(
+        dl.ravel()[:-1], d.ravel(), du.ravel()[:-1], rhs.reshape(-1, 1),
+        overwrite_dl=True, overwrite_d=True, overwrite_du=True,
+        overwrite_b=True
+    )
+    if info > 0:
+        raise Exception("A is singular for one of the models")
+
+    # Hy at the surface is the last unknown of each block
+    return - 1./sol.reshape(nModel, nFreq, n)[:, :, -1]
+
+
+_poolOperators = None
+
+
+def _initPool(operators):
+    global _poolOperators
+    _poolOperators = operators
+
+
+def _poolChunkImpedance(sigmas):
+    return _chunkImpedance(_poolOperators, sigmas)
+
+
+def simulateMTModels(
+    mesh, sigmas, frequency, rtype="app_res", engine="mesh",
+    chunk_size=100, n_processes=1
+):
+    """
+       Compute apparent resistivity and phase, or impedance, at each
+       frequency for many conductivity models at once, as simulateMT does
+       for one.
+
+       sigmas: (n_models, nC) array of conductivity models
+       engine: "mesh" (discretized system) or "analytic" (layeredImpedance)
+       chunk_size: number of models solved together, which bounds the
+                   memory used by each process
+       n_processes: number of worker processes, 1 to run serially
+
+       Returns arrays of shape (n_models, nFreq).
+    """
+    frequency = np.atleast_1d(np.asarray(frequency, dtype=float))
+    sigmas = np.atleast_2d(sigmas)
+    if sigmas.shape[1] != mesh.nC:
+        raise Exception(
+            "sigmas must be (n_models, {}), not {}".format(
+                mesh.nC, sigmas.shape
+            )
+        )
+
+    if engine == "mesh":
+        operators = _meshOperators(mesh, frequency)
+    elif engine == "analytic":
+        operators = _analyticOperators(mesh, frequency)
+    else:
+        raise Exception(
+            "engine must be 'mesh' or 'analytic', not {}".format(engine)
+        )
+
+    starts = range(0, sigmas.shape[0], chunk_size)
+    chunks = (sigmas[i:i+chunk_size] for i in starts)
+    Zxy = np.empty((sigmas.shape[0], frequency.size), dtype=complex)
+
+    if n_processes == 1:
+        results = (_chunkImpedance(operators, chunk) for chunk in chunks)
+        for i, Zchunk in zip(starts, results):
+            Zxy[i:i+chunk_size] = Zchunk
+    else:
+        pool = multiprocessing.Pool(
+            n_processes, initializer=_initPool, initargs=(operators,)
+        )
+        try:
+            results = pool.imap(_poolChunkImpedance, chunks)
+            for i, Zchunk in zip(starts, results):
+                Zxy[i:i+chunk_size] = Zchunk
+        finally:
+            pool.close()
+            pool.join()
+
+    return _impedanceToData(Zxy, frequency, rtype)
@@ -0,0 +1,232 @@
+"""
+Timing benchmarks for colored_inversion.py, on inline 362 of F3 and on
+cubes made of copies of it.
+
+Run all of them with
+
+    python ci_benchmarks.py
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import lasio
+import numpy as np
+import pandas as pd
+from scipy import optimize
+from scipy.interpolate import interp1d
+
+from colored_inversion import error, design_operator, apply_operator
+from well_spectra import find_wells, multiwell_operator
+from opendtect import load_export, as_cube
+from wells import find_well_files, load_wells
+from horizons import horizon_bounds
+
+
+def load_inline(fname='data/export_inline362.ascii'):
+    """
+    The seismic panel of the notebook, time along the first axis
+    """
+    data_read = np.loadtxt(fname)
+    return data_read[:, 2:].T
+
+
+def notebook_operator(panel_seis,
+                      las='data/All_wells_RawData/Lasfiles/F02-1_logs.las',
+                      td='data/All_wells_RawData/DT_model/F02-1_TD.txt'):
+    """
+    The operator of the notebook, from the F02-1 log spectrum and the mean
+    of the traces around the well
+    """
+    well = lasio.read(las, encoding='utf-8')
+    TD = np.loadtxt(td)
+    time_log = interp1d(TD[:, 1], TD[:, 0], kind='linear')(well['DEPTH'])
+    n_log = well['AI'].size
+    freq_log = np.arange(n_log - 1) / (n_log / (1 / np.diff(time_log/1000)))
+    freq_log = freq_log[:n_log // 2]
+    spec_log = (np.fft.fft(well['AI']) / n_log)[:n_log // 2]
+    args = freq_log[1:2000], np.abs(spec_log[1:2000])
+    qout, success = optimize.leastsq(error, [1e5, -0.8], args=args,
+                                     maxfev=3000)
+    trace = np.mean(panel_seis[50:250, 26:46], axis=1)
+    return design_operator(qout, trace, 0.004)
+
+
+def bench_apply(ninlines=50, n_processes=None, chunk_size=1024):
+    """
+    Throughput, in traces per second, of np.apply_along_axis with
+    np.convolve as in the notebook and of apply_operator, on a cube of
+    ninlines copies of inline 362. Also reports the largest difference
+    between the two, relative to the largest amplitude.
+    """
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    panel_seis = load_inline()
+    operator = notebook_operator(panel_seis)
+    cube = np.repeat(panel_seis[:, np.newaxis, :], ninlines, axis=1)
+    ntraces = ninlines * panel_seis.shape[1]
+
+    def convolve(t):
+        return np.convolve(t, operator, mode='same')
+
+    start = time.time()
+    reference = np.apply_along_axis(convolve, axis=0, arr=cube)
+    elapsed = time.time() - start
+    print("{:>30s} {:>14s} {:>14s}".format("", "traces / s", "difference"))
+    print("{:>30s} {:>14.0f} {:>14s}".format("apply_along_axis",
+                                             ntraces/elapsed, ""))
+    scale = np.abs(reference).max()
+    for nproc in sorted(set([1, n_processes])):
+        start = time.time()
+        ci = apply_operator(cube, operator, n_processes=nproc,
+                            chunk_size=chunk_size)
+        elapsed = time.time() - start
+        print("{:>30s} {:>14.0f} {:>14.1e}".format(
+            "apply_operator, {} proc".format(nproc), ntraces/elapsed,
+            np.abs(ci - reference).max()/scale))
+
+
+def bench_multiwell(locations={'F02-1': 36}):
+    """
+    Time to estimate the operator from all the wells, with the log spectra
+    calculated from the LAS files and read from the cache. Also reports the
+    power law fitted to all the wells against the F02-1 fit of the
+    notebook.
+    """
+    panel_seis = load_inline()
+    wells = find_wells()
+    cache_dir = tempfile.mkdtemp()
+    try:
+        print("{:>30s} {:>14s} {:>20s}".format("", "time (s)", "power law"))
+        for name, subset, directory in [
+                ("F02-1", {'F02-1': wells['F02-1']}, None),
+                ("all wells, empty cache", wells, cache_dir),
+                ("all wells, cached", wells, cache_dir)]:
+            start = time.time()
+            operator, qout = multiwell_operator(
+                panel_seis, 0.004, locations, wells=subset,
+                cache_dir=directory)
+            print("{:>30s} {:>14.3f} {:>10.3g} f^{:<8.3f}".format(
+                name, time.time() - start, qout[0], qout[1]))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def bench_export(ninlines=20, fname='data/export_inline362.ascii'):
+    """
+    Time to load an OpendTect export of ninlines copies of inline 362 with
+    np.loadtxt, as in the notebook, and with load_export when the binary
+    cache is made and when it is used.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        export = os.path.join(tmpdir, 'export.ascii')
+        cache = os.path.join(tmpdir, 'cache')
+        with open(fname) as fid:
+            lines = fid.read().splitlines()
+        with open(export, 'w') as fid:
+            for inline in range(ninlines):
+                for line in lines:
+                    fid.write(str(inline) + line[line.index('\t'):] + '\n')
+        print("{:>30s} {:>14s} {:>14s}".format("", "time (s)", "traces / s"))
+        ntraces = ninlines*len(lines)
+        runs = [
+            ("np.loadtxt", lambda: np.loadtxt(export)[:, 2:].T),
+            ("load_export, new cache", lambda: load_export(export, cache)),
+            ("load_export, cached", lambda: load_export(export, cache)),
+            ("load_export, cached, as cube",
+             lambda: as_cube(*load_export(export, cache))),
+        ]
+        for name, run in runs:
+            start = time.time()
+            run()
+            elapsed = time.time() - start
+            print("{:>30s} {:>14.3f} {:>14.0f}".format(name, elapsed,
+                                                       ntraces/elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_wells(copies=5, n_processes=None):
+    """
+    Time to load copies of the four wells of All_wells_RawData into one
+    table: one LAS file at a time with a concat after each, as in the
+    notebook, and with load_wells over processes and from its cache.
+    """
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    files = find_well_files()
+    wells = {'{}_{}'.format(well, i): paths
+             for well, paths in files.items() for i in range(copies)}
+
+    def notebook():
+        Logs = pd.DataFrame()
+        for well, paths in sorted(wells.items()):
+            las = lasio.read(paths[0], encoding='utf-8')
+            temp = pd.DataFrame({curve.mnemonic: curve.data
+                                 for curve in las.curves})
+            temp.insert(0, 'ID', well)
+            Logs = pd.concat([Logs, temp], axis=0)
+        return Logs
+
+    cache_dir = tempfile.mkdtemp()
+    runs = [("LAS loop, concat per well", notebook)]
+    for nproc in sorted(set([1, n_processes])):
+        runs.append(("load_wells, {} proc".format(nproc),
+                     lambda nproc=nproc: load_wells(wells=wells,
+                                                    n_processes=nproc)))
+    runs.extend([
+        ("load_wells, empty cache",
+         lambda: load_wells(wells=wells, cache_dir=cache_dir)),
+        ("load_wells, cached",
+         lambda: load_wells(wells=wells, cache_dir=cache_dir)),
+    ])
+    try:
+        print("{:>30s} {:>14s} {:>14s}".format("", "time (s)", "wells / s"))
+        for name, run in runs:
+            start = time.time()
+            run()
+            elapsed = time.time() - start
+            print("{:>30s} {:>14.3f} {:>14.1f}".format(
+                name, elapsed, len(wells)/elapsed))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def bench_horizons(ninlines=50, fname='data/Ai_inline362_horizons.dat'):
+    """
+    Time to find the top and base horizons of a cube of ninlines copies of
+    the clipped impedance of inline 362, with the list comprehensions of
+    the notebook and with horizon_bounds.
+    """
+    panel_IP = np.loadtxt(fname)[:, 2:].T
+    time_IP = np.arange(408, 1137, 4)
+    cube = np.repeat(panel_IP[:, np.newaxis, :], ninlines, axis=1)
+    columns = cube.reshape((cube.shape[0], -1))
+
+    def notebook():
+        top = [time_IP[np.where(columns[:, col] < 1e30)[0][0]-1]
+               for col in range(columns.shape[1])]
+        bot = [time_IP[np.where(columns[:, col] < 1e30)[0][-1]+1]
+               for col in range(columns.shape[1])]
+        return top, bot
+
+    print("{:>30s} {:>14s} {:>14s}".format("", "time (s)", "traces / s"))
+    for name, run in [("np.where per trace", notebook),
+                      ("horizon_bounds",
+                       lambda: horizon_bounds(cube, time_IP))]:
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        print("{:>30s} {:>14.3f} {:>14.0f}".format(name, elapsed,
+                                                   columns.shape[1]/elapsed))
+
+
+if __name__ == '__main__':
+    bench_apply()
+    bench_multiwell()
+    bench_export()
+    bench_wells()
+    bench_horizons()
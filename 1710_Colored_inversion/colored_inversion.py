@@ -0,0 +1,244 @@
+"""
+Colored inversion of whole seismic sections and cubes.
+
+The operator is designed once, as in Colored_inversion_notebook.ipynb: the
+difference between the modelled log spectrum and the seismic spectrum is
+taken to the time domain, shifted to the centre of the window and rotated by
+90 degrees. Instead of convolving it with one trace at a time with
+np.apply_along_axis, apply_operator convolves blocks of traces at once in
+the frequency domain, optionally over several processes.
+"""
+import multiprocessing
+
+import numpy as np
+import scipy.fft
+from scipy.interpolate import interp1d
+
+
+def linearize(p, x):
+    return p[0] * x**p[1]
+
+
+def error(p, x, y):
+    return (np.log10(y) - np.log10(linearize(p, x)))
+
+
+def seismic_spectrum(trace, dt, smoothing=10):
+    """
+    One sided amplitude spectrum of a trace, smoothed over *smoothing*
+    frequencies.
+
+    Parameters
+    ----------
+
+    trace : 1D array
+        E.g. the mean of the traces around a well.
+    dt : float
+        The sampling interval, in seconds.
+    smoothing : int
+        The length of the running mean over the spectrum.
+
+    Returns
+    -------
+
+    freq : 1D array
+        The frequencies, in Hz.
+    spec : 1D array
+        The complex spectrum, normalized by the number of samples.
+
+    """
+    n_seis = len(trace)
+    freq = np.arange(n_seis) / (n_seis * dt)
+    freq = freq[:n_seis // 2]
+    spec = np.fft.fft(trace) / n_seis
+    spec = spec[:n_seis // 2]
+    roll_win = np.ones(smoothing) / smoothing
+    return freq, np.convolve(spec, roll_win, mode='same')
+
+
+def modelled_log_spectrum(qout, freq, fmin=5, fmax=115, taper_out=10,
+                          ntaper=50):
+    """
+    The power law fitted to the log spectrum between fmin and fmax, with
+    Hanning tapers from 0 Hz to fmin and from fmax to fmax + taper_out,
+    sampled at the frequencies *freq* (0 outside the tapers).
+
+    Parameters
+    ----------
+
+    qout : tuple
+        The parameters of the power law, see linearize.
+    freq : 1D array
+        The frequencies of the seismic spectrum.
+    fmin, fmax : float
+        The band where the power law is used.
+    taper_out : float
+        The length of the high cut taper, in Hz.
+    ntaper : int
+        The number of points in each taper.
+
+    Returns
+    -------
+
+    spec : 1D array
+        The modelled log spectrum at each frequency.
+
+    """
+    x_tape_in = np.linspace(0, fmin, ntaper)
+    x_tape_out = np.linspace(fmax, fmax + taper_out, ntaper)
+    y_tape_in = np.hanning(2*ntaper)[:ntaper] * linearize(qout, fmin)
+    y_tape_out = np.hanning(2*ntaper)[ntaper:] * linearize(qout, fmax)
+    id_seis = (freq > fmin) * (freq < fmax)
+    new_freq_log = np.hstack([x_tape_in, freq[id_seis], x_tape_out])
+    new_spec_log = np.hstack([y_tape_in, linearize(qout, freq[id_seis]),
+                              y_tape_out])
+    f_log = interp1d(new_freq_log, new_spec_log, bounds_error=False,
+                     fill_value=0)
+    return f_log(freq)
+
+
+def operator_from_spectra(spec_log, spec_seis):
+    """
+    The colored inversion operator: the inverse Fourier transform of the
+    difference spectrum, shifted to the centre of the window and rotated
+    by 90 degrees (its quadrature part).
+    """
+    gap = spec_log - spec_seis
+    operator = np.fft.ifft(np.abs(gap))
+    operator = np.fft.fftshift(operator)
+    return operator.imag
+
+
+def design_operator(qout, trace, dt, fmin=5, fmax=115, taper_out=10,
+                    ntaper=50, scale=100, smoothing=10):
+    """
+    Colored inversion operator for a power law fitted to the log spectrum
+    and a seismic trace representative of the data.
+
+    Parameters
+    ----------
+
+    qout : tuple
+        The parameters of the power law fitted to the log spectrum.
+    trace : 1D array
+        The seismic trace whose spectrum is matched to the log spectrum.
+    dt : float
+        The sampling interval of the seismic, in seconds.
+    fmin, fmax, taper_out, ntaper
+        As in modelled_log_spectrum.
+    scale : float
+        The seismic spectrum is multiplied by this to compare it to the log
+        spectrum, since the power spectra are relative.
+    smoothing : int
+        As in seismic_spectrum.
+
+    Returns
+    -------
+
+    operator : 1D array
+        The operator, half as long as the trace.
+
+    """
+    freq_seis, spec_seis = seismic_spectrum(trace, dt, smoothing)
+    spec_log = modelled_log_spectrum(qout, freq_seis, fmin, fmax, taper_out,
+                                     ntaper)
+    return operator_from_spectra(spec_log, spec_seis * scale)
+
+
+def apply_operator(seismic, operator, axis=0, n_processes=1, chunk_size=1024,
+                   out=None):
+    """
+    Convolve every trace of a section or cube with the operator.
+
+    The result is that of ``np.convolve(trace, operator, mode='same')`` on
+    each trace, to rounding, but blocks of traces are convolved at once by
+    multiplying their spectra with the spectrum of the operator. Blocks are
+    read from *seismic* one at a time, so it can be memory-mapped.
+
+    Parameters
+    ----------
+
+    seismic : array
+        The traces, e.g. ``(nsamples, nxlines)`` as panel_seis in the
+        notebook or ``(nsamples, ninlines, nxlines)``.
+    operator : 1D array
+        The colored inversion operator.
+    axis : int
+        The time axis of *seismic*.
+    n_processes : int
+        Split the blocks over this many processes.
+    chunk_size : int or tuple
+        The number of traces in a block along each of the other axes (e.g.
+        inlines and crosslines). An int is the number along the last of
+        them, with one trace along the others (one inline at a time). Blocks
+        of about a thousand traces make good use of the cache.
+    out : array
+        Write the result here (e.g. to a memory-mapped array) instead of a
+        new array.
+
+    Returns
+    -------
+
+    ci : array
+        The relative impedance, with the same shape as *seismic* except the
+        time axis, which is as long as the longest of the traces and the
+        operator.
+
+    """
+    operator = np.asarray(operator, dtype=float)
+    traces = np.moveaxis(seismic, axis, 0)
+    nsamples = traces.shape[0]
+    nout = max(nsamples, operator.size)
+    nfull = nsamples + operator.size - 1
+    nfft = scipy.fft.next_fast_len(nfull, real=True)
+    # The 'same' part of the full convolution, as np.convolve takes it
+    start = (nfull - nout) // 2
+    setup = (scipy.fft.rfft(operator, nfft), nfft, start, nout)
+
+    shape = traces.shape[1:]
+    if out is None:
+        out = np.moveaxis(np.empty((nout,) + shape), 0, axis)
+    ci = np.moveaxis(out, axis, 0)
+    if np.ndim(chunk_size) == 0:
+        chunk_size = (1,) * (len(shape) - 1) + (chunk_size,)
+    nblocks = [-(-n // size) for n, size in zip(shape, chunk_size)]
+    blocks = [tuple(slice(i*size, (i + 1)*size)
+                    for i, size in zip(index, chunk_size))
+              for index in np.ndindex(*nblocks)]
+    tasks = (np.asarray(traces[(slice(None),) + block]) for block in blocks)
+    if n_processes == 1 or len(blocks) == 1:
+        _init_ci_worker(setup)
+        for block, task in zip(blocks, tasks):
+            ci[(slice(None),) + block] = _ci_chunk(task)
+    else:
+        pool = multiprocessing.Pool(n_processes, initializer=_init_ci_worker,
+                                    initargs=(setup,))
+        try:
+            for block, result in zip(blocks, pool.imap(_ci_chunk, tasks)):
+                ci[(slice(None),) + block] = result
+        finally:
+            pool.close()
+            pool.join()
+    return out
+
+
+_ci_setup = None
+
+
+def _init_ci_worker(setup):
+    """
+    Keep the spectrum of the operator in each process
+    """
+    global _ci_setup
+    _ci_setup = setup
+
+
+def _ci_chunk(traces):
+    """
+    Convolve a block of traces, time along the first axis, with the operator
+    """
+    spectrum, nfft, start, nout = _ci_setup
+    # The transforms are faster along contiguous samples
+    traces = np.ascontiguousarray(np.moveaxis(traces, 0, -1))
+    full = scipy.fft.irfft(scipy.fft.rfft(traces, nfft)*spectrum, nfft)
+    return np.moveaxis(full[..., start:start + nout], -1, 0)
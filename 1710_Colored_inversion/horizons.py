@@ -0,0 +1,99 @@
+"""
+The interval between two horizons in a volume clipped to them, as the
+impedance of Ai_inline362_horizons.dat, which is 1e30 above the top and
+below the base horizon.
+
+horizon_bounds finds the top and base of every trace and the mask of
+samples inside the interval (the opposite of id_nan in the notebook) in a
+single pass over the volume, instead of two np.where per trace.
+window_interval uses them to cut the colored inversion result to the
+same interval.
+"""
+import numpy as np
+
+
+def horizon_bounds(volume, time_volume, null=1e30, chunk_size=256):
+    """
+    Top and base horizons of a clipped volume.
+
+    As in the notebook, the top is the time of the sample before the first
+    valid one and the base the time of the sample after the last valid
+    one (limited to the first and last times of the volume).
+
+    Parameters
+    ----------
+
+    volume : array
+        The clipped volume, time along the first axis, e.g. panel_IP of
+        the notebook or a memory-mapped cube from opendtect.load_export.
+    time_volume : 1D array
+        The time of each sample, e.g. time_IP.
+    null : float
+        Samples equal to or larger than this, or NaN, are outside the
+        interval.
+    chunk_size : int
+        The number of traces (along the second axis, e.g. inlines of a
+        cube) read at once.
+
+    Returns
+    -------
+
+    top, base : arrays
+        The horizon times, with the shape of a time slice of the volume.
+        NaN for traces without valid samples.
+    valid : bool array
+        Which samples of the volume are inside the interval. Flattened,
+        its opposite is id_nan of the notebook.
+
+    """
+    time_volume = np.asarray(time_volume)
+    nsamples = volume.shape[0]
+    valid = np.empty(volume.shape, dtype=bool)
+    first = np.empty(volume.shape[1:], dtype=int)
+    last = np.empty(volume.shape[1:], dtype=int)
+    for start in range(0, volume.shape[1], chunk_size):
+        block = (slice(None), slice(start, start + chunk_size))
+        chunk = valid[block]
+        np.less(volume[block], null, out=chunk)
+        first[block[1:]] = chunk.argmax(axis=0)
+        last[block[1:]] = nsamples - 1 - chunk[::-1].argmax(axis=0)
+    empty = ~valid.any(axis=0)
+    top = time_volume[np.maximum(first - 1, 0)].astype(float)
+    base = time_volume[np.minimum(last + 1, nsamples - 1)].astype(float)
+    top[empty] = np.nan
+    base[empty] = np.nan
+    return top, base, valid
+
+
+def window_interval(result, time_result, time_volume, valid):
+    """
+    Cut a result, e.g. the relative impedance of colored inversion, to the
+    times of the clipped volume and to the interval between its horizons.
+
+    Parameters
+    ----------
+
+    result : array
+        Time along the first axis, with the same traces as the volume.
+    time_result : 1D array
+        The time of each sample of the result, e.g. time of the seismic.
+    time_volume : 1D array
+        The time of each sample of the volume, e.g. time_IP, which must be
+        among those of the result.
+    valid : bool array
+        The samples inside the interval, from horizon_bounds.
+
+    Returns
+    -------
+
+    interval : array
+        The result at the times of the volume, shaped like it, with NaN
+        outside the interval.
+
+    """
+    time_result = np.asarray(time_result)
+    idx = (time_result >= np.min(time_volume)) & \
+        (time_result <= np.max(time_volume))
+    interval = np.array(result[idx], dtype=float)
+    interval[~valid] = np.nan
+    return interval
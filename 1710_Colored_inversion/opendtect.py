@@ -0,0 +1,146 @@
+"""
+Binary cache for the ASCII exports of OpendTect.
+
+Each line of an export holds the inline and crossline numbers of a trace
+followed by its samples, with 1e30 for undefined values (e.g. outside the
+horizons of Ai_inline362_horizons.dat). Parsing the text takes most of the
+time of loading a cube, so load_export converts it once to .npy files in
+a cache directory (by default under the user cache, out of the working
+tree) and memory-maps them afterwards. The cache is made again when the
+export changes.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+def load_export(fname, cache_dir=None, null=1e30, chunk_size=10000):
+    """
+    Load an OpendTect ASCII export, through its binary cache.
+
+    The traces are returned time first, like panel_seis and panel_IP in
+    the notebook, as a view of a read-only memory map: nothing is read
+    until they are used.
+
+    Parameters
+    ----------
+
+    fname : str
+        The export, e.g. 'data/export_inline362.ascii'.
+    cache_dir : str
+        The directory of the cache. Defaults to a directory of the
+        export under $XDG_CACHE_HOME/opendtect (or ~/.cache/opendtect).
+    null : float or None
+        The value of undefined samples, replaced by NaN.
+    chunk_size : int
+        The number of lines parsed at once when making the cache.
+
+    Returns
+    -------
+
+    traces : array
+        Shape ``(nsamples, ntraces)``.
+    inlines, xlines : 1D arrays
+        The inline and crossline number of each trace.
+
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(fname)
+    stat = os.stat(fname)
+    source = {'size': stat.st_size, 'mtime': stat.st_mtime, 'null': null}
+    info = os.path.join(cache_dir, 'source.json')
+    try:
+        with open(info) as fid:
+            cached = json.load(fid)
+    except (IOError, ValueError):
+        cached = None
+    if cached != source:
+        _convert(fname, cache_dir, source, null, chunk_size)
+    traces = np.load(os.path.join(cache_dir, 'traces.npy'), mmap_mode='r')
+    coordinates = np.load(os.path.join(cache_dir, 'coordinates.npy'))
+    return traces.T, coordinates[:, 0], coordinates[:, 1]
+
+
+def default_cache_dir(fname):
+    """
+    The cache directory of an export in the user cache, named after the
+    file and a hash of its absolute path.
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    path = os.path.abspath(fname)
+    key = hashlib.sha1(path.encode()).hexdigest()[:12]
+    return os.path.join(root, 'opendtect',
+                        os.path.basename(path) + '-' + key)
+
+
+def _convert(fname, cache_dir, source, null, chunk_size):
+    """
+    Write the .npy files of the cache a chunk of lines at a time
+    """
+    with open(fname, 'rb') as fid:
+        ncolumns = len(fid.readline().split())
+        fid.seek(0)
+        nlines = sum(block.count(b'\n')
+                     for block in iter(lambda: fid.read(1 << 20), b''))
+        fid.seek(-1, os.SEEK_END)
+        if fid.read(1) != b'\n':
+            nlines += 1
+    # Write to a new directory and swap it in, so that an interrupted
+    # conversion never leaves a cache that looks valid
+    tmp_dir = cache_dir + '.tmp'
+    if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    traces = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, 'traces.npy'), mode='w+', dtype=float,
+        shape=(nlines, ncolumns - 2))
+    coordinates = np.empty((nlines, 2), dtype=int)
+    start = 0
+    reader = pd.read_csv(fname, sep=r'\s+', header=None, dtype=float,
+                         chunksize=chunk_size)
+    for chunk in reader:
+        values = chunk.values
+        stop = start + values.shape[0]
+        coordinates[start:stop] = values[:, :2]
+        samples = values[:, 2:]
+        if null is not None:
+            samples[samples == null] = np.nan
+        traces[start:stop] = samples
+        start = stop
+    traces.flush()
+    del traces
+    np.save(os.path.join(tmp_dir, 'coordinates.npy'), coordinates)
+    with open(os.path.join(tmp_dir, 'source.json'), 'w') as fid:
+        json.dump(source, fid)
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+
+
+def as_cube(traces, inlines, xlines):
+    """
+    View traces sorted by inline then crossline, covering a full grid, as
+    a cube ``(nsamples, ninlines, nxlines)`` without copying them.
+
+    Returns
+    -------
+
+    cube : array
+        The traces on the grid.
+    inlines, xlines : 1D arrays
+        The inline and crossline numbers of the grid.
+
+    """
+    il = np.unique(inlines)
+    xl = np.unique(xlines)
+    if (il.size*xl.size != inlines.size or
+            np.any(inlines != np.repeat(il, xl.size)) or
+            np.any(xlines != np.tile(xl, il.size))):
+        raise ValueError("The traces are not a full grid sorted by inline "
+                         "and crossline")
+    return traces.reshape((traces.shape[0], il.size, xl.size)), il, xl
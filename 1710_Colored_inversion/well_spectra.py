@@ -0,0 +1,250 @@
+"""
+Colored inversion operator estimated from all the wells of a survey.
+
+The notebook fits the power law to the spectrum of the F02-1 impedance log
+only, and takes the seismic spectrum from traces picked by hand next to
+the well. Here the spectra of the logs of every well are calculated (and
+cached, since reading LAS files is the slow part), the power law is fitted
+to all of them at once, and the seismic spectrum comes from the traces
+around each well.
+"""
+import os
+
+import numpy as np
+from scipy import optimize
+
+from colored_inversion import error, design_operator
+from wells import find_well_files, read_well, _source_stamp
+
+
+def find_wells(directory='data/All_wells_RawData'):
+    """
+    The LAS file and DT_model time-depth table of each well in an OpendTect
+    export (see wells.find_well_files). Wells without a table are skipped.
+
+    Returns
+    -------
+
+    wells : dict
+        ``{well: (las_file, td_file)}``.
+
+    """
+    return {well: (las, td_file)
+            for well, (las, td_file, checkshot_file)
+            in find_well_files(directory).items() if td_file is not None}
+
+
+def log_spectrum(log, time_log):
+    """
+    One sided amplitude spectrum of a log sampled regularly in depth, as in
+    the notebook: the frequency of each bin uses the local sampling
+    interval in time.
+
+    Parameters
+    ----------
+
+    log : 1D array
+        The log, e.g. impedance, without NaNs.
+    time_log : 1D array
+        The time of each sample, in ms.
+
+    Returns
+    -------
+
+    freq_log : 1D array
+        The frequencies, in Hz.
+    spec_log : 1D array
+        The complex spectrum, normalized by the number of samples.
+
+    """
+    n_log = log.shape[0]
+    k_log = np.arange(n_log - 1)
+    Fs_log = 1 / np.diff(time_log/1000)
+    T_log = n_log / Fs_log
+    freq_log = k_log / T_log
+    freq_log = freq_log[:n_log // 2]
+    spec_log = np.fft.fft(log) / n_log
+    spec_log = spec_log[:n_log // 2]
+    return freq_log, spec_log
+
+
+def _read_log(las, td_file, curve):
+    """
+    A curve of a LAS file and its time from the TD table, where both are
+    defined
+    """
+    logs = read_well(las, td_file)
+    keep = logs[curve].notnull() & logs.TIME.notnull()
+    return logs[curve].values[keep], logs.TIME.values[keep]
+
+
+def well_spectra(wells, curve='AI', cache_dir=None):
+    """
+    Spectra of a log of many wells, calculated with log_spectrum.
+
+    Parameters
+    ----------
+
+    wells : dict
+        ``{well: (las_file, td_file)}``, as given by find_wells.
+    curve : str
+        The mnemonic of the log.
+    cache_dir : str
+        Keep the spectrum of each well in a .npz file in this directory.
+        It is used instead of reading the LAS file again as long as the LAS
+        file and the time-depth table don't change.
+
+    Returns
+    -------
+
+    spectra : dict
+        ``{well: (freq_log, spec_log)}``.
+
+    """
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    spectra = {}
+    for well, sources in sorted(wells.items()):
+        stamp = _source_stamp(sources)
+        cache = None
+        if cache_dir is not None:
+            cache = os.path.join(cache_dir,
+                                 '{}_{}_spectrum.npz'.format(well, curve))
+            if os.path.exists(cache):
+                with np.load(cache) as cached:
+                    if np.array_equal(cached['stamp'], stamp):
+                        spectra[well] = (cached['freq'], cached['spec'])
+                        continue
+        log, time_log = _read_log(sources[0], sources[1], curve)
+        spectra[well] = log_spectrum(log, time_log)
+        if cache is not None:
+            np.savez(cache, freq=spectra[well][0], spec=spectra[well][1],
+                     stamp=stamp)
+    return spectra
+
+
+def fit_spectra(spectra, p0=(1e5, -0.8), nfit=2000, maxfev=3000):
+    """
+    Fit the power law of linearize to the spectra of many wells at once.
+
+    Parameters
+    ----------
+
+    spectra : dict
+        ``{well: (freq_log, spec_log)}``, as given by well_spectra.
+    p0 : tuple
+        The starting parameters.
+    nfit : int
+        Fit the frequencies 1 to nfit - 1 of each spectrum (skipping 0 Hz),
+        as the notebook does for F02-1.
+    maxfev : int
+        The largest number of calls of the error function.
+
+    Returns
+    -------
+
+    qout : array
+        The parameters of the power law.
+
+    """
+    freq = np.concatenate([f[1:nfit] for f, s in spectra.values()])
+    spec = np.concatenate([np.abs(s[1:nfit]) for f, s in spectra.values()])
+    qout, success = optimize.leastsq(error, p0, args=(freq, spec),
+                                     maxfev=maxfev)
+    return qout
+
+
+def well_traces(seismic, locations, window=(50, 250), radius=10):
+    """
+    The mean of the seismic traces around the wells.
+
+    Parameters
+    ----------
+
+    seismic : array
+        The traces, time along the first axis, e.g. ``(nsamples, nxlines)``
+        or ``(nsamples, ninlines, nxlines)``. Can be memory-mapped.
+    locations : dict
+        ``{well: index}`` with the index of the trace at each well, an int
+        (the column of a section) or a tuple (inline and crossline numbers
+        in a cube). Wells outside the seismic are left out.
+    window : tuple
+        The first and last + 1 sample of the time window.
+    radius : int
+        Traces from index - radius to index + radius - 1 along each axis are
+        used, e.g. the columns 26:46 of the notebook for F02-1 at 36.
+
+    Returns
+    -------
+
+    trace : 1D array
+        The mean trace in the time window.
+
+    """
+    stack = 0
+    count = 0
+    for well, index in sorted(locations.items()):
+        index = np.atleast_1d(index)
+        block = (slice(*window),) + tuple(
+            slice(max(i - radius, 0), max(min(i + radius, n), 0))
+            for i, n in zip(index, seismic.shape[1:]))
+        traces = np.asarray(seismic[block], dtype=float)
+        if traces.size == 0:
+            continue
+        traces = traces.reshape((traces.shape[0], -1))
+        stack = stack + traces.sum(axis=1)
+        count += traces.shape[1]
+    if count == 0:
+        raise ValueError("None of the wells are inside the seismic")
+    return stack / count
+
+
+def multiwell_operator(seismic, dt, locations, wells=None, curve='AI',
+                       window=(50, 250), radius=10, cache_dir=None,
+                       nfit=2000, **kwargs):
+    """
+    Colored inversion operator from the logs of all the wells and the
+    seismic traces around them.
+
+    The spectra of the logs are fitted jointly (fit_spectra) and the
+    seismic spectrum is that of the mean of the traces around the wells
+    (well_traces). With F02-1 only, at column 36 of inline 362, the operator
+    is that of the notebook.
+
+    Parameters
+    ----------
+
+    seismic : array
+        The traces, time along the first axis.
+    dt : float
+        The sampling interval of the seismic, in seconds.
+    locations : dict
+        ``{well: index}``, see well_traces.
+    wells : dict
+        ``{well: (las_file, td_file)}``. Defaults to find_wells().
+    curve : str
+        The mnemonic of the impedance log.
+    window, radius
+        As in well_traces.
+    cache_dir : str
+        Cache the log spectra here, see well_spectra.
+    nfit : int
+        As in fit_spectra.
+    **kwargs
+        Passed on to colored_inversion.design_operator (fmin, fmax, etc).
+
+    Returns
+    -------
+
+    operator : 1D array
+        The colored inversion operator.
+    qout : array
+        The parameters of the power law fitted to the log spectra.
+
+    """
+    if wells is None:
+        wells = find_wells()
+    spectra = well_spectra(wells, curve, cache_dir)
+    qout = fit_spectra(spectra, nfit=nfit)
+    trace = well_traces(seismic, locations, window, radius)
+    return design_operator(qout, trace, dt, **kwargs), qout
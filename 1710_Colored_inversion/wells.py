@@ -0,0 +1,179 @@
+"""
+Loading the logs of many wells into a single table.
+
+Each LAS file is read into a DataFrame with an ID column, as in the LAS
+loading cell of the notebook, and the two-way time of every sample is
+added from the DT_model time-depth table and from the checkshots of the
+well. Wells are parsed in parallel, joined with a single concat, and
+cached column by column in .npz files so that they are only parsed again
+when their files change.
+"""
+import glob
+import multiprocessing
+import os
+
+import lasio
+import numpy as np
+import pandas as pd
+
+
+def find_well_files(directory='data/All_wells_RawData'):
+    """
+    The LAS file, DT_model table and checkshots of each well in an
+    OpendTect export, named by the first 5 characters of the LAS file.
+    Missing tables are None.
+
+    Returns
+    -------
+
+    wells : dict
+        ``{well: (las_file, td_file, checkshot_file)}``.
+
+    """
+    wells = {}
+    for las in sorted(glob.glob(os.path.join(directory, 'Lasfiles', '*.las'))):
+        well = os.path.basename(las)[:5]
+        tables = [os.path.join(directory, folder, well + '_TD.txt')
+                  for folder in ['DT_model', 'Checkshot']]
+        wells[well] = tuple([las] + [table if os.path.exists(table) else None
+                                     for table in tables])
+    return wells
+
+
+def read_well(las, td_file=None, checkshot_file=None, well=None):
+    """
+    The logs of a well, with their two-way times.
+
+    Parameters
+    ----------
+
+    las : str
+        The LAS file.
+    td_file : str
+        The DT_model table: time (ms) and depth (m) on each line.
+    checkshot_file : str
+        The checkshots: depth (m) and time (s) on each line.
+    well : str
+        The ID of the well. Defaults to the first 5 characters of the name
+        of the LAS file.
+
+    Returns
+    -------
+
+    logs : pandas.DataFrame
+        ID, the curves of the LAS file (NaN where null) and, where the
+        tables are given, TIME from DT_model and TIME_CHECKSHOT from the
+        checkshots, in ms. Times are NaN outside the depths of the tables.
+
+    """
+    if well is None:
+        well = os.path.basename(las)[:5]
+    data = lasio.read(las, encoding='utf-8')
+    columns = {'ID': np.full(data.data.shape[0], well)}
+    for curve in data.curves:
+        columns[curve.mnemonic] = curve.data
+    depth = data.curves[0].data
+    if td_file is not None:
+        TD = np.loadtxt(td_file)
+        columns['TIME'] = _interpolate(depth, TD[:, 1], TD[:, 0])
+    if checkshot_file is not None:
+        checkshots = np.loadtxt(checkshot_file)
+        columns['TIME_CHECKSHOT'] = _interpolate(
+            depth, checkshots[:, 0], 1000*checkshots[:, 1])
+    return pd.DataFrame(columns)
+
+
+def _interpolate(x, xp, fp):
+    """
+    Linear interpolation, NaN outside xp
+    """
+    order = np.argsort(xp, kind='stable')
+    return np.interp(x, xp[order], fp[order], left=np.nan, right=np.nan)
+
+
+def _source_stamp(fnames):
+    """
+    Size and modification time of files (zeros if None), to tell if a cache
+    is outdated
+    """
+    return np.array([[os.path.getsize(f), os.path.getmtime(f)]
+                     if f is not None else [0, 0] for f in fnames])
+
+
+def _read_well(task):
+    """
+    read_well for a process pool
+    """
+    well, files = task
+    return read_well(*files, well=well)
+
+
+def load_wells(directory='data/All_wells_RawData', wells=None,
+               cache_dir=None, n_processes=1):
+    """
+    The logs of many wells in a single table.
+
+    Parameters
+    ----------
+
+    directory : str
+        Where to look for the wells with find_well_files.
+    wells : dict
+        ``{well: (las_file, td_file, checkshot_file)}`` instead of looking
+        for them.
+    cache_dir : str
+        Keep the table of each well in a .npz file in this directory. It is
+        used instead of reading the LAS file again as long as none of the
+        files of the well change.
+    n_processes : int
+        Parse the LAS files over this many processes.
+
+    Returns
+    -------
+
+    logs : pandas.DataFrame
+        The tables of read_well, one after the other.
+
+    """
+    if wells is None:
+        wells = find_well_files(directory)
+    if cache_dir is not None and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    frames = {}
+    tasks = []
+    for well, files in sorted(wells.items()):
+        if cache_dir is not None:
+            cache = os.path.join(cache_dir, '{}_logs.npz'.format(well))
+            if os.path.exists(cache):
+                with np.load(cache) as cached:
+                    if np.array_equal(cached['stamp'],
+                                      _source_stamp(files)):
+                        frames[well] = pd.DataFrame(
+                            {column: cached['column_{}'.format(i)]
+                             for i, column in enumerate(cached['columns'])})
+                        continue
+        tasks.append((well, files))
+    if n_processes == 1 or len(tasks) <= 1:
+        parsed = [_read_well(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(n_processes)
+        try:
+            parsed = pool.map(_read_well, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    for (well, files), logs in zip(tasks, parsed):
+        frames[well] = logs
+        if cache_dir is not None:
+            # Strings rather than objects, which np.load won't read
+            # without pickle
+            columns = {'column_{}'.format(i): logs[column].values.astype(
+                           str if logs[column].dtype == object else None)
+                       for i, column in enumerate(logs.columns)}
+            np.savez(os.path.join(cache_dir, '{}_logs.npz'.format(well)),
+                     columns=np.array(logs.columns, dtype=str),
+                     stamp=_source_stamp(files), **columns)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat([frames[well] for well in sorted(frames)],
+                     ignore_index=True)